@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+"""
+Import throughput benchmark
+Generates synthetic lead CSVs and runs preview + import through the CSV import
+service and the ai-agents /ai/csv/import endpoint, recording rows/sec, peak RSS
+and per-stage timings as JSON
+
+    python benchmark.py --rows 10000 100000 1000000
+    python benchmark.py --service csv-service ai-agents \\
+        --database-url postgresql://localhost/bench --setup-schema
+    python benchmark.py --engine c pyarrow --file vendor.csv --mappings mappings.json
+
+Without --database-url the CSV service writes through a stubbed Supabase
+client (PostgREST loader); with it, through COPY into a scratch
+``lead_benchmark`` schema. The ai-agents service always needs Postgres.
+Each run happens in a fresh subprocess so peak RSS is per run. --file runs
+real vendor files instead of generated ones; their columns are mapped by
+name unless --mappings gives the import modal's column mappings.
+"""
+
+import argparse
+import asyncio
+import csv
+import importlib
+import inspect
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+SERVICE_DIRS = {
+    'csv-service': Path(__file__).resolve().parent,
+    'ai-agents': Path(__file__).resolve().parents[2] / 'archive' / 'infrastructure' / 'deployment' / 'ai-agents',
+}
+# Schema shared by both services, such as the import_jobs checkpoint table
+SHARED_MIGRATIONS = Path(__file__).resolve().parents[2] / 'supabase' / 'migrations'
+
+# Scratch schema the benchmark may create and truncate freely
+BENCH_SCHEMA = 'lead_benchmark'
+BENCH_PIPELINE_ID = 'bench-pipeline'
+
+# Functions timed in each service's main module; anything else counts as "other"
+STAGES = {
+    'csv-service': {
+        'parse': 'iter_upload_chunks',
+        'map': 'map_chunk',
+        'insert': 'batch_insert_leads',
+    },
+    'ai-agents': {
+        'upload': 'save_upload',
+        # Parsing and mapping run together in a worker process
+        'parse_map': 'csv_pool.run',
+        'insert': 'batch_insert_leads',
+    },
+}
+
+HEADER = [
+    'first_name', 'last_name', 'email', 'phone_number', 'address', 'city', 'state', 'zip_code',
+    'premium', 'auto_premium', 'sr22', 'military',
+    'driver_2_first_name', 'driver_2_last_name', 'driver_2_date_of_birth', 'driver_2_sr22',
+    'driver_3_first_name', 'driver_3_last_name', 'driver_3_date_of_birth', 'driver_3_sr22',
+    'notes',
+]
+
+FIRST_NAMES = ['James', 'Maria', 'Robert', 'Linda', 'José', 'Aisha', 'Wei', 'Olga', 'Liam', 'Zoë']
+LAST_NAMES = ['Smith', 'Garcia', 'Johnson', 'Nguyen', 'Müller', 'Brown', "O'Neil", 'Kowalski']
+CITIES = [('Minneapolis', 'MN'), ('St. Paul', 'MN'), ('Madison', 'WI'), ('Des Moines', 'IA')]
+DIRTY_CURRENCY = ['N/A', '12.5.3', '-', 'call for quote', '']
+
+SCHEMA_SQL = {
+    'csv-service': f"""
+        CREATE TABLE IF NOT EXISTS pipeline_statuses (
+            id text PRIMARY KEY,
+            pipeline_id text NOT NULL,
+            display_order integer NOT NULL
+        );
+        INSERT INTO pipeline_statuses (id, pipeline_id, display_order)
+        VALUES ('bench-status', '{BENCH_PIPELINE_ID}', 1)
+        ON CONFLICT (id) DO NOTHING;
+        CREATE TABLE IF NOT EXISTS insurance_types (
+            id text PRIMARY KEY,
+            name text NOT NULL
+        );
+        INSERT INTO insurance_types (id, name) VALUES ('bench-auto', 'Auto')
+        ON CONFLICT (id) DO NOTHING;
+        CREATE TABLE IF NOT EXISTS leads_ins_info (
+            id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+            pipeline_id text NOT NULL,
+            status_id text,
+            insurance_type_id text,
+            source text,
+            import_file_name text,
+            first_name text,
+            last_name text,
+            email text,
+            phone_number text,
+            address text,
+            city text,
+            state text,
+            zip_code text,
+            premium numeric,
+            auto_premium numeric,
+            sr22 boolean,
+            military boolean,
+            notes text,
+            additional_insureds jsonb,
+            import_key text,
+            created_at timestamptz DEFAULT now()
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_leads_ins_info_import_key
+            ON leads_ins_info (pipeline_id, import_key);
+        TRUNCATE leads_ins_info;
+    """,
+    'ai-agents': f"""
+        CREATE TABLE IF NOT EXISTS pipeline_statuses (
+            id text PRIMARY KEY,
+            pipeline_id text NOT NULL,
+            display_order integer NOT NULL
+        );
+        INSERT INTO pipeline_statuses (id, pipeline_id, display_order)
+        VALUES ('bench-status', '{BENCH_PIPELINE_ID}', 1)
+        ON CONFLICT (id) DO NOTHING;
+        CREATE TABLE IF NOT EXISTS leads_contact_info (
+            id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+            pipeline_id text,
+            status_id text,
+            source text,
+            import_file_name text,
+            first_name text,
+            last_name text,
+            email text,
+            phone text,
+            created_at timestamptz DEFAULT now()
+        );
+        TRUNCATE leads_contact_info;
+    """,
+}
+
+
+def _mappings(service: str, headers: List[str] = HEADER) -> List[Dict[str, str]]:
+    """Column mappings as the import modal sends them; columns of ``headers``
+    that are not benchmark fields are skipped"""
+    if service == 'ai-agents':
+        # leads_contact_info only holds contact fields
+        crm_fields = {'first_name': 'first_name', 'last_name': 'last_name', 'email': 'email', 'phone_number': 'phone'}
+    else:
+        crm_fields = {column: column for column in HEADER if column != 'notes'}
+    return [{'csvColumn': column, 'crmField': crm_fields.get(column, 'skip')} for column in headers]
+
+
+def _read_headers(csv_path: Path) -> List[str]:
+    with open(csv_path, newline='', encoding='utf-8', errors='replace') as handle:
+        return next(csv.reader(handle), [])
+
+
+def _money(rng: random.Random) -> str:
+    roll = rng.random()
+    if roll < 0.1:
+        return rng.choice(DIRTY_CURRENCY)
+    amount = rng.uniform(300, 4000)
+    return f"${amount:,.2f}" if roll < 0.6 else f"{amount:.2f}"
+
+
+def _phone(rng: random.Random) -> str:
+    digits = f"612{rng.randrange(10 ** 7):07d}"
+    return rng.choice([
+        digits, f"({digits[:3]}) {digits[3:6]}-{digits[6:]}", f"+1 {digits[:3]}.{digits[3:6]}.{digits[6:]}", ''
+    ])
+
+
+def _driver(rng: random.Random, present: bool) -> List[str]:
+    if not present:
+        return ['', '', '', '']
+    dob = f"{rng.randint(1950, 2006)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+    return [rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), dob, rng.choice(['Yes', 'no', 'TRUE', '0', ''])]
+
+
+def generate_csv(path: Path, rows: int, seed: int = 42):
+    """Write ``rows`` synthetic leads: multi-driver columns, dirty currency
+    values, inconsistent phone formats and ~5% rows missing both names"""
+    rng = random.Random(seed)
+    with open(path, 'w', newline='', encoding='utf-8') as handle:
+        writer = csv.writer(handle)
+        writer.writerow(HEADER)
+        for number in range(rows):
+            nameless = rng.random() < 0.05
+            first = '' if nameless else rng.choice(FIRST_NAMES)
+            last = '' if nameless else rng.choice(LAST_NAMES)
+            city, state = rng.choice(CITIES)
+            has_second = rng.random() < 0.4
+            writer.writerow([
+                first, last,
+                f"{(first or 'lead').lower()}.{number}@example.com" if rng.random() < 0.9 else '',
+                _phone(rng),
+                f"{rng.randint(100, 9999)} Main St", city, state, f"{rng.randint(55000, 55999)}",
+                _money(rng), _money(rng),
+                rng.choice(['Yes', 'No', '']), rng.choice(['true', 'false', '1', '']),
+                *_driver(rng, has_second),
+                *_driver(rng, has_second and rng.random() < 0.4),
+                rng.choice(['', 'Called twice, no answer', 'Prefers "text" contact']),
+            ])
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _timed(function: Callable, stage: str, timings: Dict[str, float]) -> Callable:
+    """Wrap a function, coroutine function or generator function so its
+    running time accumulates under ``stage``"""
+    if inspect.iscoroutinefunction(function):
+        async def timed_coroutine(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                timings[stage] += time.perf_counter() - start
+        return timed_coroutine
+
+    if inspect.isgeneratorfunction(function):
+        def timed_generator(*args, **kwargs):
+            iterator = function(*args, **kwargs)
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    timings[stage] += time.perf_counter() - start
+                yield item
+        return timed_generator
+
+    def timed_function(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            timings[stage] += time.perf_counter() - start
+    return timed_function
+
+
+def _instrument(module, service: str) -> Dict[str, float]:
+    """Patch the stage functions of a service's main module with timers"""
+    timings = {stage: 0.0 for stage in STAGES[service]}
+    for stage, path in STAGES[service].items():
+        owner_path, _, name = path.rpartition('.')
+        owner = module
+        for part in filter(None, owner_path.split('.')):
+            owner = getattr(owner, part)
+        setattr(owner, name, _timed(getattr(owner, name), stage, timings))
+    return timings
+
+
+class _StubQuery:
+    """Chainable stand-in for a supabase-py query builder"""
+
+    def __init__(self, client: '_StubSupabase', table: str):
+        self.client = client
+        self.table = table
+        self.rows: Optional[List[Dict[str, Any]]] = None
+
+    def __getattr__(self, name):
+        # select/eq/order/limit/range and friends just chain
+        return lambda *args, **kwargs: self
+
+    def insert(self, rows, **kwargs):
+        self.rows = rows
+        return self
+
+    upsert = insert
+
+    def execute(self):
+        if self.client.latency:
+            time.sleep(self.client.latency)
+        if self.rows is not None:
+            return _StubResult(self.rows)
+        if self.table == 'pipeline_statuses':
+            return _StubResult([{'id': 'bench-status'}])
+        if self.table == 'insurance_types':
+            return _StubResult([{'id': 'bench-auto'}])
+        return _StubResult([])
+
+
+class _StubResult:
+    def __init__(self, data):
+        self.data = data
+
+
+class _StubSupabase:
+    """Supabase client that accepts every write after ``latency`` seconds"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+
+    def table(self, name: str) -> _StubQuery:
+        return _StubQuery(self, name)
+
+
+async def _run_service(service: str, csv_path: Path, database_url: Optional[str],
+                       stub_latency: float, engine: str,
+                       mappings: Optional[List[Dict[str, str]]]) -> Dict[str, Any]:
+    from fastapi import Response, UploadFile
+
+    sys.path.insert(0, str(SERVICE_DIRS[service]))
+    os.chdir(SERVICE_DIRS[service])
+    os.environ['CSV_PARSER_ENGINE'] = engine
+    if database_url:
+        os.environ['DATABASE_URL'] = database_url
+    else:
+        os.environ.pop('DATABASE_URL', None)
+    # Placeholders so module-level clients can be constructed; no requests are made
+    os.environ.setdefault('NEXT_PUBLIC_SUPABASE_URL', 'http://localhost:54321')
+    os.environ.setdefault('SUPABASE_SERVICE_ROLE_KEY', 'benchmark.stub.key')
+    os.environ.setdefault('DEEPINFRA_API_KEY', 'benchmark')
+
+    main = importlib.import_module('main')
+    if service == 'csv-service':
+        main.supabase = _StubSupabase(stub_latency)
+    timings = _instrument(main, service)
+    baseline_rss = _peak_rss_mb()
+
+    form = {
+        'pipeline_id': BENCH_PIPELINE_ID,
+        'lead_source': 'Benchmark',
+        'import_file_name': csv_path.name,
+        'column_mappings': json.dumps(mappings or _mappings(service, _read_headers(csv_path))),
+    }
+
+    await main.startup_event()
+    try:
+        with open(csv_path, 'rb') as handle:
+            start = time.perf_counter()
+            preview = await main.preview_csv(file=UploadFile(handle, filename=csv_path.name))
+            preview_seconds = time.perf_counter() - start
+
+        # Stage timings cover the import only
+        timings.update(dict.fromkeys(timings, 0.0))
+
+        with open(csv_path, 'rb') as handle:
+            upload = UploadFile(handle, filename=csv_path.name)
+            start = time.perf_counter()
+            if service == 'csv-service':
+                result = await main.import_leads(
+                    response=Response(), file=upload, run_async=False, dedupe=False, on_conflict=None, **form
+                )
+            else:
+                result = await main.import_leads(file=upload, import_id=None, **form)
+            import_seconds = time.perf_counter() - start
+    finally:
+        await main.shutdown_event()
+
+    imported = result.get('imported_count') or 0
+    stages = {stage: round(seconds, 3) for stage, seconds in timings.items()}
+    stages['other'] = round(max(import_seconds - sum(timings.values()), 0.0), 3)
+
+    return {
+        'service': service,
+        'engine': engine,
+        'file': csv_path.name,
+        'file_mb': round(csv_path.stat().st_size / (1024 * 1024), 1),
+        'loader': result.get('loader', 'asyncpg'),
+        'preview_rows': preview.get('total_rows'),
+        'preview_seconds': round(preview_seconds, 3),
+        'import_seconds': round(import_seconds, 3),
+        'rows_imported': imported,
+        'rows_failed': len(result.get('errors') or []),
+        'rows_per_second': round(imported / import_seconds) if import_seconds else None,
+        'baseline_rss_mb': baseline_rss,
+        'peak_rss_mb': _peak_rss_mb(),
+        'stages': stages,
+    }
+
+
+async def _setup_schema(database_url: str, services: List[str]):
+    import asyncpg
+
+    conn = await asyncpg.connect(database_url, server_settings={'search_path': 'public'})
+    try:
+        await conn.execute(f"CREATE SCHEMA IF NOT EXISTS {BENCH_SCHEMA}")
+        await conn.execute(f"SET search_path TO {BENCH_SCHEMA}")
+        for service in services:
+            await conn.execute(SCHEMA_SQL[service])
+        migrations = Path(__file__).resolve().parent / 'migrations'
+        if 'csv-service' in services:
+            # Import keys of plain inserts, as in production
+            await conn.execute((migrations / '004_import_key_trigger.sql').read_text())
+        # Import checkpoints, as in production
+        await conn.execute((SHARED_MIGRATIONS / '20261018000003_import_jobs.sql').read_text())
+        await conn.execute("TRUNCATE import_jobs")
+    finally:
+        await conn.close()
+
+
+def _bench_url(database_url: str) -> str:
+    # asyncpg passes unknown DSN parameters through as server settings
+    separator = '&' if '?' in database_url else '?'
+    return f"{database_url}{separator}search_path={BENCH_SCHEMA}"
+
+
+def _run_child(args: argparse.Namespace, service: str, engine: str, csv_path: Path) -> Dict[str, Any]:
+    command = [
+        sys.executable, str(Path(__file__).resolve()), '--child', service, str(csv_path),
+        '--stub-latency', str(args.stub_latency), '--engine', engine,
+    ]
+    if args.database_url:
+        command += ['--database-url', _bench_url(args.database_url)]
+    if args.mappings:
+        command += ['--mappings', str(args.mappings)]
+
+    completed = subprocess.run(command, capture_output=True, text=True)
+    if completed.returncode != 0:
+        return {'service': service, 'engine': engine, 'file': csv_path.name,
+                'error': completed.stderr.strip().splitlines()[-1:]}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--service', nargs='+', choices=list(SERVICE_DIRS), default=['csv-service'])
+    parser.add_argument('--database-url', help="Postgres for COPY loads / ai-agents (scratch schema used)")
+    parser.add_argument('--setup-schema', action='store_true',
+                        help=f"create and truncate the {BENCH_SCHEMA} tables before each run")
+    parser.add_argument('--stub-latency', type=float, default=0.0,
+                        help="seconds the stubbed Supabase waits per request")
+    parser.add_argument('--engine', nargs='+', choices=['c', 'pyarrow'], default=['c'],
+                        help="CSV parser engines to compare (CSV_PARSER_ENGINE)")
+    parser.add_argument('--file', type=Path, nargs='+', help="benchmark these CSVs instead of generated ones")
+    parser.add_argument('--mappings', type=Path,
+                        help="JSON column mappings as the import modal sends them (default: map by name)")
+    parser.add_argument('--data-dir', type=Path, default=Path('/tmp/lead-import-benchmark'))
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', type=Path, help="write results JSON here as well as stdout")
+    parser.add_argument('--child', nargs=2, metavar=('SERVICE', 'CSV'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        service, csv_path = args.child
+        mappings = json.loads(args.mappings.read_text()) if args.mappings else None
+        result = asyncio.run(_run_service(
+            service, Path(csv_path), args.database_url, args.stub_latency, args.engine[0], mappings
+        ))
+        print(json.dumps(result))
+        return
+
+    if args.file:
+        csv_paths = args.file
+    else:
+        args.data_dir.mkdir(parents=True, exist_ok=True)
+        csv_paths = []
+        for rows in args.rows:
+            csv_path = args.data_dir / f"leads_{rows}_seed{args.seed}.csv"
+            if not csv_path.exists():
+                generate_csv(csv_path, rows, args.seed)
+            csv_paths.append(csv_path)
+
+    results = []
+    for csv_path in csv_paths:
+        for service in args.service:
+            if service == 'ai-agents' and not args.database_url:
+                results.append({'service': service, 'file': csv_path.name, 'error': 'requires --database-url'})
+                continue
+            for engine in args.engine:
+                if args.setup_schema and args.database_url:
+                    asyncio.run(_setup_schema(args.database_url, [service]))
+                result = _run_child(args, service, engine, csv_path)
+                results.append(result)
+                print(json.dumps(result), file=sys.stderr)
+
+    report = json.dumps({'seed': args.seed, 'results': results}, indent=2)
+    if args.output:
+        args.output.write_text(report)
+    print(report)
+
+
+if __name__ == '__main__':
+    main()
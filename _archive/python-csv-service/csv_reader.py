@@ -0,0 +1,502 @@
+"""
+Streaming CSV readers for the import service
+Parses uploads (CSV, gzip, zip of CSVs, xlsx) in bounded chunks so memory stays
+flat regardless of file size
+"""
+
+import codecs
+import contextlib
+import csv
+import gzip
+import io
+import os
+import zipfile
+from dataclasses import dataclass
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from mapping import MappingPlan, compile_mapping_plan
+
+# Rows per parsed chunk; each chunk is mapped and inserted before the next is read
+CSV_CHUNK_SIZE = int(os.getenv("CSV_CHUNK_SIZE", "5000"))
+# Rows returned by /preview-csv
+PREVIEW_ROWS = int(os.getenv("CSV_PREVIEW_ROWS", "5"))
+
+# CSV parser used for imports: "c" (pandas' default) or "pyarrow", which
+# parses blocks on several threads into Arrow-backed string columns
+C_ENGINE = 'c'
+PYARROW_ENGINE = 'pyarrow'
+CSV_ENGINES = (C_ENGINE, PYARROW_ENGINE)
+CSV_PARSER_ENGINE = os.getenv("CSV_PARSER_ENGINE", C_ENGINE)
+# Bytes of decoded CSV per pyarrow parse block; blocks parsed ahead by the
+# worker threads are what the engine adds to peak memory
+PYARROW_BLOCK_SIZE = int(os.getenv("CSV_PYARROW_BLOCK_SIZE", str(1024 * 1024)))
+
+# Prefix inspected to detect the encoding and delimiter
+SNIFF_BYTES = 64 * 1024
+COUNT_BLOCK_SIZE = 1024 * 1024
+DELIMITERS = ',;\t|'
+
+# Upload formats, detected from the leading bytes
+CSV = 'csv'
+GZIP = 'gzip'
+ZIP = 'zip'
+XLSX = 'xlsx'
+
+CSV_MEMBER_SUFFIXES = ('.csv', '.txt', '.tsv')
+
+
+@dataclass
+class CsvFormat:
+    """Encoding and delimiter of an uploaded CSV"""
+    encoding: str = 'utf-8'
+    delimiter: str = ','
+
+
+def detect_encoding(prefix: bytes) -> str:
+    """Pick utf-8 when the prefix is (mostly) UTF-8, else cp1252, else latin-1"""
+    if prefix.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+
+    try:
+        # Incremental decode tolerates a multi-byte character cut off at the end
+        codecs.getincrementaldecoder('utf-8')().decode(prefix, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+
+    # Mostly UTF-8 with a few stray legacy bytes: keep UTF-8 and let the
+    # decode fallback handle the strays
+    decoded = prefix.decode('utf-8', errors='replace')
+    invalid = decoded.count('\ufffd')
+    multibyte = sum(1 for char in decoded if ord(char) > 127) - invalid
+    if multibyte >= invalid:
+        return 'utf-8'
+
+    try:
+        prefix.decode('cp1252')
+        return 'cp1252'
+    except UnicodeDecodeError:
+        return 'latin-1'
+
+
+def _decode_fallback(error: UnicodeDecodeError) -> Tuple[str, int]:
+    """Decode bytes the detected encoding rejects as cp1252, else latin-1
+
+    Vendor files are sometimes stitched together from differently encoded
+    exports, so a stray byte deep in the file must not fail the import.
+    """
+    rejected = error.object[error.start:error.end]
+    try:
+        return rejected.decode('cp1252'), error.end
+    except UnicodeDecodeError:
+        return rejected.decode('latin-1'), error.end
+
+
+codecs.register_error('csv_import_fallback', _decode_fallback)
+
+
+def detect_upload_kind(stream: BinaryIO) -> str:
+    """CSV, GZIP, ZIP or XLSX, from the upload's magic bytes"""
+    stream.seek(0)
+    magic = stream.read(4)
+    stream.seek(0)
+
+    if magic.startswith(b'\x1f\x8b'):
+        return GZIP
+    if magic == b'PK\x03\x04':
+        with zipfile.ZipFile(stream) as archive:
+            is_workbook = 'xl/workbook.xml' in archive.namelist()
+        stream.seek(0)
+        return XLSX if is_workbook else ZIP
+    return CSV
+
+
+def _gzip_size(stream: BinaryIO) -> int:
+    """Uncompressed size from the gzip trailer (modulo 4 GiB)"""
+    stream.seek(-4, io.SEEK_END)
+    size = int.from_bytes(stream.read(4), 'little')
+    stream.seek(0)
+    return size
+
+
+def _zip_csv_members(archive: zipfile.ZipFile) -> List[zipfile.ZipInfo]:
+    members = [
+        info for info in archive.infolist()
+        if not info.is_dir()
+        and not info.filename.startswith('__MACOSX/')
+        and info.filename.lower().endswith(CSV_MEMBER_SUFFIXES)
+    ]
+    if not members:
+        raise ValueError("Zip archive contains no CSV files")
+    return members
+
+
+def iter_csv_sources(stream: BinaryIO, kind: str) -> Iterator[Tuple[Optional[str], BinaryIO, int]]:
+    """Yield (member name, decompressing stream, uncompressed size) per CSV
+
+    Decompression happens as the parser reads; nothing is expanded up front.
+    Plain CSV and gzip uploads have no member name.
+    """
+    if kind == CSV:
+        stream.seek(0, io.SEEK_END)
+        size = stream.tell()
+        stream.seek(0)
+        yield None, stream, size
+    elif kind == GZIP:
+        size = _gzip_size(stream)
+        with gzip.GzipFile(fileobj=stream, mode='rb') as source:
+            yield None, source, size
+    elif kind == ZIP:
+        with zipfile.ZipFile(stream) as archive:
+            for info in _zip_csv_members(archive):
+                with archive.open(info) as source:
+                    yield info.filename, source, info.file_size
+    else:
+        raise ValueError(f"Not a CSV upload: {kind}")
+
+
+def sniff_csv_format(stream: BinaryIO) -> CsvFormat:
+    """Detect encoding and delimiter from the first SNIFF_BYTES of a stream"""
+    stream.seek(0)
+    prefix = stream.read(SNIFF_BYTES)
+    stream.seek(0)
+
+    encoding = detect_encoding(prefix)
+    sample = prefix.decode(encoding, errors='ignore')
+    if len(prefix) == SNIFF_BYTES and '\n' in sample:
+        # Only sniff complete lines
+        sample = sample[:sample.rfind('\n') + 1]
+
+    try:
+        delimiter = csv.Sniffer().sniff(sample, delimiters=DELIMITERS).delimiter
+    except csv.Error:
+        delimiter = ','
+
+    # Guard against the sniffer picking a character the header never uses
+    header = sample.split('\n', 1)[0]
+    if delimiter not in header:
+        delimiter = ','
+
+    return CsvFormat(encoding=encoding, delimiter=delimiter)
+
+
+def count_rows(stream: BinaryIO) -> int:
+    """Count data rows by scanning for newlines, without parsing
+
+    Quoted fields containing line breaks are counted once per line.
+    """
+    stream.seek(0)
+    newlines = 0
+    last_block = b''
+    while True:
+        block = stream.read(COUNT_BLOCK_SIZE)
+        if not block:
+            break
+        newlines += block.count(b'\n')
+        last_block = block
+    stream.seek(0)
+
+    lines = newlines + (1 if last_block and not last_block.endswith(b'\n') else 0)
+    return max(lines - 1, 0)
+
+
+def estimate_rows(stream: BinaryIO, size: int) -> Tuple[int, bool]:
+    """Data rows of a decompressing stream as (rows, estimated)
+
+    Counts newlines in the first COUNT_BLOCK_SIZE bytes and scales by the
+    uncompressed size, so large archives are never fully decompressed.
+    """
+    stream.seek(0)
+    sample = stream.read(COUNT_BLOCK_SIZE)
+    complete = len(sample) < COUNT_BLOCK_SIZE or not stream.read(1)
+    stream.seek(0)
+
+    if complete:
+        lines = sample.count(b'\n') + (1 if sample and not sample.endswith(b'\n') else 0)
+        return max(lines - 1, 0), False
+
+    lines = sample.count(b'\n') * size / len(sample)
+    return max(round(lines) - 1, 0), True
+
+
+def _open_text(stream: BinaryIO, csv_format: CsvFormat) -> io.TextIOWrapper:
+    stream.seek(0)
+    return io.TextIOWrapper(
+        stream, encoding=csv_format.encoding, errors='csv_import_fallback', newline=""
+    )
+
+
+def _preview_rows(df: pd.DataFrame) -> Dict[str, Any]:
+    headers = df.columns.tolist()
+    return {
+        "headers": headers,
+        "preview": df.fillna('').to_dict('records'),
+        "total_columns": len(headers)
+    }
+
+
+def _preview_xlsx(stream: BinaryIO, rows: int) -> Dict[str, Any]:
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        sheet = workbook.active
+        df = next(_iter_sheet_chunks(sheet, rows), pd.DataFrame())
+        # The sheet dimension is written by the exporting application and
+        # may be stale, so the count is only an estimate
+        total_rows = max((sheet.max_row or 1) - 1, 0)
+    finally:
+        workbook.close()
+
+    return {
+        **_preview_rows(df),
+        "total_rows": total_rows,
+        "total_rows_estimated": True,
+        "format": XLSX,
+        "sheet": sheet.title
+    }
+
+
+def preview_upload(stream: BinaryIO, rows: int = PREVIEW_ROWS) -> Dict[str, Any]:
+    """Headers, the first ``rows`` rows and a row count, parsing only the sample
+
+    Zip archives are previewed from their first CSV, with total_rows summed
+    over every CSV inside.
+    """
+    kind = detect_upload_kind(stream)
+    if kind == XLSX:
+        return _preview_xlsx(stream, rows)
+
+    preview = None
+    files = []
+    total_rows = 0
+    estimated = False
+
+    for name, source, size in iter_csv_sources(stream, kind):
+        if name:
+            files.append(name)
+
+        if preview is None:
+            csv_format = sniff_csv_format(source)
+            text = _open_text(source, csv_format)
+            try:
+                df = pd.read_csv(text, sep=csv_format.delimiter, nrows=rows)
+            finally:
+                text.detach()
+            preview = {
+                **_preview_rows(df),
+                "delimiter": csv_format.delimiter,
+                "encoding": csv_format.encoding
+            }
+
+        if kind == CSV:
+            member_rows, member_estimated = count_rows(source), False
+        else:
+            member_rows, member_estimated = estimate_rows(source, size)
+        total_rows += member_rows
+        estimated = estimated or member_estimated
+
+    result = {
+        **preview,
+        "total_rows": total_rows,
+        "total_rows_estimated": estimated,
+        "format": kind
+    }
+    if kind == ZIP:
+        result["files"] = files
+    return result
+
+
+def read_header(stream: BinaryIO, csv_format: CsvFormat) -> List[str]:
+    """Column names as read_csv will report them (duplicates suffixed .1, .2, ...)"""
+    text = _open_text(stream, csv_format)
+    try:
+        return pd.read_csv(text, sep=csv_format.delimiter, nrows=0).columns.tolist()
+    finally:
+        text.detach()
+
+
+class _Utf8Reader(io.RawIOBase):
+    """Binary stream of a decoded text stream, re-encoded as UTF-8
+
+    pyarrow only parses UTF-8; reading through the text stream keeps the
+    sniffed encoding and the byte fallback identical to the C engine.
+    """
+
+    def __init__(self, text: io.TextIOWrapper, chars: int = COUNT_BLOCK_SIZE):
+        self.text = text
+        self.chars = chars
+        self.pending = bytearray()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while len(self.pending) < len(buffer):
+            block = self.text.read(self.chars)
+            if not block:
+                break
+            self.pending += block.encode('utf-8')
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        del self.pending[:size]
+        return size
+
+
+def _iter_arrow_chunks(stream: BinaryIO, chunksize: int, csv_format: CsvFormat,
+                       plan: Optional[MappingPlan]) -> Iterator[pd.DataFrame]:
+    """iter_csv_chunks with the pyarrow parser
+
+    Columns are read as Arrow strings (pandas ArrowDtype), like the C
+    engine with a plan's str dtypes. Header names come from read_header so
+    duplicate columns get the same .1, .2 suffixes. Unlike the C engine,
+    rows with missing trailing fields are a parse error.
+    """
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+
+    columns = read_header(stream, csv_format)
+    wanted = list(plan.usecols) if plan else columns
+    text = _open_text(stream, csv_format)
+    try:
+        reader = pa_csv.open_csv(
+            _Utf8Reader(text),
+            read_options=pa_csv.ReadOptions(column_names=columns, skip_rows=1, block_size=PYARROW_BLOCK_SIZE),
+            parse_options=pa_csv.ParseOptions(delimiter=csv_format.delimiter, newlines_in_values=True),
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=wanted,
+                column_types={column: pa.string() for column in wanted},
+                strings_can_be_null=True
+            )
+        )
+
+        # Parse blocks hold a variable number of rows; re-slice them into chunks
+        start = 0
+        buffered = None
+        for batch in reader:
+            table = pa.Table.from_batches([batch])
+            if buffered is not None:
+                table = pa.concat_tables([buffered, table])
+            while table.num_rows >= chunksize:
+                yield _arrow_frame(table.slice(0, chunksize), start)
+                start += chunksize
+                table = table.slice(chunksize)
+            buffered = table
+        if buffered is not None and buffered.num_rows:
+            yield _arrow_frame(buffered, start)
+    finally:
+        text.detach()
+
+
+def _arrow_frame(table, start: int) -> pd.DataFrame:
+    frame = table.to_pandas(types_mapper=pd.ArrowDtype)
+    # Continue the row numbering across chunks, as the C engine does
+    frame.index = pd.RangeIndex(start, start + len(frame))
+    return frame
+
+
+def iter_csv_chunks(stream: BinaryIO, chunksize: int = CSV_CHUNK_SIZE,
+                    csv_format: Optional[CsvFormat] = None,
+                    plan: Optional[MappingPlan] = None,
+                    engine: str = CSV_PARSER_ENGINE) -> Iterator[pd.DataFrame]:
+    """Yield DataFrames of at most ``chunksize`` rows from a binary CSV stream
+
+    The format is sniffed from the start of the stream unless given. With a
+    mapping plan only its columns are parsed, as text. Row indexes continue
+    across chunks, so ``index + 2`` is still the spreadsheet row number
+    (header is row 1).
+    """
+    if engine not in CSV_ENGINES:
+        raise ValueError(f"Unknown CSV parser engine '{engine}', expected one of {', '.join(CSV_ENGINES)}")
+
+    csv_format = csv_format or sniff_csv_format(stream)
+    if engine == PYARROW_ENGINE:
+        yield from _iter_arrow_chunks(stream, chunksize, csv_format, plan)
+        return
+
+    options = {'usecols': list(plan.usecols), 'dtype': plan.dtypes} if plan else {}
+    text = _open_text(stream, csv_format)
+    try:
+        with pd.read_csv(text, sep=csv_format.delimiter, chunksize=chunksize, **options) as reader:
+            for chunk in reader:
+                yield chunk
+    finally:
+        # Leave the underlying upload open; FastAPI closes it after the request.
+        # A cancelled import may have closed it before this generator is collected
+        with contextlib.suppress(ValueError):
+            text.detach()
+
+
+def _iter_sheet_chunks(sheet, chunksize: int) -> Iterator[pd.DataFrame]:
+    """DataFrames of ``chunksize`` rows from a read-only worksheet, first row as header
+
+    Blank rows are skipped, but the index still follows the sheet so
+    ``index + 2`` is the spreadsheet row number, as for CSV chunks.
+    """
+    rows = sheet.iter_rows(values_only=True)
+    header = next(rows, None)
+    if header is None:
+        return
+
+    columns = [str(value) if value is not None else f"Unnamed: {i}" for i, value in enumerate(header)]
+    width = len(columns)
+    batch, index = [], []
+    for position, row in enumerate(rows):
+        if all(value is None for value in row):
+            continue
+        batch.append(tuple(row[:width]) + (None,) * (width - len(row)))
+        index.append(position)
+        if len(batch) == chunksize:
+            yield pd.DataFrame(batch, columns=columns, index=index, dtype=object)
+            batch, index = [], []
+    if batch:
+        yield pd.DataFrame(batch, columns=columns, index=index, dtype=object)
+
+
+def iter_upload_chunks(stream: BinaryIO, field_mapping: Dict[str, str],
+                       chunksize: int = CSV_CHUNK_SIZE) -> Iterator[Tuple[Optional[str], MappingPlan, pd.DataFrame]]:
+    """Yield (member name, mapping plan, chunk) for every CSV in a CSV, gzip, zip or xlsx upload
+
+    Each file's header is read first and compiled with ``field_mapping``
+    into a (cached) plan, so only mapped columns are parsed. Member names
+    are set for zip archives so row errors can name the file.
+    """
+    kind = detect_upload_kind(stream)
+    if kind == XLSX:
+        workbook = load_workbook(stream, read_only=True, data_only=True)
+        try:
+            plan = None
+            for chunk in _iter_sheet_chunks(workbook.active, chunksize):
+                plan = plan or compile_mapping_plan(field_mapping, chunk.columns.tolist())
+                yield None, plan, chunk
+        finally:
+            workbook.close()
+        return
+
+    for name, source, _ in iter_csv_sources(stream, kind):
+        csv_format = sniff_csv_format(source)
+        plan = compile_mapping_plan(field_mapping, read_header(source, csv_format))
+        for chunk in iter_csv_chunks(source, chunksize, csv_format, plan):
+            yield name, plan, chunk
+
+
+def upload_mapping_plans(stream: BinaryIO, field_mapping: Dict[str, str]) -> List[Tuple[Optional[str], MappingPlan]]:
+    """(member name, mapping plan) for every file of an upload, read from the headers only
+
+    Lets an import be checked against its mapping before any row is parsed.
+    A sheet without data rows has no header to plan from and is left out.
+    """
+    kind = detect_upload_kind(stream)
+    if kind == XLSX:
+        workbook = load_workbook(stream, read_only=True, data_only=True)
+        try:
+            first = next(_iter_sheet_chunks(workbook.active, 1), None)
+        finally:
+            workbook.close()
+        return [] if first is None else [(None, compile_mapping_plan(field_mapping, first.columns.tolist()))]
+
+    plans = []
+    for name, source, _ in iter_csv_sources(stream, kind):
+        plans.append((name, compile_mapping_plan(field_mapping, read_header(source, sniff_csv_format(source)))))
+    return plans
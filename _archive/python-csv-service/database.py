@@ -0,0 +1,179 @@
+# Shared by the csv import and ai-agents services. The source of truth is
+# archive/infrastructure/deployment/shared/; each service keeps a vendored copy
+# refreshed by shared/sync.py, so edit the shared file, not a copy
+"""
+Postgres connection pool
+Env-sized asyncpg pool whose connections prepare the service's hot statements
+when they open, are recycled after a maximum lifetime, and report acquire waits
+and saturation
+"""
+
+import asyncio
+import logging
+import os
+import re
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "5"))
+# Seconds to wait for a free connection before failing the caller
+DB_POOL_ACQUIRE_TIMEOUT = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", "30"))
+# Connections older than this are closed when released, so load balancer and
+# failover changes reach every connection; 0 disables
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))
+# Idle connections above min size are closed after this many seconds
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))
+
+# Statements every connection prepares when it opens
+HOT_STATEMENTS = {
+    'pipeline_default_status': """
+        SELECT id FROM pipeline_statuses
+        WHERE pipeline_id = $1
+        ORDER BY display_order
+        LIMIT 1
+    """,
+    'default_insurance_type': """
+        SELECT id FROM insurance_types WHERE name = 'Auto' LIMIT 1
+    """,
+    'column_exists': """
+        SELECT EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = $1 AND column_name = $2
+        )
+    """,
+}
+
+
+class PooledConnection(asyncpg.Connection):
+    """Pool connection that knows its age and keeps its hot statements prepared
+
+    Hot statements go through asyncpg's statement cache, which keeps them
+    prepared on the server for the life of the connection. PreparedStatement
+    objects cannot be kept instead: asyncpg invalidates them each time the
+    connection is released back to the pool.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.opened_at = time.monotonic()
+
+    async def fetchval_statement(self, name: str, *args) -> Any:
+        """First column of the first row of a hot statement"""
+        return await self.fetchval(HOT_STATEMENTS[name], *args)
+
+
+class DatabasePool:
+    """asyncpg pool with per-connection setup, max lifetime and acquire metrics"""
+
+    def __init__(self, name: str, dsn: str, min_size: int = DB_POOL_MIN_SIZE,
+                 max_size: int = DB_POOL_MAX_SIZE, acquire_timeout: float = DB_POOL_ACQUIRE_TIMEOUT,
+                 max_lifetime: float = DB_POOL_MAX_LIFETIME,
+                 on_acquire: Optional[Callable[[str, float], None]] = None,
+                 on_timeout: Optional[Callable[[str], None]] = None):
+        self.name = name
+        self.dsn = dsn
+        self.min_size = min(min_size, max_size)
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.max_lifetime = max_lifetime
+        self.pool: Optional[asyncpg.Pool] = None
+        # Called with the pool name (and wait seconds) so a service can export
+        # acquire metrics without this module depending on its metrics backend
+        self.on_acquire = on_acquire
+        self.on_timeout = on_timeout
+
+        self.waiting = 0
+        self.acquires = 0
+        self.timeouts = 0
+        self.recycled = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    async def open(self):
+        self.pool = await asyncpg.create_pool(
+            self.dsn,
+            min_size=self.min_size,
+            max_size=self.max_size,
+            max_inactive_connection_lifetime=DB_POOL_MAX_IDLE,
+            connection_class=PooledConnection,
+            init=self._init_connection
+        )
+        logger.info(f"{self.name} database pool opened ({self.min_size}-{self.max_size} connections)")
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    async def _init_connection(self, conn: PooledConnection):
+        for name, query in HOT_STATEMENTS.items():
+            try:
+                # Running it once, with NULL arguments, prepares the statement
+                # into the connection's statement cache
+                await conn.fetchval(query, *[None] * len(set(re.findall(r'\$\d+', query))))
+            except asyncpg.PostgresError as e:
+                # A missing table must not make the whole pool unusable
+                logger.warning(f"Could not prepare {name} statement: {e}")
+
+    @asynccontextmanager
+    async def acquire(self, timeout: Optional[float] = None) -> AsyncIterator[PooledConnection]:
+        """Borrow a connection, recording how long the caller waited for it"""
+        timeout = self.acquire_timeout if timeout is None else timeout
+        start = time.perf_counter()
+        self.waiting += 1
+        try:
+            conn = await self.pool.acquire(timeout=timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            if self.on_timeout:
+                self.on_timeout(self.name)
+            raise asyncio.TimeoutError(
+                f"Timed out after {timeout:g}s waiting for a {self.name} database connection"
+            ) from None
+        finally:
+            self.waiting -= 1
+
+        waited = time.perf_counter() - start
+        self.acquires += 1
+        self.wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        if self.on_acquire:
+            self.on_acquire(self.name, waited)
+
+        try:
+            yield conn
+        finally:
+            if self.max_lifetime and not conn.is_closed() \
+                    and time.monotonic() - conn.opened_at > self.max_lifetime:
+                # Closing detaches the connection; the pool opens a fresh one on demand
+                self.recycled += 1
+                await conn.close()
+            await self.pool.release(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool size, use and acquire wait figures for /health"""
+        if self.pool is None:
+            return {"status": "closed"}
+
+        size = self.pool.get_size()
+        in_use = size - self.pool.get_idle_size()
+        return {
+            "status": "saturated" if in_use >= self.max_size and self.waiting else "ok",
+            "size": size,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "in_use": in_use,
+            "waiting": self.waiting,
+            "saturation": round(in_use / self.max_size, 2),
+            "acquires": self.acquires,
+            "acquire_timeouts": self.timeouts,
+            "avg_acquire_wait_ms": round(self.wait_seconds / self.acquires * 1000, 2) if self.acquires else 0.0,
+            "max_acquire_wait_ms": round(self.max_wait_seconds * 1000, 2),
+            "recycled_connections": self.recycled
+        }
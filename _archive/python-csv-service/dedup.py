@@ -0,0 +1,279 @@
+"""
+Import-time lead deduplication
+Normalized identity keys (email, phone, name + date of birth) hashed to 64 bits,
+held in a Bloom filter in front of a sorted array so millions of keys fit in memory
+"""
+
+import asyncio
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from loaders import LEADS_TABLE
+
+INSERT = 'insert'
+UPDATE = 'update'
+SKIP = 'skip'
+
+KEY_COLUMNS = ['email', 'phone_number', 'first_name', 'last_name', 'date_of_birth']
+
+# SQLSTATE PostgREST reports (as APIError.code) for a column the table lacks
+UNDEFINED_COLUMN = '42703'
+
+# Column holding each lead's natural identity for ON CONFLICT upserts
+# (see migrations/001_add_leads_import_key.sql)
+IMPORT_KEY_COLUMN = 'import_key'
+
+# Distinct 16-byte hash keys keep equal strings of different key types apart
+HASH_KEYS = {
+    'email': 'lead-email-key00',
+    'phone': 'lead-phone-key00',
+    'name_dob': 'lead-namedob-key',
+}
+
+# Rows fetched per round-trip while preloading existing keys
+PRELOAD_BATCH_SIZE = 50000
+BLOOM_ERROR_RATE = 0.01
+
+
+def _normalize_email(column: pd.Series) -> pd.Series:
+    email = column.dropna().astype(str).str.strip().str.lower()
+    return email[email.str.contains('@', regex=False)]
+
+
+def _normalize_phone(column: pd.Series) -> pd.Series:
+    # Compare on the last 10 digits so +1 / formatting differences match
+    digits = column.dropna().astype(str).str.replace(r'\D', '', regex=True)
+    return digits[digits.str.len() >= 7].str[-10:]
+
+
+def _normalize_name_dob(frame: pd.DataFrame) -> pd.Series:
+    dob = frame['date_of_birth'].dropna()
+    if dob.empty:
+        return dob
+    dob = pd.to_datetime(dob.astype(str), errors='coerce', format='mixed').dropna().dt.strftime('%Y-%m-%d')
+
+    names = frame.loc[dob.index, ['first_name', 'last_name']].fillna('').astype(str)
+    first = names['first_name'].str.strip().str.lower()
+    last = names['last_name'].str.strip().str.lower()
+    key = first + '|' + last + '|' + dob
+    return key[(first != '') | (last != '')]
+
+
+def key_hashes(frame: pd.DataFrame) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """Hash each identity key of ``frame``, returning (hashes, present mask) per key"""
+    frame = frame.reindex(columns=KEY_COLUMNS).reset_index(drop=True)
+    keys = {
+        'email': _normalize_email(frame['email']),
+        'phone': _normalize_phone(frame['phone_number']),
+        'name_dob': _normalize_name_dob(frame),
+    }
+
+    hashes = {}
+    for name, values in keys.items():
+        # Normalizers return only the rows that have the key
+        present = frame.index.isin(values.index)
+        hashed = np.zeros(len(frame), dtype=np.uint64)
+        if present.any():
+            hashed[present] = pd.util.hash_array(
+                values.reindex(frame.index[present]).to_numpy(dtype=object), hash_key=HASH_KEYS[name]
+            )
+        hashes[name] = (hashed, present)
+    return hashes
+
+
+def present_key_hashes(frame: pd.DataFrame) -> np.ndarray:
+    """All identity key hashes of ``frame`` as one flat array"""
+    return np.concatenate([hashed[present] for hashed, present in key_hashes(frame).values()])
+
+
+def import_keys(records: List[Dict[str, Any]]) -> List[Optional[str]]:
+    """Natural identity key per record: email, else phone, else name + date of birth"""
+    frame = pd.DataFrame(records, columns=KEY_COLUMNS)
+    keys = pd.Series(None, index=frame.index, dtype=object)
+
+    # Lowest priority first so better keys overwrite
+    for prefix, values in (('n:', _normalize_name_dob(frame)),
+                           ('p:', _normalize_phone(frame['phone_number'])),
+                           ('e:', _normalize_email(frame['email']))):
+        if not values.empty:
+            keys.loc[values.index] = (prefix + values).to_numpy(dtype=object)
+
+    return [key if isinstance(key, str) else None for key in keys.tolist()]
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over precomputed 64-bit hashes"""
+
+    def __init__(self, capacity: int, error_rate: float = BLOOM_ERROR_RATE):
+        capacity = max(capacity, 1)
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+
+    def _positions(self, hashes: np.ndarray) -> np.ndarray:
+        # Double hashing: the k probe positions are h1 + i * h2 (mod size)
+        h1 = hashes & np.uint64(0xFFFFFFFF)
+        h2 = (hashes >> np.uint64(32)) | np.uint64(1)
+        probes = np.arange(self.hash_count, dtype=np.uint64)[:, None]
+        return (h1 + probes * h2) % np.uint64(self.size)
+
+    def add(self, hashes: np.ndarray):
+        positions = self._positions(hashes).ravel()
+        masks = np.left_shift(1, positions & np.uint64(7)).astype(np.uint8)
+        np.bitwise_or.at(self.bits, positions >> np.uint64(3), masks)
+
+    def might_contain(self, hashes: np.ndarray) -> np.ndarray:
+        positions = self._positions(hashes)
+        bits = self.bits[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)
+        return (bits & 1).astype(bool).all(axis=0)
+
+
+class KeySet:
+    """Exact set of 64-bit key hashes, optionally screened by a Bloom filter
+
+    Hashes are kept as disjoint sorted runs. A new run is merged into the
+    previous one while that run is at most twice its size, so there are
+    O(log n) runs and every hash is re-sorted O(log n) times however many
+    chunks are added, instead of the whole set being re-sorted per chunk.
+    """
+
+    def __init__(self, hashes: Optional[np.ndarray] = None, use_bloom: bool = False):
+        self.runs: List[np.ndarray] = []
+        if hashes is not None and len(hashes):
+            self.runs.append(np.unique(hashes))
+        self.bloom = None
+        if use_bloom:
+            self.bloom = BloomFilter(len(self))
+            for run in self.runs:
+                self.bloom.add(run)
+
+    def __len__(self) -> int:
+        return sum(len(run) for run in self.runs)
+
+    def add(self, hashes: np.ndarray):
+        run = np.unique(hashes)
+        run = run[~self.contains(run)]
+        if not len(run):
+            return
+        if self.bloom:
+            self.bloom.add(run)
+
+        while self.runs and len(self.runs[-1]) <= 2 * len(run):
+            # Runs are disjoint, so a sort of the concatenation is their union
+            run = np.sort(np.concatenate((self.runs.pop(), run)))
+        self.runs.append(run)
+
+    def contains(self, hashes: np.ndarray) -> np.ndarray:
+        found = np.zeros(len(hashes), dtype=bool)
+        if not len(hashes) or not self.runs:
+            return found
+
+        # Most keys in a fresh vendor file are new; the Bloom filter rules
+        # them out before any binary search
+        candidates = self.bloom.might_contain(hashes) if self.bloom else np.ones(len(hashes), dtype=bool)
+        if candidates.any():
+            wanted = hashes[candidates]
+            hits = np.zeros(len(wanted), dtype=bool)
+            for run in self.runs:
+                positions = np.searchsorted(run, wanted).clip(max=len(run) - 1)
+                hits |= run[positions] == wanted
+            found[candidates] = hits
+        return found
+
+
+class LeadDedupIndex:
+    """Classifies mapped lead records as insert, update (already in the
+    pipeline) or skip (repeats an earlier row of the same import)"""
+
+    def __init__(self, existing_hashes: np.ndarray):
+        self.existing = KeySet(existing_hashes, use_bloom=True)
+        self.seen = KeySet()
+
+    def classify(self, records: List[Dict[str, Any]]) -> np.ndarray:
+        """Return an INSERT/UPDATE/SKIP action per record and remember the
+        keys of every record that will be written"""
+        keys = key_hashes(pd.DataFrame(records, columns=KEY_COLUMNS))
+        existing = np.zeros(len(records), dtype=bool)
+        repeated = np.zeros(len(records), dtype=bool)
+
+        for hashed, present in keys.values():
+            rows = np.flatnonzero(present)
+            values = hashed[rows]
+            existing[rows] |= self.existing.contains(values)
+            repeated[rows] |= self.seen.contains(values)
+            # Later rows of this chunk repeating an earlier row's key
+            repeated[rows] |= pd.Series(values).duplicated().to_numpy()
+
+        actions = np.where(repeated, SKIP, np.where(existing, UPDATE, INSERT))
+
+        written = actions != SKIP
+        for hashed, present in keys.values():
+            self.seen.add(hashed[present & written])
+
+        return actions
+
+
+async def fetch_existing_hashes_copy(pool, pipeline_id: str) -> np.ndarray:
+    """Stream a pipeline's lead identity keys over asyncpg, hashing each batch
+
+    Only the 64-bit hashes are kept, so memory grows by 8 bytes per key
+    rather than with the size of the leads table.
+    """
+    parts = [np.empty(0, dtype=np.uint64)]
+
+    async with pool.acquire() as conn:
+        has_dob = await conn.fetchval_statement('column_exists', LEADS_TABLE, 'date_of_birth')
+        dob = 'date_of_birth' if has_dob else 'NULL AS date_of_birth'
+
+        async with conn.transaction():
+            # Compared as text so the query works whatever type pipeline_id has
+            cursor = await conn.cursor(f"""
+                SELECT email, phone_number, first_name, last_name, {dob}
+                FROM {LEADS_TABLE}
+                WHERE pipeline_id::text = $1
+            """, str(pipeline_id))
+            while True:
+                rows = await cursor.fetch(PRELOAD_BATCH_SIZE)
+                if not rows:
+                    break
+                frame = pd.DataFrame([tuple(row) for row in rows], columns=KEY_COLUMNS)
+                parts.append(await asyncio.to_thread(present_key_hashes, frame))
+
+    return np.concatenate(parts)
+
+
+async def fetch_existing_hashes_postgrest(client, pipeline_id: str, page_size: int = 1000) -> np.ndarray:
+    """Page through a pipeline's lead identity keys over PostgREST, hashing each page
+
+    Pages follow the id order from the last id seen, so each page is an
+    index range scan however deep the import is, and rows written meanwhile
+    cannot shift one page's rows into the next.
+    """
+    def fetch_page(columns: str, after_id):
+        query = client.table(LEADS_TABLE).select(columns).eq('pipeline_id', pipeline_id).order('id')
+        if after_id is not None:
+            query = query.gt('id', after_id)
+        return query.limit(page_size).execute().data
+
+    columns = ','.join(['id'] + KEY_COLUMNS)
+    try:
+        rows = await asyncio.to_thread(fetch_page, columns, None)
+    except Exception as e:
+        # Older schemas have no date_of_birth column on the leads table
+        if getattr(e, 'code', None) != UNDEFINED_COLUMN:
+            raise
+        columns = ','.join(['id'] + KEY_COLUMNS[:-1])
+        rows = await asyncio.to_thread(fetch_page, columns, None)
+
+    parts = [np.empty(0, dtype=np.uint64)]
+    while True:
+        if rows:
+            parts.append(present_key_hashes(pd.DataFrame(rows, columns=KEY_COLUMNS)))
+        if len(rows) < page_size:
+            break
+        rows = await asyncio.to_thread(fetch_page, columns, rows[-1]['id'])
+
+    return np.concatenate(parts)
@@ -0,0 +1,169 @@
+"""
+Background import jobs
+Tracks the progress of imports that keep running after the upload request returns
+"""
+
+import os
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from enum import Enum
+from typing import Any, Dict, List, Optional
+
+# Row errors kept per job; rows_failed still counts every rejected row
+MAX_STORED_ERRORS = int(os.getenv("IMPORT_MAX_STORED_ERRORS", "10000"))
+# Finished jobs kept for polling before the oldest are evicted
+MAX_RETAINED_JOBS = int(os.getenv("IMPORT_MAX_RETAINED_JOBS", "100"))
+
+# Row counters saved with import checkpoints and restored on resume
+COUNTERS = (
+    'rows_parsed', 'rows_valid', 'rows_inserted', 'rows_updated',
+    'rows_failed', 'rows_duplicate', 'rows_existing'
+)
+
+
+class ImportStatus(Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+@dataclass
+class ImportJob:
+    """Progress and outcome of one lead import"""
+    id: str
+    file_name: str
+    status: ImportStatus = ImportStatus.QUEUED
+    rows_parsed: int = 0
+    rows_valid: int = 0
+    rows_inserted: int = 0
+    rows_updated: int = 0
+    rows_failed: int = 0
+    rows_duplicate: int = 0
+    rows_existing: int = 0
+    timings: Dict[str, float] = field(default_factory=dict)
+    loader: Optional[str] = None
+    # Source rows committed by earlier attempts this one resumed after
+    resumed_rows: int = 0
+    error: Optional[str] = None
+    errors: List[str] = field(default_factory=list)
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in (ImportStatus.COMPLETED, ImportStatus.FAILED)
+
+    def start(self):
+        self.status = ImportStatus.RUNNING
+        self.started_at = datetime.utcnow()
+
+    def complete(self):
+        self.status = ImportStatus.COMPLETED
+        self.finished_at = datetime.utcnow()
+
+    def fail(self, error: str):
+        self.status = ImportStatus.FAILED
+        self.error = error
+        self.finished_at = datetime.utcnow()
+
+    def add_errors(self, errors: List[str]):
+        """Record rejected rows, keeping at most MAX_STORED_ERRORS messages"""
+        self.rows_failed += len(errors)
+        room = MAX_STORED_ERRORS - len(self.errors)
+        if room > 0:
+            self.errors.extend(errors[:room])
+
+    def add_counts(self, counts: Dict[str, int]):
+        for name, count in counts.items():
+            setattr(self, name, getattr(self, name) + count)
+
+    def counters(self, pending: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+        """Row counters, plus ``pending`` counts not added yet"""
+        pending = pending or {}
+        return {name: getattr(self, name) + pending.get(name, 0) for name in COUNTERS}
+
+    def restore_counters(self, counters: Dict[str, int]):
+        for name in COUNTERS:
+            setattr(self, name, counters.get(name, 0))
+
+    def add_timing(self, stage: str, seconds: float):
+        self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+
+    @property
+    def insert_time(self) -> float:
+        return self.timings.get('insert', 0.0)
+
+    def elapsed_seconds(self) -> float:
+        if not self.started_at:
+            return 0.0
+        return ((self.finished_at or datetime.utcnow()) - self.started_at).total_seconds()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Progress snapshot for the polling endpoints"""
+        elapsed = self.elapsed_seconds()
+        return {
+            "job_id": self.id,
+            "file_name": self.file_name,
+            "status": self.status.value,
+            "rows_parsed": self.rows_parsed,
+            "rows_inserted": self.rows_inserted,
+            "rows_updated": self.rows_updated,
+            "rows_failed": self.rows_failed,
+            "rows_duplicate": self.rows_duplicate,
+            "rows_existing": self.rows_existing,
+            "error_count": len(self.errors),
+            "error": self.error,
+            "loader": self.loader,
+            "resumed_rows": self.resumed_rows,
+            "elapsed_seconds": round(elapsed, 2),
+            "rows_per_second": round(self.rows_inserted / elapsed) if elapsed else None,
+            "insert_rows_per_second": round(self.rows_inserted / self.insert_time) if self.insert_time else None,
+            "timings": {stage: round(seconds, 3) for stage, seconds in self.timings.items()},
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+def written_counts(written: int, inserted: int, updated: int, duplicates: int) -> Dict[str, int]:
+    """Counter increments for a batch of ``written`` leads; the rest already existed"""
+    return {
+        'rows_inserted': inserted,
+        'rows_updated': updated,
+        'rows_duplicate': duplicates,
+        'rows_existing': written - inserted - updated - duplicates
+    }
+
+
+class ImportJobStore:
+    """In-memory registry of import jobs for this worker process"""
+
+    def __init__(self, max_jobs: int = MAX_RETAINED_JOBS):
+        self.max_jobs = max_jobs
+        self.jobs: "OrderedDict[str, ImportJob]" = OrderedDict()
+
+    def create(self, file_name: str, job_id: Optional[str] = None) -> ImportJob:
+        """Register a job; resumed imports keep the id they were started with"""
+        job = ImportJob(id=job_id or f"import-{uuid.uuid4().hex[:12]}", file_name=file_name)
+        self.jobs[job.id] = job
+        self._evict()
+        return job
+
+    def get(self, job_id: str) -> Optional[ImportJob]:
+        return self.jobs.get(job_id)
+
+    def _evict(self):
+        """Drop the oldest finished jobs once over capacity; running jobs are kept"""
+        for job_id in list(self.jobs):
+            if len(self.jobs) <= self.max_jobs:
+                break
+            if self.jobs[job_id].is_finished:
+                del self.jobs[job_id]
+
+
+# Global job store instance
+import_jobs = ImportJobStore()
@@ -0,0 +1,317 @@
+"""
+Bulk loaders for mapped lead records
+COPY through a pooled Postgres connection, with the PostgREST insert path as fallback
+"""
+
+import asyncio
+import json
+import logging
+import random
+import time
+from io import BytesIO
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from metrics import observe_batch
+
+logger = logging.getLogger(__name__)
+
+LEADS_TABLE = 'leads_ins_info'
+
+# Conflict target for upserts; see migrations/001_add_leads_import_key.sql and
+# 004_import_key_trigger.sql, which keys leads written by other paths
+CONFLICT_COLUMNS = ('pipeline_id', 'import_key')
+
+# on_conflict modes: leave existing leads alone, overwrite them with the
+# file's non-empty values, or do that and also merge JSON objects key by key
+ON_CONFLICT_SKIP = 'skip'
+ON_CONFLICT_UPDATE = 'update'
+ON_CONFLICT_MERGE = 'merge'
+ON_CONFLICT_MODES = (ON_CONFLICT_SKIP, ON_CONFLICT_UPDATE, ON_CONFLICT_MERGE)
+
+# Rate limiting and gateway/server errors are worth retrying; 4xx data errors are not
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Awaited with the connection and the batch's counts inside the transaction
+# that writes the batch, e.g. to record an import checkpoint atomically
+OnCommit = Callable[[Any, Dict[str, int]], Awaitable[None]]
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether a failed PostgREST call is transient"""
+    if isinstance(error, httpx.TransportError):
+        return True
+
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None) or getattr(error, 'code', None)
+    try:
+        return int(status) in RETRYABLE_STATUS_CODES
+    except (TypeError, ValueError):
+        return False
+
+
+def _copy_field(value: Any) -> str:
+    """Format one value for COPY ... FROM STDIN (FORMAT csv)
+
+    Text is always quoted so an empty string stays distinct from a missing
+    value, which is written unquoted and loads as NULL.
+    """
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def records_to_csv(records: List[Dict[str, Any]], columns: List[str]) -> BytesIO:
+    """Serialize records as a COPY CSV payload with one line per record"""
+    lines = [
+        ','.join(_copy_field(record.get(column)) for column in columns)
+        for record in records
+    ]
+    lines.append('')
+    return BytesIO('\n'.join(lines).encode('utf-8'))
+
+
+def _quote_ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def last_per_key(records: List[Dict[str, Any]], key: str = 'import_key') -> Tuple[List[Dict[str, Any]], int]:
+    """Keep the last record per non-empty ``key``, returning (records, dropped)
+
+    One INSERT ... ON CONFLICT statement cannot touch the same row twice.
+    """
+    positions = {}
+    for position, record in enumerate(records):
+        if record.get(key) is not None:
+            positions[record[key]] = position
+    kept = [
+        record for position, record in enumerate(records)
+        if record.get(key) is None or positions[record[key]] == position
+    ]
+    return kept, len(records) - len(kept)
+
+
+def conflict_action(columns: List[str], json_columns: List[str], on_conflict: str) -> str:
+    """ON CONFLICT clause for an upsert of ``columns`` into the ``lead`` alias"""
+    if on_conflict == ON_CONFLICT_SKIP:
+        return 'DO NOTHING'
+
+    assignments = []
+    for column in columns:
+        if column in CONFLICT_COLUMNS:
+            continue
+        name = _quote_ident(column)
+        # Values the file leaves empty keep what the lead already has. Compared
+        # as text, since '' is not a valid literal of integer, numeric or date
+        # columns even though mapped values arrive as strings
+        value = (
+            f"CASE WHEN EXCLUDED.{name} IS NULL OR EXCLUDED.{name}::text = '' "
+            f"THEN lead.{name} ELSE EXCLUDED.{name} END"
+        )
+        if on_conflict == ON_CONFLICT_MERGE and column in json_columns:
+            value = (
+                f"CASE WHEN jsonb_typeof(lead.{name}) = 'object' AND jsonb_typeof(EXCLUDED.{name}) = 'object' "
+                f"THEN lead.{name} || EXCLUDED.{name} ELSE {value} END"
+            )
+        assignments.append(f"{name} = {value}")
+
+    if not assignments:
+        return 'DO NOTHING'
+    return 'DO UPDATE SET ' + ', '.join(assignments)
+
+
+class CopyLoader:
+    """Loads leads with COPY ... FROM STDIN over an asyncpg pool"""
+
+    name = "copy"
+
+    def __init__(self, pool, table: str = LEADS_TABLE):
+        self.pool = pool
+        self.table = table
+
+    async def load(self, leads_data: List[Dict[str, Any]], on_commit: Optional[OnCommit] = None) -> int:
+        """COPY one batch of leads, returning the number of rows written"""
+        # Rows map different fields; columns missing from a row load as NULL,
+        # matching PostgREST bulk insert semantics
+        columns = list(dict.fromkeys(column for record in leads_data for column in record))
+        source = records_to_csv(leads_data, columns)
+
+        start_time = time.monotonic()
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                status = await conn.copy_to_table(
+                    self.table, source=source, columns=columns, format='csv'
+                )
+                # asyncpg returns the command tag, e.g. "COPY 5000"
+                written = int(status.split()[-1])
+                if on_commit is not None:
+                    await on_commit(conn, {"inserted": written, "updated": 0, "duplicates": 0})
+        observe_batch(self.name, len(leads_data), time.monotonic() - start_time)
+
+        return written
+
+    async def upsert(self, leads_data: List[Dict[str, Any]], on_conflict: str,
+                     on_commit: Optional[OnCommit] = None) -> Dict[str, int]:
+        """Upsert one batch keyed on (pipeline_id, import_key)
+
+        The batch is COPYed into a temporary staging table and applied with a
+        single INSERT ... SELECT ... ON CONFLICT statement in one transaction.
+        Returns counts of inserted, updated and in-batch duplicate rows.
+        """
+        leads_data, duplicates = last_per_key(leads_data)
+        columns = list(dict.fromkeys(column for record in leads_data for column in record))
+        json_columns = [
+            column for column in columns
+            if any(isinstance(record.get(column), (dict, list)) for record in leads_data)
+        ]
+        column_list = ', '.join(_quote_ident(column) for column in columns)
+        action = conflict_action(columns, json_columns, on_conflict)
+        conflict_target = ', '.join(_quote_ident(column) for column in CONFLICT_COLUMNS)
+
+        start_time = time.monotonic()
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                # Same column types as the leads table, without its constraints
+                await conn.execute(
+                    f"CREATE TEMP TABLE lead_upsert_stage ON COMMIT DROP AS "
+                    f"SELECT {column_list} FROM {_quote_ident(self.table)} WITH NO DATA"
+                )
+                await conn.copy_to_table(
+                    'lead_upsert_stage', source=records_to_csv(leads_data, columns),
+                    columns=columns, format='csv'
+                )
+                # xmax is 0 only for freshly inserted rows
+                counts = await conn.fetchrow(f"""
+                    WITH upserted AS (
+                        INSERT INTO {_quote_ident(self.table)} AS lead ({column_list})
+                        SELECT {column_list} FROM lead_upsert_stage
+                        ON CONFLICT ({conflict_target}) {action}
+                        RETURNING (xmax = 0) AS inserted
+                    )
+                    SELECT count(*) FILTER (WHERE inserted) AS inserted,
+                           count(*) FILTER (WHERE NOT inserted) AS updated
+                    FROM upserted
+                """)
+                counts = {"inserted": counts['inserted'], "updated": counts['updated'], "duplicates": duplicates}
+                if on_commit is not None:
+                    await on_commit(conn, counts)
+
+        observe_batch(self.name, len(leads_data), time.monotonic() - start_time)
+        return counts
+
+
+class PostgrestLoader:
+    """Loads leads through the Supabase PostgREST API
+
+    The supabase client is synchronous, so each batch runs in a worker
+    thread with at most ``max_in_flight`` batches outstanding. Transient
+    failures are retried with exponential backoff, and the batch size
+    adapts towards ``target_latency`` seconds per request.
+    """
+
+    name = "postgrest"
+
+    def __init__(self, client, table: str = LEADS_TABLE, batch_size: int = 100,
+                 max_in_flight: int = 4, max_retries: int = 3, target_latency: float = 1.0,
+                 min_batch_size: int = 25, max_batch_size: int = 1000):
+        self.client = client
+        self.table = table
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.target_latency = target_latency
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+
+    async def load(self, leads_data: List[Dict[str, Any]], on_commit: Optional[OnCommit] = None) -> int:
+        """Insert leads in concurrent batches, returning the number of rows written"""
+        self._check_no_commit_hook(on_commit)
+        return await self._write_batches(leads_data, self._execute_insert)
+
+    async def upsert(self, leads_data: List[Dict[str, Any]], on_conflict: str,
+                     on_commit: Optional[OnCommit] = None) -> Dict[str, int]:
+        """Insert leads whose (pipeline_id, import_key) is new, ignoring the rest
+
+        PostgREST upserts can only ignore or overwrite whole rows, so the
+        update and merge modes need the COPY loader.
+        """
+        self._check_no_commit_hook(on_commit)
+        if on_conflict != ON_CONFLICT_SKIP:
+            raise ValueError(f"on_conflict={on_conflict} requires DATABASE_URL")
+
+        leads_data, duplicates = last_per_key(leads_data)
+        inserted = await self._write_batches(leads_data, self._execute_upsert)
+        return {"inserted": inserted, "updated": 0, "duplicates": duplicates}
+
+    @staticmethod
+    def _check_no_commit_hook(on_commit: Optional[OnCommit]):
+        # Concurrent PostgREST batches commit separately, so nothing can be
+        # written atomically with them
+        if on_commit is not None:
+            raise ValueError("Transactional commit hooks require DATABASE_URL")
+
+    async def _write_batches(self, leads_data: List[Dict[str, Any]], execute) -> int:
+        in_flight = asyncio.Semaphore(self.max_in_flight)
+        tasks = []
+        offset = 0
+
+        try:
+            while offset < len(leads_data):
+                # Size each batch only once a slot frees up, so it reflects
+                # the latency of the batches that just finished
+                await in_flight.acquire()
+                batch = leads_data[offset:offset + self.batch_size]
+                offset += len(batch)
+                tasks.append(asyncio.create_task(self._insert_batch(batch, in_flight, execute)))
+
+            return sum(await asyncio.gather(*tasks))
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+    async def _insert_batch(self, batch: List[Dict[str, Any]], in_flight: asyncio.Semaphore, execute) -> int:
+        """Write one batch, retrying transient failures with backoff"""
+        try:
+            for attempt in range(self.max_retries + 1):
+                start_time = time.monotonic()
+                try:
+                    result = await asyncio.to_thread(execute, batch)
+                except Exception as e:
+                    if attempt == self.max_retries or not is_retryable(e):
+                        raise
+
+                    # Back off and send smaller batches while the API is struggling
+                    self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+                    delay = 0.5 * 2 ** attempt + random.uniform(0, 0.25)
+                    logger.warning(f"Lead batch insert failed ({e}), retrying in {delay:.2f}s")
+                    await asyncio.sleep(delay)
+                    continue
+
+                latency = time.monotonic() - start_time
+                observe_batch(self.name, len(batch), latency)
+                self._adapt_batch_size(latency)
+                return len(result.data) if result.data else 0
+        finally:
+            in_flight.release()
+
+    def _execute_insert(self, batch: List[Dict[str, Any]]):
+        return self.client.table(self.table).insert(batch).execute()
+
+    def _execute_upsert(self, batch: List[Dict[str, Any]]):
+        # Ignored duplicates are not returned, so result.data counts inserts
+        return self.client.table(self.table).upsert(
+            batch, on_conflict=','.join(CONFLICT_COLUMNS), ignore_duplicates=True
+        ).execute()
+
+    def _adapt_batch_size(self, latency: float):
+        """Scale the batch size towards the target request latency"""
+        factor = min(2.0, max(0.5, self.target_latency / max(latency, 0.001)))
+        self.batch_size = int(min(self.max_batch_size, max(self.min_batch_size, self.batch_size * factor)))
@@ -1,44 +1,44 @@
 #!/usr/bin/env python3
 
-import http.server
-import socketserver
+import asyncio
+import contextlib
 import json
-import csv
-import io
+import logging
 import os
-import urllib.parse
-from typing import Dict, List, Any
-import requests
-
-# Simple HTTP server for CSV processing
-class CSVHandler(http.server.BaseHTTPRequestHandler):
-    def do_OPTIONS(self):
-        self.send_response(200)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.end_headers()
-
-    def do_GET(self):
-        if self.path == '/health':
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            response = {"status": "healthy", "service": "csv-import"}
-            self.wfile.write(json.dumps(response).encode())
-        else:
-            self.send_response(404)
-            self.end_headers()
-
-    def do_POST(self):
-        if self.path == '/preview-csv':
-            self.handle_preview_csv()
-        elif self.path == '/import-leads':
-            self.handle_import_leads()
-        else:
-            self.send_response(404)
-            self.end_headers()
+import shutil
+import tempfile
+import time
+from typing import Dict, List, Any, Optional
+
+from dotenv import load_dotenv
+from fastapi import FastAPI, File, Form, HTTPException, Response, UploadFile
+from fastapi.middleware.cors import CORSMiddleware
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from supabase import create_client, Client
+
+from checkpoints import COMPLETED, FAILED, IMPORT_STALE_SECONDS, Checkpoint, CheckpointConflict, CheckpointStore
+from csv_reader import iter_upload_chunks, preview_upload, upload_mapping_plans
+from database import DatabasePool
+from dedup import (
+    IMPORT_KEY_COLUMN, INSERT, SKIP, UPDATE, LeadDedupIndex, fetch_existing_hashes_copy,
+    fetch_existing_hashes_postgrest, import_keys
+)
+from jobs import ImportJob, ImportStatus, import_jobs, written_counts
+from loaders import ON_CONFLICT_MODES, ON_CONFLICT_SKIP, CopyLoader, OnCommit, PostgrestLoader
+from mapping import map_chunk
+from metrics import (
+    observe_pool_acquire, observe_pool_timeout, observe_stage, record_finished_job, record_import_rows, stage_timer,
+    track_pool
+)
+from reference_data import fetch_table_from_pool, reference_cache
+
+load_dotenv()
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+app = FastAPI(title="CSV Import Service")
 
 # CORS middleware
 app.add_middleware(
@@ -54,55 +54,167 @@ supabase_url = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
 supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 supabase: Client = create_client(supabase_url, supabase_key)
 
+# Database connection pool for COPY-based bulk loads (optional)
+db_pool: Optional[DatabasePool] = None
+
+async def get_db_pool() -> Optional[DatabasePool]:
+    """Get database connection pool, or None when DATABASE_URL is not configured
+
+    Sized by DB_POOL_MIN_SIZE / DB_POOL_MAX_SIZE; see database.py for the
+    acquire timeout and connection lifetime settings.
+    """
+    global db_pool
+    if db_pool is None:
+        database_url = os.getenv("DATABASE_URL")
+        if not database_url:
+            return None
+
+        try:
+            pool = DatabasePool("csv-import", database_url, on_acquire=observe_pool_acquire,
+                                on_timeout=observe_pool_timeout)
+            await pool.open()
+            track_pool(pool)
+            db_pool = pool
+        except Exception as e:
+            logger.error(f"Failed to create database pool, using PostgREST inserts: {e}")
+            return None
+
+    return db_pool
+
+async def get_loader():
+    """COPY loader when Postgres is reachable directly, PostgREST inserts otherwise"""
+    pool = await get_db_pool()
+    if pool is not None:
+        return CopyLoader(pool)
+    return PostgrestLoader(
+        supabase,
+        batch_size=int(os.getenv("SUPABASE_BATCH_SIZE", "100")),
+        max_in_flight=int(os.getenv("SUPABASE_MAX_IN_FLIGHT", "4")),
+        max_retries=int(os.getenv("SUPABASE_MAX_RETRIES", "3"))
+    )
+
+# Background imports: at most IMPORT_MAX_CONCURRENT_JOBS run at once, the rest queue
+import_slots = asyncio.Semaphore(int(os.getenv("IMPORT_MAX_CONCURRENT_JOBS", "2")))
+running_imports = set()
+
+# Checkpoints of imports in the import_jobs table, so imports cut off by a
+# restart are resumed (needs DATABASE_URL and supabase/migrations/20261018000003_import_jobs.sql)
+checkpoint_store = CheckpointStore("csv-import")
+resume_task: Optional[asyncio.Task] = None
+# Uploads are spooled here until their import finishes; a directory that
+# survives deploys lets imports resume after one (default: system temp dir)
+IMPORT_SPOOL_DIR = os.getenv("IMPORT_SPOOL_DIR") or None
+
+NO_VALID_LEADS = "No valid leads found"
+
+async def fetch_reference_table_postgrest(table: str) -> List[Dict[str, Any]]:
+    """Load a whole reference table through PostgREST when there is no pool"""
+    query = supabase.table(table).select('*')
+    if table == 'pipeline_statuses':
+        query = query.order('pipeline_id').order('display_order')
+    result = await asyncio.to_thread(query.execute)
+    return result.data or []
+
+@app.on_event("startup")
+async def startup_event():
+    """Open the COPY connection pool, warm the reference data cache and resume
+    interrupted imports on startup"""
+    global resume_task
+    pool = await get_db_pool()
+    if pool is not None:
+        # Changes arrive over LISTEN/NOTIFY; without a pool only the TTL applies
+        await reference_cache.start(
+            lambda table: fetch_table_from_pool(pool, table), listen_dsn=os.getenv("DATABASE_URL")
+        )
+        await checkpoint_store.start(pool)
+        if checkpoint_store.enabled:
+            resume_task = asyncio.create_task(resume_abandoned_imports())
+    else:
+        await reference_cache.start(fetch_reference_table_postgrest)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Interrupt running imports at their last checkpoint and close database
+    connections on shutdown"""
+    global db_pool
+    if resume_task is not None:
+        resume_task.cancel()
+    for task in list(running_imports):
+        task.cancel()
+    await asyncio.gather(*running_imports, return_exceptions=True)
+    await checkpoint_store.stop()
+
+    await reference_cache.stop()
+    if db_pool:
+        await db_pool.close()
+        logger.info("CSV import database connections closed")
+
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "service": "csv-import"}
+    """Service health, with connection pool saturation when COPY loads are enabled"""
+    health = {"status": "healthy", "service": "csv-import", "reference_data": reference_cache.stats()}
+    if db_pool is not None:
+        health["database_pool"] = db_pool.stats()
+    return health
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: per-stage import histograms, write batches and row outcomes"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 @app.post("/preview-csv")
 async def preview_csv(file: UploadFile = File(...)):
-    """Preview CSV file structure and return headers + sample rows"""
-    try:
-        # Read CSV content
-        content = await file.read()
-        csv_string = content.decode('utf-8')
-
-        # Use pandas for robust CSV parsing
-        df = pd.read_csv(StringIO(csv_string))
-
-        # Get headers
-        headers = df.columns.tolist()
-
-        # Get first 5 rows as preview
-        preview_data = df.head(5).fillna('').to_dict('records')
+    """Preview CSV file structure and return headers + sample rows
 
-        return {
-            "headers": headers,
-            "preview": preview_data,
-            "total_rows": len(df),
-            "total_columns": len(headers)
-        }
+    Accepts CSV, gzip, zip (of CSVs) and xlsx uploads. Only the sample rows
+    are parsed; total_rows comes from a newline count, estimated for
+    compressed uploads.
+    """
+    try:
+        return await asyncio.to_thread(preview_upload, file.file)
 
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error parsing CSV: {str(e)}")
 
 @app.post("/import-leads")
 async def import_leads(
+    response: Response,
     file: UploadFile = File(...),
     pipeline_id: str = Form(...),
     lead_source: str = Form(...),
     import_file_name: str = Form(...),
-    column_mappings: str = Form(...)
+    column_mappings: str = Form(...),
+    # "async" is a Python keyword, hence the alias
+    run_async: bool = Form(False, alias="async"),
+    dedupe: bool = Form(False),
+    on_conflict: Optional[str] = Form(None)
 ):
-    """Import leads from CSV file with optimized batch processing"""
+    """Import leads from a CSV and return the summary once it finishes
+
+    The import runs as a background job either way; pass ``async=true`` to
+    get 202 with its job id right away and follow progress from
+    GET /imports/{job_id} instead of waiting.
+
+    With ``dedupe=true`` rows matching a lead already in the pipeline, or an
+    earlier row of the file, are skipped.
+
+    ``on_conflict`` (skip, update or merge) upserts on the lead's natural key
+    (pipeline_id, import_key) instead: existing leads are left alone, updated
+    with the file's non-empty values, or updated with JSON objects merged.
+    """
+    on_conflict = on_conflict or None
+    if on_conflict and on_conflict not in ON_CONFLICT_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"on_conflict must be one of: {', '.join(ON_CONFLICT_MODES)}"
+        )
+    if on_conflict and on_conflict != ON_CONFLICT_SKIP and await get_db_pool() is None:
+        raise HTTPException(status_code=400, detail=f"on_conflict={on_conflict} requires DATABASE_URL")
+
     try:
         # Parse column mappings
         mappings = json.loads(column_mappings)
 
-        # Read CSV with pandas (much faster than manual parsing)
-        content = await file.read()
-        csv_string = content.decode('utf-8')
-        df = pd.read_csv(StringIO(csv_string))
-
         # Get pipeline defaults in parallel
         pipeline_status_task = get_pipeline_default_status(pipeline_id)
         insurance_type_task = get_default_insurance_type()
@@ -117,154 +229,351 @@ async def import_leads(
             if mapping['crmField'] and mapping['crmField'] != 'skip':
                 field_mapping[mapping['csvColumn']] = mapping['crmField']
 
-        # Process data efficiently with pandas
-        leads_data = []
-        errors = []
-
-        for index, row in df.iterrows():
-            try:
-                lead_data = process_row(
-                    row, field_mapping, pipeline_id,
-                    default_status_id, default_insurance_type_id,
-                    lead_source, import_file_name
-                )
+        base_fields = {
+            'pipeline_id': pipeline_id,
+            'status_id': default_status_id,
+            'insurance_type_id': default_insurance_type_id,
+            'source': lead_source.strip(),
+            'import_file_name': import_file_name.strip()
+        }
 
-                if lead_data:
-                    leads_data.append(lead_data)
+        # The upload is closed once this request returns, so spool it to a
+        # temporary file the background job owns
+        upload_start = time.perf_counter()
+        upload_path = await asyncio.to_thread(save_upload, file.file)
+        upload_seconds = time.perf_counter() - upload_start
+
+        # A file with none of the mapped columns would parse to rows of nothing
+        try:
+            unmapped = await asyncio.to_thread(unmapped_upload_files, upload_path, field_mapping)
+        except Exception:
+            os.unlink(upload_path)
+            raise
+        if unmapped:
+            os.unlink(upload_path)
+            raise HTTPException(status_code=400, detail='; '.join(unmapped))
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Import failed: {str(e)}")
 
-            except Exception as e:
-                errors.append(f"Row {index + 2}: {str(e)}")
+    job = import_jobs.create(import_file_name.strip() or file.filename)
+    observe_stage('upload', upload_seconds, job)
 
-        if not leads_data:
-            return {"success": False, "error": "No valid leads found", "errors": errors}
+    checkpoint = None
+    if checkpoint_store.enabled:
+        options = {
+            'field_mapping': field_mapping,
+            'base_fields': base_fields,
+            'dedupe': dedupe,
+            'on_conflict': on_conflict
+        }
+        try:
+            checkpoint = await checkpoint_store.begin(job.id, upload_path, job.file_name, options)
+        except Exception as e:
+            os.unlink(upload_path)
+            job.fail(str(e))
+            raise HTTPException(status_code=500, detail=f"Import failed: {str(e)}")
 
-        # Batch insert to database (much faster than individual inserts)
-        result = await batch_insert_leads(leads_data)
+    task = start_import(job, upload_path, field_mapping, base_fields, dedupe, on_conflict, checkpoint)
 
+    if run_async:
+        response.status_code = 202
         return {
             "success": True,
-            "imported_count": result["count"],
-            "errors": errors if errors else None,
-            "processing_time": result.get("processing_time")
+            "job_id": job.id,
+            "status": job.status.value,
+            "status_url": f"/imports/{job.id}"
         }
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Import failed: {str(e)}")
-
-async def get_pipeline_default_status(pipeline_id: str) -> str:
-    """Get default status for pipeline"""
-    result = supabase.table('pipeline_statuses').select('id').eq('pipeline_id', pipeline_id).order('display_order').limit(1).execute()
+    # Keep importing if the client disconnects while waiting
+    await asyncio.shield(task)
 
-    if not result.data:
-        raise HTTPException(status_code=400, detail="No pipeline statuses found")
+    if job.status == ImportStatus.FAILED and job.error == NO_VALID_LEADS:
+        return {"success": False, "error": job.error, "errors": job.errors, "job_id": job.id}
+    if job.status == ImportStatus.FAILED:
+        raise HTTPException(status_code=500, detail=f"Import failed: {job.error}")
 
-    return result.data[0]['id']
+    return {
+        "success": True,
+        "job_id": job.id,
+        "imported_count": job.rows_inserted,
+        "updated_count": job.rows_updated,
+        "skipped_duplicates": job.rows_duplicate,
+        "skipped_existing": job.rows_existing,
+        "errors": job.errors if job.errors else None,
+        "processing_time": round(job.insert_time, 2),
+        "rows_per_second": round(job.rows_inserted / job.insert_time) if job.insert_time else None,
+        "timings": job.to_dict()["timings"],
+        "loader": job.loader
+    }
 
-async def get_default_insurance_type() -> str:
-    """Get default insurance type (Auto)"""
-    result = supabase.table('insurance_types').select('id').eq('name', 'Auto').limit(1).execute()
-    return result.data[0]['id'] if result.data else 1
+@app.get("/imports/{job_id}")
+async def get_import(job_id: str):
+    """Get progress of a background import"""
+    job = import_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job.to_dict()
+
+@app.get("/imports/{job_id}/errors")
+async def get_import_errors(job_id: str, offset: int = 0, limit: int = 100):
+    """Page through the row errors of a background import"""
+    job = import_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
 
-def process_row(row: pd.Series, field_mapping: Dict, pipeline_id: str,
-               status_id: str, insurance_type_id: str, source: str,
-               import_file_name: str) -> Dict[str, Any]:
-    """Process a single row efficiently"""
-
-    lead_data = {
-        'pipeline_id': pipeline_id,
-        'status_id': status_id,
-        'insurance_type_id': insurance_type_id,
-        'source': source.strip(),
-        'import_file_name': import_file_name.strip()
+    return {
+        "job_id": job.id,
+        "status": job.status.value,
+        "rows_failed": job.rows_failed,
+        "total": len(job.errors),
+        "offset": offset,
+        "errors": job.errors[offset:offset + max(0, min(limit, 1000))]
     }
 
-    additional_drivers = []
-
-    # Process mapped fields
-    for csv_column, crm_field in field_mapping.items():
-        if csv_column not in row.index:
-            continue
-
-        value = row[csv_column]
-
-        # Skip empty values
-        if pd.isna(value) or str(value).strip() == '':
-            continue
-
-        value = str(value).strip()
-
-        # Handle driver fields
-        if crm_field.startswith('driver_'):
-            parts = crm_field.split('_')
-            if len(parts) >= 3:
-                driver_num = int(parts[1])
-                field_name = '_'.join(parts[2:])
-
-                # Ensure we have enough driver slots
-                while len(additional_drivers) < driver_num:
-                    additional_drivers.append({})
-
-                # Handle boolean fields
-                if field_name in ['sr22', 'military']:
-                    additional_drivers[driver_num - 1][field_name] = value.lower() in ['yes', 'true', '1']
-                else:
-                    additional_drivers[driver_num - 1][field_name] = value
-        else:
-            # Handle boolean fields for primary driver
-            if crm_field in ['sr22', 'military']:
-                lead_data[crm_field] = value.lower() in ['yes', 'true', '1']
-            # Handle numeric fields
-            elif crm_field in ['premium', 'auto_premium', 'home_premium', 'specialty_premium']:
-                try:
-                    # Remove currency symbols and convert to float
-                    numeric_value = float(''.join(c for c in value if c.isdigit() or c in '.-'))
-                    lead_data[crm_field] = numeric_value
-                except ValueError:
-                    pass  # Skip invalid numeric values
+def save_upload(source) -> str:
+    """Copy an upload to a spool file in bounded chunks, returning its path"""
+    source.seek(0)
+    with tempfile.NamedTemporaryFile(prefix="csv-import-", suffix=".upload", dir=IMPORT_SPOOL_DIR,
+                                     delete=False) as target:
+        shutil.copyfileobj(source, target, 1024 * 1024)
+    return target.name
+
+def unmapped_upload_files(upload_path: str, field_mapping: Dict[str, str]) -> List[str]:
+    """Errors for the files of an upload whose header has none of the mapped columns"""
+    if not field_mapping:
+        return []
+    with open(upload_path, 'rb') as upload:
+        plans = upload_mapping_plans(upload, field_mapping)
+    return [
+        (f"{name}: " if name else '') + f"None of the mapped columns are in the header: {', '.join(plan.missing_columns)}"
+        for name, plan in plans
+        if not plan.usecols
+    ]
+
+def start_import(job: ImportJob, upload_path: str, field_mapping: Dict[str, str],
+                 base_fields: Dict[str, Any], dedupe: bool, on_conflict: Optional[str],
+                 checkpoint: Optional[Checkpoint] = None) -> asyncio.Task:
+    """Run an import in the background, tracked so shutdown can interrupt it"""
+    task = asyncio.create_task(
+        run_import_job(job, upload_path, field_mapping, base_fields, dedupe, on_conflict, checkpoint)
+    )
+    running_imports.add(task)
+    task.add_done_callback(running_imports.discard)
+    return task
+
+async def resume_abandoned_imports():
+    """Resume, from their checkpoints, imports interrupted by a shutdown or
+    abandoned by a worker that died, checking every IMPORT_STALE_SECONDS"""
+    while True:
+        try:
+            for checkpoint in await checkpoint_store.claim_abandoned():
+                logger.info(f"Resuming import {checkpoint.import_id} after {checkpoint.rows_committed} rows")
+                options = checkpoint.options
+                job = import_jobs.create(checkpoint.file_name, job_id=checkpoint.import_id)
+                start_import(
+                    job, checkpoint.upload_path, options['field_mapping'], options['base_fields'],
+                    options['dedupe'], options['on_conflict'], checkpoint
+                )
+        except Exception as e:
+            logger.warning(f"Could not resume abandoned imports: {e}")
+        await asyncio.sleep(IMPORT_STALE_SECONDS)
+
+async def build_dedup_index(pipeline_id: str) -> LeadDedupIndex:
+    """Preload the identity keys of a pipeline's existing leads in one bulk read"""
+    pool = await get_db_pool()
+    if pool is not None:
+        hashes = await fetch_existing_hashes_copy(pool, pipeline_id)
+    else:
+        hashes = await fetch_existing_hashes_postgrest(supabase, pipeline_id)
+
+    return await asyncio.to_thread(LeadDedupIndex, hashes)
+
+async def run_import_job(job: ImportJob, upload_path: str, field_mapping: Dict[str, str],
+                         base_fields: Dict[str, Any], dedupe: bool = False,
+                         on_conflict: Optional[str] = None, checkpoint: Optional[Checkpoint] = None):
+    """Parse, map and insert an uploaded file, recording progress on the job
+
+    With a checkpoint, each chunk's rows and the checkpoint past them commit
+    together, and rows committed by an earlier attempt are skipped.
+    """
+    taken_over = False
+    # Counters this attempt resumes from; an earlier attempt counted them in /metrics
+    restored = dict(checkpoint.counters) if checkpoint is not None else {}
+    async with import_slots:
+        job.start()
+        if checkpoint is not None:
+            job.restore_counters(restored)
+            job.resumed_rows = checkpoint.rows_committed
+        try:
+            loader = await get_loader()
+            job.loader = loader.name
+
+            dedup_index = None
+            if dedupe:
+                with stage_timer('dedup_preload', job):
+                    dedup_index = await build_dedup_index(base_fields['pipeline_id'])
+
+            with open(upload_path, 'rb') as upload:
+                # Stream the upload in bounded chunks; each chunk is mapped and
+                # inserted before the next one is parsed. Parsing and mapping
+                # run in worker threads so the event loop stays free, and only
+                # the columns in each file's (cached) mapping plan are parsed.
+                # Every stage is timed per chunk into the job and /metrics.
+                chunks = iter_upload_chunks(upload, field_mapping)
+                # Source rows up to the end of this chunk, across every file of the upload
+                position = 0
+                while True:
+                    with stage_timer('parse', job):
+                        item = await asyncio.to_thread(next, chunks, None)
+                    if item is None:
+                        break
+
+                    source_name, plan, chunk = item
+                    chunk_start, position = position, position + len(chunk)
+                    if checkpoint is not None and chunk_start < job.resumed_rows:
+                        # Committed by an earlier attempt; its rows are already counted.
+                        # The chunk size may have changed since, so slice positionally
+                        chunk = chunk.iloc[job.resumed_rows - chunk_start:]
+                        if chunk.empty:
+                            continue
+                    job.rows_parsed += len(chunk)
+
+                    # Map whole columns at once instead of row by row
+                    with stage_timer('map', job):
+                        leads_data, row_errors = await asyncio.to_thread(map_chunk, chunk, plan, base_fields)
+                    if source_name:
+                        # Row numbers restart in each file of a zip upload
+                        row_errors = [f"{source_name}: {error}" for error in row_errors]
+                    job.add_errors(row_errors)
+
+                    job.rows_valid += len(leads_data)
+
+                    if dedup_index and leads_data:
+                        with stage_timer('dedup', job):
+                            actions = await asyncio.to_thread(dedup_index.classify, leads_data)
+                        job.rows_duplicate += int((actions == SKIP).sum())
+                        # Upserts handle existing leads themselves
+                        keep = (INSERT, UPDATE) if on_conflict else (INSERT,)
+                        if not on_conflict:
+                            job.rows_existing += int((actions == UPDATE).sum())
+                        leads_data = [lead for lead, action in zip(leads_data, actions) if action in keep]
+
+                    if not leads_data:
+                        continue
+
+                    if on_conflict:
+                        with stage_timer('map', job):
+                            keys = await asyncio.to_thread(import_keys, leads_data)
+                        for lead, key in zip(leads_data, keys):
+                            lead[IMPORT_KEY_COLUMN] = key
+
+                    on_commit = None
+                    if checkpoint is not None:
+                        async def on_commit(conn, counts, rows_committed=position, written=len(leads_data)):
+                            batch = written_counts(written, counts["inserted"], counts["updated"], counts["duplicates"])
+                            await checkpoint.advance(conn, rows_committed, job.counters(pending=batch))
+
+                    # Batch insert to database (much faster than individual inserts)
+                    result = await batch_insert_leads(leads_data, loader, on_conflict, on_commit)
+                    job.add_counts(written_counts(len(leads_data), result["count"], result["updated"], result["duplicates"]))
+                    observe_stage('insert', result["processing_time"], job)
+
+            if not job.rows_valid:
+                job.fail(NO_VALID_LEADS)
             else:
-                lead_data[crm_field] = value
-
-    # Add additional drivers if any
-    if additional_drivers:
-        # Filter out empty driver records
-        valid_drivers = [d for d in additional_drivers if d.get('first_name') or d.get('last_name')]
-        if valid_drivers:
-            lead_data['additional_insureds'] = valid_drivers
-
-    # Validate required fields
-    if not lead_data.get('first_name') and not lead_data.get('last_name'):
-        raise ValueError("Missing both first name and last name")
-
-    # Set defaults for required fields
-    if not lead_data.get('first_name'):
-        lead_data['first_name'] = ''
-    if not lead_data.get('last_name'):
-        lead_data['last_name'] = ''
+                job.complete()
+
+        except CheckpointConflict as e:
+            # The worker that took over owns the upload now
+            logger.error(f"Import {job.id} stopped: {e}")
+            taken_over = True
+            job.fail(str(e))
+        except Exception as e:
+            logger.error(f"Import {job.id} failed: {e}")
+            job.fail(str(e))
+        finally:
+            # An attempt that stops short of finishing, by shutdown or takeover,
+            # counts only the rows up to its last checkpoint: the next attempt
+            # resumes, and counts, from there
+            if (job.is_finished and not taken_over) or checkpoint is None:
+                record_import_rows(job.counters(), restored)
+            else:
+                record_import_rows(checkpoint.counters, restored)
+            if job.is_finished:
+                record_finished_job(job)
+            # A cancelled import keeps its upload and checkpoint to be resumed
+            if checkpoint is not None and job.is_finished and not taken_over:
+                try:
+                    await checkpoint_store.finish(
+                        checkpoint, COMPLETED if job.status == ImportStatus.COMPLETED else FAILED, job.error
+                    )
+                except Exception as e:
+                    logger.warning(f"Could not record the outcome of import {job.id}: {e}")
+            if (job.is_finished and not taken_over) or checkpoint is None:
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(upload_path)
 
-    return lead_data
+async def get_pipeline_default_status(pipeline_id: str) -> str:
+    """Get default status for pipeline, from the reference data cache when possible"""
+    status_id = await reference_cache.pipeline_default_status(pipeline_id)
+    if status_id is not None:
+        return status_id
+
+    # Not cached, e.g. a pipeline created since the last refresh: look it up directly
+    pool = await get_db_pool()
+    if pool is not None:
+        async with pool.acquire() as conn:
+            status_id = await conn.fetchval_statement('pipeline_default_status', pipeline_id)
+    else:
+        query = supabase.table('pipeline_statuses').select('id').eq('pipeline_id', pipeline_id).order('display_order').limit(1)
+        result = await asyncio.to_thread(query.execute)
+        status_id = result.data[0]['id'] if result.data else None
+
+    if status_id is None:
+        raise HTTPException(status_code=400, detail="No pipeline statuses found")
 
-async def batch_insert_leads(leads_data: List[Dict]) -> Dict:
-    """Batch insert leads for better performance"""
-    import time
-    start_time = time.time()
+    reference_cache.invalidate('pipeline_statuses')
+    return status_id
 
-    # Insert in batches of 100 for optimal performance
-    batch_size = 100
-    total_inserted = 0
+async def get_default_insurance_type() -> str:
+    """Get default insurance type (Auto)"""
+    type_id = await reference_cache.insurance_type_id('Auto')
+    if type_id is not None:
+        return type_id
+
+    pool = await get_db_pool()
+    if pool is not None:
+        async with pool.acquire() as conn:
+            type_id = await conn.fetchval_statement('default_insurance_type')
+        return type_id if type_id is not None else 1
+
+    query = supabase.table('insurance_types').select('id').eq('name', 'Auto').limit(1)
+    result = await asyncio.to_thread(query.execute)
+    return result.data[0]['id'] if result.data else 1
 
-    for i in range(0, len(leads_data), batch_size):
-        batch = leads_data[i:i + batch_size]
+async def batch_insert_leads(leads_data: List[Dict], loader, on_conflict: Optional[str] = None,
+                             on_commit: Optional[OnCommit] = None) -> Dict:
+    """Bulk load leads with the configured loader, upserting when on_conflict is set
 
-        result = supabase.table('leads_ins_info').insert(batch).execute()
+    ``on_commit`` runs inside the batch's transaction (COPY loader only).
+    """
+    start_time = time.perf_counter()
 
-        if result.data:
-            total_inserted += len(result.data)
+    if on_conflict:
+        counts = await loader.upsert(leads_data, on_conflict, on_commit)
+    else:
+        counts = {"inserted": await loader.load(leads_data, on_commit), "updated": 0, "duplicates": 0}
 
-    processing_time = time.time() - start_time
+    processing_time = time.perf_counter() - start_time
 
     return {
-        "count": total_inserted,
-        "processing_time": round(processing_time, 2)
+        "count": counts["inserted"],
+        "updated": counts["updated"],
+        "duplicates": counts["duplicates"],
+        "processing_time": processing_time
     }
 
 if __name__ == "__main__":
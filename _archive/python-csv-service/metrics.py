@@ -0,0 +1,136 @@
+"""
+Import pipeline metrics
+Prometheus histograms per import stage, mirrored into each job's timing breakdown,
+and database pool acquire waits and saturation
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+from prometheus_client import Counter, Gauge, Histogram
+
+# Stages of an import, in pipeline order. Decoding happens inside the
+# streaming parser, so it is part of "parse".
+STAGES = ('upload', 'dedup_preload', 'parse', 'map', 'dedup', 'insert')
+
+# From a few ms (one small chunk) to minutes (a whole multi-GB upload)
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+IMPORT_STAGE_SECONDS = Histogram(
+    'csv_import_stage_seconds',
+    'Time spent in each stage of a lead import, observed per chunk',
+    ['stage'],
+    buckets=STAGE_BUCKETS
+)
+
+# Export every stage from the start, not only once it is first observed
+for _stage in STAGES:
+    IMPORT_STAGE_SECONDS.labels(stage=_stage)
+
+INSERT_BATCH_SECONDS = Histogram(
+    'csv_import_insert_batch_seconds',
+    'Latency of one database write batch',
+    ['loader'],
+    buckets=STAGE_BUCKETS
+)
+
+INSERT_BATCH_ROWS = Histogram(
+    'csv_import_insert_batch_rows',
+    'Rows per database write batch',
+    ['loader'],
+    buckets=(10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000)
+)
+
+IMPORT_ROWS = Counter(
+    'csv_import_rows_total',
+    'Rows processed by lead imports',
+    ['outcome']
+)
+
+IMPORT_JOBS = Counter(
+    'csv_import_jobs_total',
+    'Finished lead imports',
+    ['status']
+)
+
+POOL_ACQUIRE_SECONDS = Histogram(
+    'db_pool_acquire_seconds',
+    'Time callers waited for a database pool connection',
+    ['pool'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+
+POOL_ACQUIRE_TIMEOUTS = Counter(
+    'db_pool_acquire_timeouts_total',
+    'Database pool acquires that timed out',
+    ['pool']
+)
+
+POOL_CONNECTIONS = Gauge(
+    'db_pool_connections',
+    'Database pool connections by state',
+    ['pool', 'state']
+)
+
+
+def observe_stage(stage: str, seconds: float, job=None):
+    """Record ``seconds`` spent in ``stage``, on the histogram and the job"""
+    IMPORT_STAGE_SECONDS.labels(stage=stage).observe(seconds)
+    if job is not None:
+        job.add_timing(stage, seconds)
+
+
+@contextmanager
+def stage_timer(stage: str, job=None) -> Iterator[None]:
+    """Time the enclosed block as one observation of ``stage``"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start, job)
+
+
+def observe_batch(loader: str, rows: int, seconds: float):
+    """Record one write batch of a loader"""
+    INSERT_BATCH_SECONDS.labels(loader=loader).observe(seconds)
+    INSERT_BATCH_ROWS.labels(loader=loader).observe(rows)
+
+
+def record_finished_job(job):
+    """Count a finished job"""
+    IMPORT_JOBS.labels(status=job.status.value).inc()
+
+
+def record_import_rows(counters: Dict[str, int], restored: Dict[str, int]):
+    """Count the row outcomes of one attempt at an import
+
+    ``restored`` are the counters it resumed from a checkpoint with; those
+    rows were counted by the attempt that committed them.
+    """
+    for outcome, name in (('inserted', 'rows_inserted'), ('updated', 'rows_updated'),
+                          ('failed', 'rows_failed'), ('duplicate', 'rows_duplicate'),
+                          ('existing', 'rows_existing')):
+        rows = counters.get(name, 0) - restored.get(name, 0)
+        if rows > 0:
+            IMPORT_ROWS.labels(outcome=outcome).inc(rows)
+
+
+def observe_pool_acquire(pool: str, seconds: float):
+    POOL_ACQUIRE_SECONDS.labels(pool=pool).observe(seconds)
+
+
+def observe_pool_timeout(pool: str):
+    POOL_ACQUIRE_TIMEOUTS.labels(pool=pool).inc()
+
+
+def track_pool(pool):
+    """Export a DatabasePool's open, in-use and waiting counts, read at scrape time"""
+    POOL_ACQUIRE_TIMEOUTS.labels(pool=pool.name)
+    POOL_CONNECTIONS.labels(pool=pool.name, state='open').set_function(
+        lambda: pool.pool.get_size() if pool.pool else 0
+    )
+    POOL_CONNECTIONS.labels(pool=pool.name, state='in_use').set_function(
+        lambda: pool.pool.get_size() - pool.pool.get_idle_size() if pool.pool else 0
+    )
+    POOL_CONNECTIONS.labels(pool=pool.name, state='waiting').set_function(lambda: pool.waiting)
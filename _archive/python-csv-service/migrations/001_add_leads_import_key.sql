@@ -0,0 +1,43 @@
+-- Migration: Add natural identity key for CSV import upserts
+-- Date: 2026-10-18
+-- Description: import_key holds the normalized identity of an imported lead
+-- (email, else last 10 phone digits, else name + date of birth). The unique
+-- (pipeline_id, import_key) index is the conflict target for /import-leads
+-- with on_conflict=skip|update|merge. NULL keys never conflict.
+
+ALTER TABLE leads_ins_info
+ADD COLUMN IF NOT EXISTS import_key TEXT;
+
+COMMENT ON COLUMN leads_ins_info.import_key IS 'Normalized identity used by the CSV importer for ON CONFLICT upserts (e:<email>, p:<phone>, n:<name|dob>)';
+
+-- Key existing leads the way the importer does. When several leads in a
+-- pipeline share a key only the oldest is keyed, so the index can be built.
+WITH keyed AS (
+    SELECT
+        id,
+        pipeline_id,
+        created_at,
+        CASE
+            WHEN email LIKE '%@%' THEN 'e:' || lower(btrim(email, E' \t\r\n'))
+            WHEN length(regexp_replace(phone_number, '\D', '', 'g')) >= 7
+                THEN 'p:' || right(regexp_replace(phone_number, '\D', '', 'g'), 10)
+        END AS import_key
+    FROM leads_ins_info
+    WHERE import_key IS NULL
+),
+ranked AS (
+    SELECT
+        id,
+        import_key,
+        row_number() OVER (PARTITION BY pipeline_id, import_key ORDER BY created_at, id) AS position
+    FROM keyed
+    WHERE import_key IS NOT NULL
+)
+UPDATE leads_ins_info
+SET import_key = ranked.import_key
+FROM ranked
+WHERE leads_ins_info.id = ranked.id
+  AND ranked.position = 1;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_leads_ins_info_import_key
+ON leads_ins_info (pipeline_id, import_key);
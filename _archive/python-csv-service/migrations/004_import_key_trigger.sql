@@ -0,0 +1,88 @@
+-- Migration: Keep leads_ins_info.import_key current on every write
+-- Date: 2026-10-18
+-- Description: 001 keyed the leads that existed when it ran, and the importer
+-- only sets import_key in on_conflict mode, so leads added since by plain
+-- imports or by the app had no key and later upserts inserted duplicates of
+-- them. A trigger now keys each lead when it is inserted without a key, and
+-- rekeys it when its email or phone number changes, the way the importer
+-- does (e:<email>, else p:<last 10 phone digits>). As in the 001 backfill, a
+-- key another lead of the pipeline already holds is left off rather than
+-- failing the write. Two transactions inserting the same new key at the same
+-- moment can still collide on the unique index.
+
+CREATE OR REPLACE FUNCTION lead_import_key(email TEXT, phone_number TEXT)
+RETURNS TEXT
+LANGUAGE sql IMMUTABLE
+AS $$
+    SELECT CASE
+        WHEN email LIKE '%@%' THEN 'e:' || lower(btrim(email, E' \t\r\n'))
+        WHEN length(regexp_replace(phone_number, '\D', '', 'g')) >= 7
+            THEN 'p:' || right(regexp_replace(phone_number, '\D', '', 'g'), 10)
+    END
+$$;
+
+CREATE OR REPLACE FUNCTION set_lead_import_key()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    new_key TEXT;
+    taken BOOLEAN;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        -- Upserts supply their own key, which is their conflict target
+        IF NEW.import_key IS NOT NULL THEN
+            RETURN NEW;
+        END IF;
+    ELSIF NEW.import_key IS DISTINCT FROM OLD.import_key
+       OR (NEW.email IS NOT DISTINCT FROM OLD.email
+           AND NEW.phone_number IS NOT DISTINCT FROM OLD.phone_number) THEN
+        RETURN NEW;
+    END IF;
+
+    new_key := lead_import_key(NEW.email, NEW.phone_number);
+    IF new_key IS NULL OR new_key IS NOT DISTINCT FROM NEW.import_key THEN
+        RETURN NEW;
+    END IF;
+
+    -- Rows written earlier in the same statement are visible here
+    EXECUTE format(
+        'SELECT EXISTS (SELECT 1 FROM %I.%I WHERE pipeline_id = $1 AND import_key = $2 AND id <> $3)',
+        TG_TABLE_SCHEMA, TG_TABLE_NAME
+    ) INTO taken USING NEW.pipeline_id, new_key, NEW.id;
+
+    IF NOT taken THEN
+        NEW.import_key := new_key;
+    END IF;
+    RETURN NEW;
+END;
+$$;
+
+-- Key the leads written since 001 ran
+WITH keyed AS (
+    SELECT id, pipeline_id, created_at, lead_import_key(email, phone_number) AS import_key
+    FROM leads_ins_info
+    WHERE import_key IS NULL
+),
+ranked AS (
+    SELECT
+        keyed.id,
+        keyed.import_key,
+        row_number() OVER (PARTITION BY keyed.pipeline_id, keyed.import_key ORDER BY keyed.created_at, keyed.id) AS position
+    FROM keyed
+    WHERE keyed.import_key IS NOT NULL
+      AND NOT EXISTS (
+          SELECT 1 FROM leads_ins_info holder
+          WHERE holder.pipeline_id = keyed.pipeline_id AND holder.import_key = keyed.import_key
+      )
+)
+UPDATE leads_ins_info
+SET import_key = ranked.import_key
+FROM ranked
+WHERE leads_ins_info.id = ranked.id
+  AND ranked.position = 1;
+
+DROP TRIGGER IF EXISTS leads_ins_info_import_key ON leads_ins_info;
+CREATE TRIGGER leads_ins_info_import_key
+BEFORE INSERT OR UPDATE OF email, phone_number, import_key ON leads_ins_info
+FOR EACH ROW EXECUTE FUNCTION set_lead_import_key();
@@ -0,0 +1,192 @@
+import asyncio
+import os
+from pathlib import Path
+
+import asyncpg
+import pytest
+
+from checkpoints import COMPLETED, INTERRUPTED, RUNNING, CheckpointConflict, CheckpointStore
+
+MIGRATION = (Path(__file__).resolve().parents[3] / 'supabase' / 'migrations' / '20261018000003_import_jobs.sql').read_text()
+
+OPTIONS = {'field_mapping': {'First': 'first_name'}, 'dedupe': True}
+
+
+def run(database_url, scenario, tmp_path):
+    upload = tmp_path / 'leads.csv'
+    upload.write_text('First\nAnn\nBo\nCy\n')
+
+    async def main():
+        pool = await asyncpg.create_pool(database_url, min_size=1, max_size=4)
+        try:
+            async with pool.acquire() as conn:
+                await conn.execute(MIGRATION)
+                await conn.execute("CREATE TABLE imported (row_number int)")
+            await scenario(pool, str(upload))
+        finally:
+            await pool.close()
+
+    asyncio.run(main())
+
+
+async def commit_chunk(pool, checkpoint, rows):
+    """Insert a chunk and advance the checkpoint past it in one transaction"""
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            await conn.executemany("INSERT INTO imported VALUES ($1)", [(row,) for row in rows])
+            await checkpoint.advance(conn, rows[-1], {'imported': rows[-1]})
+
+
+async def imported_rows(pool):
+    async with pool.acquire() as conn:
+        return [row['row_number'] for row in await conn.fetch("SELECT row_number FROM imported ORDER BY 1")]
+
+
+def test_interrupted_import_resumes_from_its_checkpoint(database_url, tmp_path):
+    async def scenario(pool, upload_path):
+        first = CheckpointStore('csv-import')
+        await first.start(pool)
+        checkpoint = await first.begin('import-1', upload_path, 'leads.csv', OPTIONS)
+        assert (checkpoint.attempt, checkpoint.rows_committed) == (1, 0)
+        await commit_chunk(pool, checkpoint, [1, 2])
+        # Shutdown hands the import back
+        await first.stop()
+
+        second = CheckpointStore('csv-import')
+        await second.start(pool)
+        [resumed] = await second.claim_abandoned()
+        await second.stop()
+
+        assert resumed.import_id == 'import-1'
+        assert resumed.attempt == 2
+        assert resumed.rows_committed == 2
+        assert resumed.counters == {'imported': 2}
+        assert resumed.options == OPTIONS
+
+    run(database_url, scenario, tmp_path)
+
+
+def test_taken_over_attempt_can_no_longer_advance(database_url, tmp_path):
+    async def scenario(pool, upload_path):
+        dead = CheckpointStore('csv-import')
+        await dead.start(pool)
+        stale = await dead.begin('import-1', upload_path, 'leads.csv', OPTIONS)
+        await commit_chunk(pool, stale, [1])
+
+        # Another worker takes over the import its owner stopped touching
+        live = CheckpointStore('csv-import', stale_seconds=0)
+        await live.start(pool)
+        current = await live.begin('import-1', upload_path, 'leads.csv', OPTIONS)
+        assert current.attempt == stale.attempt + 1
+        assert current.rows_committed == 1
+
+        # The old attempt's chunk rolls back with its checkpoint
+        with pytest.raises(CheckpointConflict):
+            await commit_chunk(pool, stale, [2])
+        await commit_chunk(pool, current, [2, 3])
+        assert await imported_rows(pool) == [1, 2, 3]
+
+        # Nor can the old attempt record an outcome over the new one
+        await dead.finish(stale, INTERRUPTED)
+        await live.finish(current, COMPLETED)
+        async with pool.acquire() as conn:
+            row = await conn.fetchrow("SELECT status, attempt, rows_committed FROM import_jobs")
+        assert dict(row) == {'status': COMPLETED, 'attempt': 2, 'rows_committed': 3}
+
+        await dead.stop()
+        await live.stop()
+
+    run(database_url, scenario, tmp_path)
+
+
+def test_running_import_is_not_claimed_twice(database_url, tmp_path):
+    async def scenario(pool, upload_path):
+        owner = CheckpointStore('csv-import')
+        await owner.start(pool)
+        checkpoint = await owner.begin('import-1', upload_path, 'leads.csv', OPTIONS)
+        assert checkpoint.status == RUNNING
+
+        other = CheckpointStore('csv-import')
+        await other.start(pool)
+        with pytest.raises(CheckpointConflict):
+            await other.begin('import-1', upload_path, 'leads.csv', OPTIONS)
+        assert await other.claim_abandoned() == []
+
+        await owner.stop()
+        await other.stop()
+
+    run(database_url, scenario, tmp_path)
+
+
+def test_completed_import_is_returned_without_a_new_attempt(database_url, tmp_path):
+    async def scenario(pool, upload_path):
+        store = CheckpointStore('csv-import')
+        await store.start(pool)
+        checkpoint = await store.begin('import-1', upload_path, 'leads.csv', OPTIONS)
+        await commit_chunk(pool, checkpoint, [1, 2, 3])
+        await store.finish(checkpoint, COMPLETED)
+
+        again = await store.begin('import-1', upload_path, 'leads.csv', OPTIONS)
+        assert (again.status, again.attempt, again.rows_committed) == (COMPLETED, 1, 3)
+        assert 'import-1' not in store.owned
+
+        Path(upload_path).write_text('First\nSomeone else\n')
+        with pytest.raises(ValueError):
+            await store.begin('import-1', upload_path, 'leads.csv', OPTIONS)
+
+        await store.stop()
+
+    run(database_url, scenario, tmp_path)
+
+
+def test_abandoned_import_is_only_claimed_where_its_upload_is_readable(database_url, tmp_path):
+    async def scenario(pool, upload_path):
+        first = CheckpointStore('csv-import', host='worker-a')
+        await first.start(pool)
+        await first.begin('import-1', upload_path, 'leads.csv', OPTIONS)
+        await first.stop()
+
+        # The spooled upload is local to worker-a
+        hidden = upload_path + '.elsewhere'
+        os.rename(upload_path, hidden)
+        other = CheckpointStore('csv-import', host='worker-b')
+        await other.start(pool)
+        assert await other.claim_abandoned() == []
+
+        # Shared storage makes it readable from any host
+        os.rename(hidden, upload_path)
+        [resumed] = await other.claim_abandoned()
+        await other.stop()
+
+        assert resumed.attempt == 2
+        async with pool.acquire() as conn:
+            assert await conn.fetchval("SELECT host FROM import_jobs") == 'worker-b'
+
+    run(database_url, scenario, tmp_path)
+
+
+def test_taken_over_attempt_no_longer_keeps_the_import_alive(database_url, tmp_path):
+    async def scenario(pool, upload_path):
+        dead = CheckpointStore('csv-import')
+        await dead.start(pool)
+        await dead.begin('import-1', upload_path, 'leads.csv', OPTIONS)
+        live = CheckpointStore('csv-import', stale_seconds=0)
+        await live.start(pool)
+        await live.begin('import-1', upload_path, 'leads.csv', OPTIONS)
+
+        async def touched_by(store):
+            async with pool.acquire() as conn:
+                await conn.execute("UPDATE import_jobs SET updated_at = now() - interval '1 hour'")
+                await store.touch()
+                return await conn.fetchval("SELECT updated_at > now() - interval '1 minute' FROM import_jobs")
+
+        assert not await touched_by(dead)
+        assert await touched_by(live)
+
+        await dead.stop()
+        # Nor does the old attempt's shutdown interrupt the new one
+        async with pool.acquire() as conn:
+            assert await conn.fetchval("SELECT status FROM import_jobs") == RUNNING
+        await live.stop()
+
+    run(database_url, scenario, tmp_path)
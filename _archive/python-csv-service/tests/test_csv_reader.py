@@ -0,0 +1,31 @@
+import gzip
+import io
+
+from csv_reader import iter_upload_chunks
+
+FIELD_MAPPING = {'First': 'first_name', 'Phone': 'phone_number'}
+
+CSV_TEXT = 'First,Phone,Notes\n' + ''.join(f'Lead {n},0612 555 {n:04d},x\n' for n in range(11))
+
+
+def test_upload_is_streamed_in_bounded_chunks():
+    chunks = list(iter_upload_chunks(io.BytesIO(CSV_TEXT.encode('utf-8')), FIELD_MAPPING, chunksize=4))
+
+    assert [len(chunk) for _, _, chunk in chunks] == [4, 4, 3]
+    # Row indexes continue across chunks, for "Row N" messages
+    assert [index for _, _, chunk in chunks for index in chunk.index] == list(range(11))
+    # Only mapped columns are parsed, as text that keeps leading zeros
+    _, _, first = chunks[0]
+    assert first.columns.tolist() == ['First', 'Phone']
+    assert first['Phone'].iloc[0] == '0612 555 0000'
+
+
+def test_gzip_upload_streams_the_same_rows():
+    plain = io.BytesIO(CSV_TEXT.encode('utf-8'))
+    packed = io.BytesIO(gzip.compress(CSV_TEXT.encode('utf-8')))
+
+    def rows(stream):
+        return [row for _, _, chunk in iter_upload_chunks(stream, FIELD_MAPPING, chunksize=5)
+                for row in chunk.astype(object).itertuples(index=False)]
+
+    assert rows(packed) == rows(plain)
@@ -0,0 +1,42 @@
+import asyncio
+
+import asyncpg
+
+from database import HOT_STATEMENTS, DatabasePool
+
+SCHEMA_SQL = """
+CREATE TABLE pipeline_statuses (id serial PRIMARY KEY, pipeline_id text, display_order int);
+INSERT INTO pipeline_statuses (pipeline_id, display_order) VALUES ('p1', 2), ('p1', 1);
+"""
+
+PREPARED_COUNT = "SELECT count(*) FROM pg_prepared_statements WHERE statement NOT LIKE '%pg_prepared_statements%'"
+
+
+async def create_schema(database_url):
+    conn = await asyncpg.connect(database_url)
+    try:
+        await conn.execute(SCHEMA_SQL)
+    finally:
+        await conn.close()
+
+
+def test_hot_statements_run_on_every_acquire_without_re_preparing(database_url):
+    async def scenario():
+        pool = DatabasePool("test", database_url, min_size=1, max_size=1)
+        await pool.open()
+        try:
+            prepared = []
+            for _ in range(3):
+                # One connection, released back to the pool between uses
+                async with pool.acquire() as conn:
+                    assert await conn.fetchval_statement('pipeline_default_status', 'p1') == 2
+                    assert await conn.fetchval_statement('column_exists', 'pipeline_statuses', 'pipeline_id')
+                    prepared.append(await conn.fetchval(PREPARED_COUNT))
+        finally:
+            await pool.close()
+
+        # default_insurance_type failed to prepare: there is no insurance_types table
+        assert prepared == [len(HOT_STATEMENTS) - 1] * 3
+
+    asyncio.run(create_schema(database_url))
+    asyncio.run(scenario())
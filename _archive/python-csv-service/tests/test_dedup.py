@@ -0,0 +1,147 @@
+import asyncio
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from dedup import (
+    INSERT, KEY_COLUMNS, SKIP, UNDEFINED_COLUMN, UPDATE, KeySet, LeadDedupIndex,
+    fetch_existing_hashes_postgrest, present_key_hashes
+)
+
+
+def test_key_set_matches_python_set_across_chunks():
+    rng = np.random.default_rng(7)
+    keys = KeySet(rng.integers(0, 5000, 300, dtype=np.uint64), use_bloom=True)
+    expected = set(keys.runs[0].tolist())
+
+    for _ in range(200):
+        chunk = rng.integers(0, 5000, 40, dtype=np.uint64)
+        keys.add(chunk)
+        expected.update(chunk.tolist())
+
+        probe = rng.integers(0, 6000, 100, dtype=np.uint64)
+        assert keys.contains(probe).tolist() == [value in expected for value in probe.tolist()]
+
+    assert len(keys) == len(expected)
+    assert sorted(np.concatenate(keys.runs).tolist()) == sorted(expected)
+
+
+def test_key_set_keeps_logarithmic_runs():
+    keys = KeySet()
+    for start in range(0, 100_000, 100):
+        keys.add(np.arange(start, start + 100, dtype=np.uint64))
+
+    assert len(keys) == 100_000
+    assert len(keys.runs) <= 2 * math.log2(1000) + 1
+    assert all((np.diff(run.astype(np.int64)) > 0).all() for run in keys.runs)
+
+
+def test_key_set_empty():
+    keys = KeySet()
+    keys.add(np.empty(0, dtype=np.uint64))
+    assert len(keys) == 0
+    assert keys.contains(np.array([1, 2], dtype=np.uint64)).tolist() == [False, False]
+
+
+def test_lead_dedup_index_classifies_across_chunks():
+    existing = present_key_hashes(pd.DataFrame([{'email': 'old@example.com'}], columns=KEY_COLUMNS))
+    index = LeadDedupIndex(existing)
+
+    first = index.classify([
+        {'email': 'OLD@example.com '},
+        {'email': 'new@example.com', 'phone_number': '(555) 123-4567'},
+        {'email': 'new@example.com'},
+    ])
+    second = index.classify([
+        {'phone_number': '555-123-4567'},
+        {'email': 'other@example.com'},
+    ])
+
+    assert first.tolist() == [UPDATE, INSERT, SKIP]
+    assert second.tolist() == [SKIP, INSERT]
+
+
+class APIError(Exception):
+    def __init__(self, code):
+        super().__init__(code)
+        self.code = code
+
+
+class LeadsTable:
+    """The query builder calls fetch_existing_hashes_postgrest makes, over a list of rows"""
+
+    def __init__(self, rows, columns):
+        self.rows = rows
+        self.columns = columns
+        self.queries = []
+
+    def table(self, name):
+        self.query = {'filters': []}
+        return self
+
+    def select(self, columns):
+        self.query['select'] = columns.split(',')
+        return self
+
+    def eq(self, column, value):
+        self.query['filters'].append(lambda row: row[column] == value)
+        return self
+
+    def gt(self, column, value):
+        self.query['filters'].append(lambda row: row[column] > value)
+        self.query['after'] = value
+        return self
+
+    def order(self, column):
+        self.query['order'] = column
+        return self
+
+    def limit(self, count):
+        self.query['limit'] = count
+        return self
+
+    def execute(self):
+        self.queries.append(self.query)
+        unknown = set(self.query['select']) - set(self.columns)
+        if unknown:
+            raise APIError(UNDEFINED_COLUMN)
+        rows = sorted((row for row in self.rows if all(f(row) for f in self.query['filters'])),
+                      key=lambda row: row[self.query['order']])
+        page = [{column: row[column] for column in self.query['select']}
+                for row in rows[:self.query['limit']]]
+        return type('Response', (), {'data': page})
+
+
+def test_postgrest_preload_pages_by_id():
+    leads = [{'id': n, 'pipeline_id': 'p1' if n % 3 else 'p2', 'email': f'{n}@x.com', 'phone_number': None,
+              'first_name': 'A', 'last_name': str(n), 'date_of_birth': None} for n in range(25, 0, -1)]
+    client = LeadsTable(leads, ['id', 'pipeline_id'] + KEY_COLUMNS)
+
+    hashes = asyncio.run(fetch_existing_hashes_postgrest(client, 'p1', page_size=4))
+
+    expected = pd.DataFrame([lead for lead in leads if lead['pipeline_id'] == 'p1'], columns=KEY_COLUMNS)
+    assert sorted(hashes.tolist()) == sorted(present_key_hashes(expected).tolist())
+    assert [query.get('after') for query in client.queries] == [None, 5, 11, 17, 23]
+    assert {query['order'] for query in client.queries} == {'id'}
+
+
+def test_postgrest_preload_without_date_of_birth_column():
+    leads = [{'id': 1, 'pipeline_id': 'p1', 'email': 'a@x.com', 'phone_number': None,
+              'first_name': 'A', 'last_name': 'B'}]
+    client = LeadsTable(leads, ['id', 'pipeline_id'] + KEY_COLUMNS[:-1])
+
+    hashes = asyncio.run(fetch_existing_hashes_postgrest(client, 'p1'))
+
+    assert len(hashes) == len(present_key_hashes(pd.DataFrame(leads, columns=KEY_COLUMNS)))
+    assert 'date_of_birth' not in client.queries[-1]['select']
+
+
+def test_postgrest_preload_raises_other_errors():
+    class BrokenClient(LeadsTable):
+        def execute(self):
+            raise APIError('PGRST301')
+
+    with pytest.raises(APIError):
+        asyncio.run(fetch_existing_hashes_postgrest(BrokenClient([], []), 'p1'))
@@ -0,0 +1,101 @@
+import asyncio
+from pathlib import Path
+
+import asyncpg
+
+from dedup import import_keys
+
+MIGRATIONS = Path(__file__).resolve().parent.parent / 'migrations'
+
+LEADS_SQL = """
+    CREATE TABLE leads_ins_info (
+        id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+        pipeline_id text,
+        first_name text,
+        email text,
+        phone_number text,
+        created_at timestamptz DEFAULT now()
+    );
+"""
+
+
+def test_import_keys_prefer_email_then_phone_then_name_and_birth_date():
+    keys = import_keys([
+        {'email': ' Ann@Example.COM ', 'phone_number': '612-555-0100'},
+        {'email': 'not an email', 'phone_number': '+1 (612) 555-0101'},
+        {'first_name': 'Bo', 'last_name': 'Li', 'date_of_birth': '3/4/1990'},
+        {'first_name': 'Cy', 'phone_number': '12345'},
+    ])
+    assert keys == ['e:ann@example.com', 'p:6125550101', 'n:bo|li|1990-03-04', None]
+
+
+def with_migrated_leads(database_url, statements, query):
+    """Apply the import key migrations to existing leads, then run ``statements``"""
+    async def run():
+        conn = await asyncpg.connect(database_url)
+        try:
+            await conn.execute(LEADS_SQL)
+            await conn.execute("""
+                INSERT INTO leads_ins_info (pipeline_id, email, created_at)
+                VALUES ('p1', 'old@example.com', now() - interval '1 day')
+            """)
+            await conn.execute((MIGRATIONS / '001_add_leads_import_key.sql').read_text())
+            # Written between the two migrations, so only 004's backfill keys it
+            await conn.execute("INSERT INTO leads_ins_info (pipeline_id, phone_number) VALUES ('p1', '612 555 0199')")
+            await conn.execute((MIGRATIONS / '004_import_key_trigger.sql').read_text())
+            for statement in statements:
+                await conn.execute(statement)
+            return [tuple(row) for row in await conn.fetch(query)]
+        finally:
+            await conn.close()
+
+    return asyncio.run(run())
+
+
+def test_existing_and_new_leads_are_keyed(database_url):
+    rows = with_migrated_leads(database_url, [
+        "INSERT INTO leads_ins_info (pipeline_id, email) VALUES ('p1', ' New@Example.com')",
+        "INSERT INTO leads_ins_info (pipeline_id, phone_number) VALUES ('p2', '(612) 555-0199')",
+    ], "SELECT pipeline_id, import_key FROM leads_ins_info ORDER BY pipeline_id, import_key")
+
+    assert rows == [
+        ('p1', 'e:new@example.com'),
+        ('p1', 'e:old@example.com'),
+        ('p1', 'p:6125550199'),
+        ('p2', 'p:6125550199'),
+    ]
+
+
+def test_duplicate_leads_are_written_without_a_key(database_url):
+    rows = with_migrated_leads(database_url, [
+        # Same statement, then a later one: neither may fail on the unique index
+        "INSERT INTO leads_ins_info (pipeline_id, email) VALUES ('p1', 'dup@example.com'), ('p1', 'DUP@example.com')",
+        "INSERT INTO leads_ins_info (pipeline_id, email) VALUES ('p1', 'old@example.com')",
+    ], "SELECT email, import_key FROM leads_ins_info WHERE email ILIKE 'dup%' OR email = 'old@example.com' ORDER BY created_at, import_key")
+
+    assert sorted(rows, key=str) == sorted([
+        ('old@example.com', 'e:old@example.com'),
+        ('dup@example.com', 'e:dup@example.com'),
+        ('DUP@example.com', None),
+        ('old@example.com', None),
+    ], key=str)
+
+
+def test_changed_email_rekeys_the_lead(database_url):
+    rows = with_migrated_leads(database_url, [
+        "UPDATE leads_ins_info SET email = 'renamed@example.com' WHERE email = 'old@example.com'",
+        "UPDATE leads_ins_info SET first_name = 'Ann' WHERE email = 'renamed@example.com'",
+    ], "SELECT email, import_key FROM leads_ins_info WHERE email IS NOT NULL")
+
+    assert rows == [('renamed@example.com', 'e:renamed@example.com')]
+
+
+def test_upsert_finds_a_lead_written_by_a_plain_insert(database_url):
+    rows = with_migrated_leads(database_url, [
+        "INSERT INTO leads_ins_info (pipeline_id, email, first_name) VALUES ('p1', 'ann@example.com', 'Ann')",
+        """INSERT INTO leads_ins_info AS lead (pipeline_id, email, first_name, import_key)
+           VALUES ('p1', 'ann@example.com', 'Annie', 'e:ann@example.com')
+           ON CONFLICT (pipeline_id, import_key) DO UPDATE SET first_name = EXCLUDED.first_name""",
+    ], "SELECT first_name FROM leads_ins_info WHERE email = 'ann@example.com'")
+
+    assert rows == [('Annie',)]
@@ -0,0 +1,140 @@
+import asyncio
+import datetime
+import decimal
+
+import asyncpg
+import pytest
+
+from loaders import CopyLoader, conflict_action, last_per_key
+
+LEADS_SQL = """
+    CREATE TABLE leads_ins_info (
+        id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+        pipeline_id text NOT NULL,
+        first_name text,
+        last_name text,
+        email text,
+        premium numeric,
+        specialty_year integer,
+        sold_at timestamptz,
+        sr22 boolean,
+        additional_insureds jsonb,
+        import_key text
+    );
+    CREATE UNIQUE INDEX ON leads_ins_info (pipeline_id, import_key);
+"""
+
+
+def run_upserts(database_url, batches, on_conflict):
+    async def upsert():
+        pool = await asyncpg.create_pool(database_url, min_size=1, max_size=1)
+        try:
+            async with pool.acquire() as conn:
+                await conn.execute(LEADS_SQL)
+            loader = CopyLoader(pool)
+            counts = [await loader.upsert(batch, on_conflict) for batch in batches]
+            async with pool.acquire() as conn:
+                rows = [dict(row) for row in await conn.fetch(
+                    "SELECT * FROM leads_ins_info ORDER BY import_key"
+                )]
+            return counts, rows
+        finally:
+            await pool.close()
+
+    return asyncio.run(upsert())
+
+
+def lead(**fields):
+    return {'pipeline_id': 'p1', 'import_key': 'e:ann@example.com', 'first_name': 'Ann', 'last_name': '', **fields}
+
+
+def test_conflict_action_skip_does_nothing():
+    assert conflict_action(['pipeline_id', 'import_key', 'email'], [], 'skip') == 'DO NOTHING'
+
+
+def test_conflict_action_leaves_conflict_target_alone():
+    action = conflict_action(['pipeline_id', 'import_key', 'email'], [], 'update')
+    assert action.startswith('DO UPDATE SET "email" = ')
+    assert '"import_key" =' not in action and '"pipeline_id" =' not in action
+
+
+def test_conflict_action_merges_only_json_columns():
+    action = conflict_action(['pipeline_id', 'import_key', 'premium', 'additional_insureds'],
+                             ['additional_insureds'], 'merge')
+    premium, insureds = action[len('DO UPDATE SET '):].split(', "additional_insureds" = ')
+    assert 'jsonb_typeof' not in premium and '"premium"::text = \'\'' in premium
+    assert insureds.startswith('CASE WHEN jsonb_typeof(lead."additional_insureds") = \'object\'')
+
+
+def test_last_per_key_keeps_last_record_per_key():
+    records = [{'import_key': 'a', 'n': 1}, {'import_key': None, 'n': 2}, {'import_key': 'a', 'n': 3}]
+    kept, dropped = last_per_key(records)
+    assert kept == [{'import_key': None, 'n': 2}, {'import_key': 'a', 'n': 3}]
+    assert dropped == 1
+
+
+def test_update_upserts_mapped_typed_columns(database_url):
+    # Mapping produces strings for every column, whatever its type
+    first = lead(specialty_year='2018', premium=1200.5, sold_at='2026-01-02T03:04:05+00:00', sr22=True)
+    second = lead(first_name='Annie', specialty_year='2020', email='ann@example.com')
+
+    counts, rows = run_upserts(database_url, [[first], [second]], 'update')
+
+    assert [c['inserted'] for c in counts] == [1, 0]
+    assert [c['updated'] for c in counts] == [0, 1]
+    [row] = rows
+    assert row['specialty_year'] == 2020
+    assert row['first_name'] == 'Annie'
+    assert row['email'] == 'ann@example.com'
+    # Columns the second file leaves out or empty keep their values
+    assert float(row['premium']) == 1200.5
+    assert row['sold_at'].year == 2026
+    assert row['sr22'] is True
+    assert row['last_name'] == ''
+
+
+def test_merge_combines_json_objects(database_url):
+    first = lead(additional_insureds={'a': 1, 'b': 1}, specialty_year='2018')
+    second = lead(additional_insureds={'b': 2, 'c': 3})
+
+    _, [row] = run_upserts(database_url, [[first], [second]], 'merge')
+
+    assert row['additional_insureds'] == '{"a": 1, "b": 2, "c": 3}'
+    assert row['specialty_year'] == 2018
+
+
+def test_skip_leaves_existing_leads(database_url):
+    counts, [row] = run_upserts(database_url, [[lead(specialty_year='2018')], [lead(specialty_year='2020')]], 'skip')
+
+    assert counts[1]['inserted'] == 0 and counts[1]['updated'] == 0
+    assert row['specialty_year'] == 2018
+
+
+# Column, value of the first file, value of the second and the stored result
+TYPED_COLUMNS = [
+    ('email', 'ann@example.com', 'annie@example.com', 'annie@example.com'),
+    ('specialty_year', '2018', '2020', 2020),
+    ('premium', 1200.5, '99.95', decimal.Decimal('99.95')),
+    ('sold_at', '2026-01-02T03:04:05+00:00', '2026-02-03T00:00:00+00:00',
+     datetime.datetime(2026, 2, 3, tzinfo=datetime.timezone.utc)),
+    ('sr22', True, False, False),
+    ('additional_insureds', [{'first_name': 'Bo'}], [{'first_name': 'Cy'}], '[{"first_name": "Cy"}]'),
+]
+
+
+@pytest.mark.parametrize('on_conflict', ['update', 'merge'])
+@pytest.mark.parametrize('column, first, second, expected', TYPED_COLUMNS, ids=[c[0] for c in TYPED_COLUMNS])
+def test_upsert_per_column_type(database_url, on_conflict, column, first, second, expected):
+    # A new value replaces the stored one; a NULL, an omitted column and (for
+    # text, the only type mapping can leave empty) '' keep it
+    batches = [
+        [lead(**{column: first})],
+        [lead(**{column: second})],
+        [lead(**{column: None})],
+        [lead(**{column: ''}) if column == 'email' else lead()],
+    ]
+
+    counts, [row] = run_upserts(database_url, batches, on_conflict)
+
+    assert [c['updated'] for c in counts] == [0, 1, 1, 1]
+    assert row[column] == expected
@@ -0,0 +1,155 @@
+import io
+
+import pandas as pd
+import pytest
+
+from csv_reader import CSV_ENGINES, iter_csv_chunks, read_header, sniff_csv_format, upload_mapping_plans
+from mapping import compile_mapping_plan, map_chunk
+
+BASE_FIELDS = {
+    'pipeline_id': 'p1',
+    'status_id': 's1',
+    'insurance_type_id': 't1',
+    'source': 'Vendor',
+    'import_file_name': 'leads.csv'
+}
+
+FIELD_MAPPING = {
+    'First': 'first_name',
+    'Last': 'last_name',
+    'Email': 'email',
+    'Alt Email': 'email',
+    'Phone': 'phone_number',
+    'Premium': 'premium',
+    'SR22': 'sr22',
+    'D1 First': 'driver_1_first_name',
+    'D1 Last': 'driver_1_last_name',
+    'D1 Military': 'driver_1_military',
+    'D2 First': 'driver_2_first_name',
+    'D2 SR22': 'driver_2_sr22',
+    'Not In File': 'notes',
+}
+
+CSV_TEXT = """First,Last,Email,Alt Email,Phone,Premium,SR22,D1 First,D1 Last,D1 Military,D2 First,D2 SR22,Unmapped
+ Ann ,Lee,ann@x.com,,0612 555 0100,"$1,200.50",Yes,Bob,,true,,yes,x
+,Ng,,ng@x.com,,abc,no,,,,Cy,1,x
+,,nobody@x.com,,,,,Dee,Dee,,,,x
+Eve,,,  ,5551234,-30,TRUE,,,YES,,,x
+Fay,Ray,fay@x.com,fay2@x.com,,.,0,,Gus,no,Hal,,x
+   ,  ,,,,,,,,,,,x
+Ivy,Ko,,,,12.5.1,,Jo,,,,,x
+"""
+
+
+def baseline_process_row(row: pd.Series, field_mapping, pipeline_id, status_id, insurance_type_id,
+                         source, import_file_name):
+    """process_row of the row-by-row import that map_chunk replaced, unchanged"""
+    lead_data = {
+        'pipeline_id': pipeline_id,
+        'status_id': status_id,
+        'insurance_type_id': insurance_type_id,
+        'source': source.strip(),
+        'import_file_name': import_file_name.strip()
+    }
+
+    additional_drivers = []
+
+    for csv_column, crm_field in field_mapping.items():
+        if csv_column not in row.index:
+            continue
+
+        value = row[csv_column]
+
+        if pd.isna(value) or str(value).strip() == '':
+            continue
+
+        value = str(value).strip()
+
+        if crm_field.startswith('driver_'):
+            parts = crm_field.split('_')
+            if len(parts) >= 3:
+                driver_num = int(parts[1])
+                field_name = '_'.join(parts[2:])
+
+                while len(additional_drivers) < driver_num:
+                    additional_drivers.append({})
+
+                if field_name in ['sr22', 'military']:
+                    additional_drivers[driver_num - 1][field_name] = value.lower() in ['yes', 'true', '1']
+                else:
+                    additional_drivers[driver_num - 1][field_name] = value
+        else:
+            if crm_field in ['sr22', 'military']:
+                lead_data[crm_field] = value.lower() in ['yes', 'true', '1']
+            elif crm_field in ['premium', 'auto_premium', 'home_premium', 'specialty_premium']:
+                try:
+                    numeric_value = float(''.join(c for c in value if c.isdigit() or c in '.-'))
+                    lead_data[crm_field] = numeric_value
+                except ValueError:
+                    pass
+            else:
+                lead_data[crm_field] = value
+
+    if additional_drivers:
+        valid_drivers = [d for d in additional_drivers if d.get('first_name') or d.get('last_name')]
+        if valid_drivers:
+            lead_data['additional_insureds'] = valid_drivers
+
+    if not lead_data.get('first_name') and not lead_data.get('last_name'):
+        raise ValueError("Missing both first name and last name")
+
+    if not lead_data.get('first_name'):
+        lead_data['first_name'] = ''
+    if not lead_data.get('last_name'):
+        lead_data['last_name'] = ''
+
+    return lead_data
+
+
+def baseline_import(csv_text):
+    # The baseline parsed the whole upload as text cells too, minus type inference
+    df = pd.read_csv(io.StringIO(csv_text), dtype=str)
+    leads, errors = [], []
+    for index, row in df.iterrows():
+        try:
+            leads.append(baseline_process_row(row, FIELD_MAPPING, **BASE_FIELDS))
+        except Exception as e:
+            errors.append(f"Row {index + 2}: {str(e)}")
+    return leads, errors
+
+
+def chunked_import(csv_text, engine, chunksize):
+    stream = io.BytesIO(csv_text.encode('utf-8'))
+    csv_format = sniff_csv_format(stream)
+    plan = compile_mapping_plan(FIELD_MAPPING, read_header(stream, csv_format))
+    leads, errors = [], []
+    for chunk in iter_csv_chunks(stream, chunksize, csv_format, plan, engine):
+        chunk_leads, chunk_errors = map_chunk(chunk, plan, BASE_FIELDS)
+        leads.extend(chunk_leads)
+        errors.extend(chunk_errors)
+    return leads, errors
+
+
+@pytest.mark.parametrize('engine', CSV_ENGINES)
+@pytest.mark.parametrize('chunksize', [2, 5000])
+def test_map_chunk_matches_the_row_by_row_baseline(engine, chunksize):
+    expected_leads, expected_errors = baseline_import(CSV_TEXT)
+
+    leads, errors = chunked_import(CSV_TEXT, engine, chunksize)
+
+    assert leads == expected_leads
+    assert errors == expected_errors
+    # The fixture covers rejected rows and every converter
+    assert errors == ['Row 4: Missing both first name and last name',
+                      'Row 7: Missing both first name and last name']
+    assert {'premium', 'sr22', 'additional_insureds'} <= set().union(*leads)
+
+
+def test_upload_plans_report_a_header_without_mapped_columns():
+    stream = io.BytesIO(b'Phone Number,Notes\n0612 555 0100,hi\n')
+
+    [(name, plan)] = upload_mapping_plans(stream, {'First': 'first_name', 'Notes': 'notes', 'Last': 'last_name'})
+    assert (name, plan.usecols, plan.missing_columns) == (None, ('Notes',), ('First', 'Last'))
+
+    [(_, plan)] = upload_mapping_plans(stream, {'First': 'first_name', 'Last': 'last_name'})
+    assert (plan.usecols, plan.missing_columns) == ((), ('First', 'Last'))
@@ -2,28 +2,39 @@
 FastAPI endpoints for custom coroutine-based AI orchestration layer
 """
 
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Dict, Any, Optional
 import asyncio
+import json
 import logging
 from datetime import datetime
 
 from ai_service import orchestrator
+from task_results import task_results
 
 logger = logging.getLogger(__name__)
 
 # Pydantic models for API requests
+# priority: 1 (bulk) to 10 (urgent), higher runs first; scheduled_for delays the task
 class LeadAnalysisRequest(BaseModel):
     lead_id: str
     lead_data: Dict[str, Any]
     priority: int = 5
+    scheduled_for: Optional[datetime] = None
 
 class FollowUpRequest(BaseModel):
     lead_id: str
     lead_data: Dict[str, Any]
     context: str = ""
     priority: int = 5
+    scheduled_for: Optional[datetime] = None
+
+# Longest a GET /ai/tasks/{task_id} long poll may wait
+TASK_MAX_WAIT_SECONDS = 60.0
+# Seconds between keepalive comments on an idle task stream
+TASK_STREAM_KEEPALIVE = 15.0
 
 class ScaleRequest(BaseModel):
     agent_type: str  # "lead_analysis" or "follow_up"
@@ -73,12 +84,14 @@ async def analyze_lead(request: LeadAnalysisRequest):
         
         task_id = await orchestrator.analyze_lead(
             lead_data=request.lead_data,
-            priority=request.priority
+            priority=request.priority,
+            scheduled_for=request.scheduled_for
         )
         
         return {
             "status": "success",
             "task_id": task_id,
+            "status_url": f"/ai/tasks/{task_id}",
             "message": "Lead analysis queued successfully",
             "estimated_completion": "30-60 seconds",
             "timestamp": datetime.utcnow().isoformat()
@@ -98,12 +111,14 @@ async def generate_follow_up(request: FollowUpRequest):
         task_id = await orchestrator.generate_follow_up(
             lead_data=request.lead_data,
             context=request.context,
-            priority=request.priority
+            priority=request.priority,
+            scheduled_for=request.scheduled_for
         )
         
         return {
             "status": "success",
             "task_id": task_id,
+            "status_url": f"/ai/tasks/{task_id}",
             "message": "Follow-up generation queued successfully",
             "estimated_completion": "15-30 seconds",
             "timestamp": datetime.utcnow().isoformat()
@@ -113,6 +128,48 @@ async def generate_follow_up(request: FollowUpRequest):
         logger.error(f"Failed to queue follow-up generation: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@ai_router.get("/tasks/{task_id}")
+async def get_task(task_id: str, wait: float = Query(0, ge=0, le=TASK_MAX_WAIT_SECONDS)):
+    """Status and result of a queued task
+
+    With ``wait``, long-polls: returns as soon as the task finishes, or its
+    current status after ``wait`` seconds.
+    """
+    record = await task_results.wait(task_id, wait) if wait else await task_results.lookup(task_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Task not found or expired")
+    return record.to_dict()
+
+@ai_router.get("/tasks/{task_id}/stream")
+async def stream_task(task_id: str):
+    """Server-sent events for a task: its status now and on every change
+
+    Each event is named after the status and carries the task as JSON; the
+    stream ends after the completed or failed event.
+    """
+    record = await task_results.lookup(task_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Task not found or expired")
+
+    async def events():
+        while True:
+            # Taken before reading the record so no transition is missed
+            changed = record.changed
+            yield f"event: {record.status.value}\ndata: {json.dumps(record.to_dict())}\n\n"
+            if record.is_finished:
+                return
+            while not changed.is_set():
+                try:
+                    await asyncio.wait_for(changed.wait(), TASK_STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @ai_router.post("/scale-agents")
 async def scale_agents(request: ScaleRequest):
     """Dynamically scale AI agent pools"""
@@ -192,12 +249,9 @@ async def restart_orchestrator():
     try:
         logger.info("Restarting AI orchestration layer...")
         
-        # Stop current orchestrator
+        # Stop current orchestrator, letting running tasks finish
         await orchestrator.stop()
         
-        # Brief pause
-        await asyncio.sleep(2)
-        
         # Start fresh
         await orchestrator.start()
         
@@ -216,21 +270,27 @@ async def restart_orchestrator():
 async def debug_queue_status():
     """Debug endpoint to inspect queue states"""
     try:
-        queue_info = {}
-        
-        for agent_id, agent in orchestrator.agents.items():
-            if hasattr(agent, 'task_queue'):
-                queue_info[agent_id] = {
-                    "agent_type": agent.agent_type,
-                    "queue_size": agent.task_queue.qsize(),
-                    "status": agent.status.value,
-                    "processed_count": agent.processed_count,
-                    "error_count": agent.error_count
-                }
+        # Agents of a type share one queue, so queue sizes are per type
+        queue_info = {
+            agent_type: {**queue.stats(), "queue_size": queue.qsize()}
+            for agent_type, queue in orchestrator.task_queues.items()
+        }
+        agent_info = {
+            agent_id: {
+                "agent_type": agent.agent_type,
+                "status": agent.status.value,
+                "current_task_id": agent.current_task.id if agent.current_task else None,
+                "in_flight": len(agent.in_flight),
+                "max_concurrent_tasks": agent.max_concurrent_tasks,
+                "processed_count": agent.processed_count,
+                "error_count": agent.error_count
+            }
+            for agent_id, agent in orchestrator.agents.items()
+        }
         
         return {
             "status": "success",
-            "data": queue_info,
+            "data": {"queues": queue_info, "agents": agent_info},
             "timestamp": datetime.utcnow().isoformat()
         }
         
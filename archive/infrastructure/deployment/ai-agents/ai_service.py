@@ -6,16 +6,29 @@ DeepSeek-V3 via DeepInfra with native async agents for horizontal scalability
 import os
 import json
 import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
 from typing import Dict, List, Optional, Any, Callable
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import logging
 from dataclasses import dataclass
 from enum import Enum
 from openai import AsyncOpenAI
 import uuid
 
+from task_results import task_results
+
 logger = logging.getLogger(__name__)
 
+# A failed task is queued again after AGENT_RETRY_DELAY seconds, doubling with
+# each retry up to AGENT_MAX_RETRY_DELAY, until it has used its max_retries
+AGENT_RETRY_DELAY = float(os.getenv("AGENT_RETRY_DELAY", "1"))
+AGENT_MAX_RETRY_DELAY = float(os.getenv("AGENT_MAX_RETRY_DELAY", "60"))
+# Seconds agents get to finish their running tasks when stopped
+AGENT_DRAIN_TIMEOUT = float(os.getenv("AGENT_DRAIN_TIMEOUT", "30"))
+
 class AgentStatus(Enum):
     IDLE = "idle"
     PROCESSING = "processing"
@@ -25,7 +38,11 @@ class AgentStatus(Enum):
 
 @dataclass
 class AgentTask:
-    """Task definition for AI agents"""
+    """Task definition for AI agents
+
+    ``priority`` runs from 1 (bulk backfills) to 10 (urgent); higher runs
+    first. The task is not started before ``scheduled_for`` (UTC).
+    """
     id: str
     agent_type: str
     payload: Dict[str, Any]
@@ -41,14 +58,152 @@ class AgentTask:
         if self.scheduled_for is None:
             self.scheduled_for = datetime.utcnow()
 
+def _timestamp(moment: datetime) -> float:
+    """POSIX time of a datetime, reading naive ones as UTC like datetime.utcnow()"""
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+class AgentTaskQueue:
+    """Pending tasks shared by every agent of one type
+
+    Tasks run highest priority first, oldest first within a priority, and
+    never before their scheduled time. Agents pull from the shared queue
+    whenever they are free, so a task never waits behind a busy agent while
+    another one sits idle.
+
+    Idle agents block in ``get`` without polling. Each queued task wakes one
+    of them, and a single timer wakes one when a scheduled task falls due.
+    """
+
+    def __init__(self):
+        # (-priority, sequence, task) for tasks that are due
+        self._ready: List[tuple] = []
+        # (due timestamp, sequence, task) for tasks scheduled in the future
+        self._scheduled: List[tuple] = []
+        self._sequence = itertools.count()
+        # Futures of the agents blocked in get, oldest first
+        self._getters: deque = deque()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._unfinished = 0
+        self._all_done = asyncio.Event()
+        self._all_done.set()
+
+    def qsize(self) -> int:
+        return len(self._ready) + len(self._scheduled)
+
+    def put_nowait(self, task: AgentTask):
+        sequence = next(self._sequence)
+        due = _timestamp(task.scheduled_for)
+        if due > time.time():
+            heapq.heappush(self._scheduled, (due, sequence, task))
+            if self._scheduled[0][2] is task:
+                self._arm_timer()
+        else:
+            heapq.heappush(self._ready, (-task.priority, sequence, task))
+            self._wakeup_next()
+
+        self._unfinished += 1
+        self._all_done.clear()
+
+    async def put(self, task: AgentTask):
+        self.put_nowait(task)
+
+    def _promote_due(self) -> Optional[float]:
+        """Move scheduled tasks that are due to the ready heap, returning the
+        seconds until the next one is due"""
+        now = time.time()
+        while self._scheduled and self._scheduled[0][0] <= now:
+            _, sequence, task = heapq.heappop(self._scheduled)
+            heapq.heappush(self._ready, (-task.priority, sequence, task))
+        return self._scheduled[0][0] - now if self._scheduled else None
+
+    def _wakeup_next(self):
+        while self._getters:
+            getter = self._getters.popleft()
+            if not getter.done():
+                getter.set_result(None)
+                return
+
+    def _arm_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._scheduled:
+            delay = max(self._scheduled[0][0] - time.time(), 0)
+            self._timer = asyncio.get_running_loop().call_later(delay, self._on_due)
+
+    def _on_due(self):
+        self._timer = None
+        self._promote_due()
+        # stats() may have promoted some of them already
+        for _ in range(len(self._ready)):
+            self._wakeup_next()
+        self._arm_timer()
+
+    async def get(self) -> AgentTask:
+        """Take the most urgent due task, blocking until one is queued or falls due"""
+        while True:
+            self._promote_due()
+            if self._ready:
+                task = heapq.heappop(self._ready)[2]
+                # Wakeups are one per task; pass any left over to the next agent
+                if self._ready:
+                    self._wakeup_next()
+                return task
+
+            getter = asyncio.get_running_loop().create_future()
+            self._getters.append(getter)
+            try:
+                await getter
+            except asyncio.CancelledError:
+                if getter.done() and not getter.cancelled():
+                    # Woken for a task it will not take
+                    self._wakeup_next()
+                else:
+                    try:
+                        self._getters.remove(getter)
+                    except ValueError:
+                        pass
+                raise
+
+    def task_done(self):
+        self._unfinished -= 1
+        if self._unfinished <= 0:
+            self._unfinished = 0
+            self._all_done.set()
+
+    async def join(self):
+        """Wait until every queued task has been taken and marked done"""
+        await self._all_done.wait()
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth for metrics"""
+        self._promote_due()
+        return {
+            "ready": len(self._ready),
+            "scheduled": len(self._scheduled),
+            "highest_priority": -self._ready[0][0] if self._ready else None,
+            "idle_agents": len(self._getters)
+        }
+
 class BaseAIAgent:
     """Base class for custom coroutine-based AI agents"""
 
-    def __init__(self, agent_id: str, agent_type: str):
+    def __init__(self, agent_id: str, agent_type: str, task_queue: Optional[AgentTaskQueue] = None):
         self.agent_id = agent_id
         self.agent_type = agent_type
+        # Shared with the other agents of this type in the orchestrator
+        self.task_queue = task_queue or AgentTaskQueue()
+        # Set to stop taking tasks once the running ones are done
+        self.draining = False
         self.status = AgentStatus.IDLE
         self.current_task: Optional[AgentTask] = None
+        # Tasks this agent is running, by id
+        self.in_flight: Dict[str, AgentTask] = {}
+        self.peak_in_flight = 0
+        self.workers: set = set()
+        self.intake: Optional[asyncio.Future] = None
         self.processed_count = 0
         self.error_count = 0
         self.started_at = datetime.utcnow()
@@ -63,26 +218,111 @@ class BaseAIAgent:
         # Agent-specific configuration
         self.max_concurrent_tasks = int(os.getenv(f"{agent_type.upper()}_MAX_CONCURRENT", "3"))
         self.task_timeout = int(os.getenv(f"{agent_type.upper()}_TIMEOUT", "30"))
+        # A slot per task in flight; LLM calls are network waits, so one
+        # agent coroutine keeps several going at once
+        self.slots = asyncio.Semaphore(self.max_concurrent_tasks)
 
     async def start(self):
-        """Start the agent coroutine"""
+        """Start the agent coroutine
+
+        Takes tasks from the shared queue until cancelled or drained, running
+        up to max_concurrent_tasks at once. A task is only taken once a slot
+        is free, so the agent never holds tasks another agent could start.
+        """
         logger.info(f"Starting AI agent {self.agent_id} ({self.agent_type})")
-        while True:
-            try:
-                await self._agent_loop()
-            except Exception as e:
-                logger.error(f"Agent {self.agent_id} error: {e}")
-                self.error_count += 1
-                await asyncio.sleep(5)  # Brief pause before retry
+        try:
+            while not self.draining:
+                # Waited on through asyncio.wait so drain() can cancel the
+                # intake without cancelling the agent
+                self.intake = asyncio.ensure_future(self._next_task())
+                try:
+                    await asyncio.wait({self.intake})
+                except asyncio.CancelledError:
+                    self.intake.cancel()
+                    raise
+                if self.intake.cancelled():
+                    break
+
+                worker = asyncio.create_task(self._work(self.intake.result()))
+                self.workers.add(worker)
+                worker.add_done_callback(self.workers.discard)
+
+            # Drained: the tasks in flight run to completion
+            while self.workers:
+                await asyncio.wait(set(self.workers))
+            logger.info(f"AI agent {self.agent_id} drained")
+        finally:
+            # Cancelled: tasks in flight are interrupted and queued again
+            workers = list(self.workers)
+            for worker in workers:
+                worker.cancel()
+            if workers:
+                await asyncio.gather(*workers, return_exceptions=True)
+
+    def drain(self):
+        """Stop taking tasks; start returns once those in flight are done"""
+        self.draining = True
+        if self.intake is not None:
+            self.intake.cancel()
+
+    async def _next_task(self) -> AgentTask:
+        await self.slots.acquire()
+        try:
+            return await self.task_queue.get()
+        except BaseException:
+            self.slots.release()
+            raise
 
-    async def _agent_loop(self):
-        """Main agent processing loop - override in subclasses"""
-        await asyncio.sleep(1)  # Base implementation just waits
+    async def _work(self, task: AgentTask):
+        self.in_flight[task.id] = task
+        self.peak_in_flight = max(self.peak_in_flight, len(self.in_flight))
+        try:
+            await self.run_task(task)
+        finally:
+            del self.in_flight[task.id]
+            self.slots.release()
+            self.task_queue.task_done()
+            if self.in_flight:
+                await self._update_status(AgentStatus.PROCESSING, next(iter(self.in_flight.values())))
+            else:
+                await self._update_status(AgentStatus.IDLE)
 
     async def process_task(self, task: AgentTask) -> Dict[str, Any]:
         """Process a task - override in subclasses"""
         raise NotImplementedError("Subclasses must implement process_task")
 
+    async def run_task(self, task: AgentTask) -> Optional[Dict[str, Any]]:
+        """Process a task, recording its outcome in the task result store
+
+        A failed task is queued again with exponential backoff while it has
+        retries left; a task interrupted by cancellation is queued again at once.
+        """
+        await self._update_status(AgentStatus.PROCESSING, task)
+        task_results.start_task(task, self.agent_id)
+        try:
+            result = await self.process_task(task)
+        except asyncio.CancelledError:
+            task_results.requeue(task, "Interrupted by agent shutdown")
+            self.task_queue.put_nowait(task)
+            raise
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            logger.error(f"Agent {self.agent_id} failed task {task.id}: {error}")
+            self.error_count += 1
+            if task.retry_count < task.max_retries:
+                delay = min(AGENT_RETRY_DELAY * 2 ** task.retry_count, AGENT_MAX_RETRY_DELAY)
+                task.retry_count += 1
+                task.scheduled_for = datetime.utcnow() + timedelta(seconds=delay)
+                task_results.requeue(task, error)
+                self.task_queue.put_nowait(task)
+            else:
+                task_results.fail(task, error)
+            return None
+
+        self.processed_count += 1
+        task_results.complete(task, result)
+        return result
+
     async def _update_status(self, status: AgentStatus, task: Optional[AgentTask] = None):
         """Update agent status"""
         self.status = status
@@ -101,45 +341,72 @@ class BaseAIAgent:
             "processed_count": self.processed_count,
             "error_count": self.error_count,
             "uptime_seconds": uptime.total_seconds(),
-            "current_task_id": self.current_task.id if self.current_task else None
+            "current_task_id": self.current_task.id if self.current_task else None,
+            "in_flight": len(self.in_flight),
+            "in_flight_task_ids": list(self.in_flight),
+            "peak_in_flight": self.peak_in_flight,
+            "max_concurrent_tasks": self.max_concurrent_tasks
         }
 
 class LeadAnalysisAgent(BaseAIAgent):
     """Specialized coroutine-based agent for lead quality analysis"""
 
-    def __init__(self, agent_id: str = None):
-        super().__init__(agent_id or f"lead-analysis-{uuid.uuid4().hex[:8]}", "lead_analysis")
-        self.task_queue = asyncio.Queue()
+    def __init__(self, agent_id: str = None, task_queue: Optional[AgentTaskQueue] = None):
+        super().__init__(agent_id or f"lead-analysis-{uuid.uuid4().hex[:8]}", "lead_analysis", task_queue)
+
+        # Leads analyzed per LLM request (1 disables batching), and seconds
+        # the first lead of a batch waits for others to join it
+        self.batch_size = max(int(os.getenv("LEAD_ANALYSIS_BATCH_SIZE", "1")), 1)
+        self.batch_window = float(os.getenv("LEAD_ANALYSIS_BATCH_WINDOW", "0.05"))
+        if self.batch_size > 1:
+            # max_concurrent_tasks then bounds requests, each carrying a batch
+            self.slots = asyncio.Semaphore(self.max_concurrent_tasks * self.batch_size)
+        self.pending_batch: List[tuple] = []
+        self.batch_timer: Optional[asyncio.TimerHandle] = None
+        self.batch_runs: set = set()
+        self.batches_sent = 0
+        self.batched_tasks = 0
+        self.batch_fallbacks = 0
 
-    async def _agent_loop(self):
-        """Process lead analysis tasks from queue"""
-        try:
-            # Wait for task with timeout
-            task = await asyncio.wait_for(self.task_queue.get(), timeout=10.0)
-            await self._update_status(AgentStatus.PROCESSING, task)
-
-            # Process the task
-            result = await self.process_task(task)
-
-            # Mark task as done
-            self.task_queue.task_done()
-            self.processed_count += 1
-            await self._update_status(AgentStatus.IDLE)
-
-            return result
+    async def start(self):
+        """Start the agent coroutine; see BaseAIAgent.start
 
-        except asyncio.TimeoutError:
-            # No tasks available, stay idle
-            await self._update_status(AgentStatus.IDLE)
-            await asyncio.sleep(1)
-        except Exception as e:
-            logger.error(f"Lead analysis agent error: {e}")
-            self.error_count += 1
-            await self._update_status(AgentStatus.ERROR)
-            await asyncio.sleep(5)
+        Batch requests still running when the agent is cancelled are
+        cancelled too, which puts their waiting tasks back on the queue, and
+        none outlives the agent.
+        """
+        try:
+            await super().start()
+        except asyncio.CancelledError:
+            for run in self.batch_runs:
+                run.cancel()
+            raise
+        finally:
+            if self.batch_timer is not None:
+                self.batch_timer.cancel()
+                self.batch_timer = None
+            if self.batch_runs:
+                await asyncio.gather(*self.batch_runs, return_exceptions=True)
+
+    def drain(self):
+        """Stop taking tasks, sending leads waiting for a batch right away"""
+        super().drain()
+        self._flush_batch()
 
     async def process_task(self, task: AgentTask) -> Dict[str, Any]:
-        """Analyze lead quality using DeepSeek-V3"""
+        """Analyze lead quality using DeepSeek-V3, batched with other leads if enabled"""
+        if self.batch_size > 1:
+            future = asyncio.get_running_loop().create_future()
+            self.pending_batch.append((task, future))
+            if len(self.pending_batch) >= self.batch_size:
+                self._flush_batch()
+            elif self.batch_timer is None:
+                self.batch_timer = asyncio.get_running_loop().call_later(self.batch_window, self._flush_batch)
+            return await future
+
+        return await self._analyze_lead(task)
+
+    async def _analyze_lead(self, task: AgentTask) -> Dict[str, Any]:
         lead_data = task.payload.get("lead_data", {})
 
         system_prompt = """You are a CRM AI assistant specializing in lead qualification.
@@ -182,20 +449,168 @@ class LeadAnalysisAgent(BaseAIAgent):
                     "follow_up_timeline": "Within 2-3 business days"
                 }
 
-            return {
-                "task_id": task.id,
-                "lead_id": lead_data.get("id"),
-                "analysis": analysis,
-                "agent_id": self.agent_id,
-                "model_used": self.model,
-                "analyzed_at": datetime.utcnow().isoformat(),
-                "processing_time": (datetime.utcnow() - task.created_at).total_seconds()
-            }
+            return self._analysis_result(task, analysis)
 
         except Exception as e:
             logger.error(f"Lead analysis failed: {e}")
             raise
 
+    def _analysis_result(self, task: AgentTask, analysis: Any, batch_size: int = 1) -> Dict[str, Any]:
+        result = {
+            "task_id": task.id,
+            "lead_id": task.payload.get("lead_data", {}).get("id"),
+            "analysis": analysis,
+            "agent_id": self.agent_id,
+            "model_used": self.model,
+            "analyzed_at": datetime.utcnow().isoformat(),
+            "processing_time": (datetime.utcnow() - task.created_at).total_seconds()
+        }
+        if batch_size > 1:
+            result["batch_size"] = batch_size
+        return result
+
+    def _flush_batch(self):
+        """Send the pending leads off in one request"""
+        if self.batch_timer is not None:
+            self.batch_timer.cancel()
+            self.batch_timer = None
+        # Leads whose task was cancelled while waiting are left out
+        batch = [(task, future) for task, future in self.pending_batch if not future.done()]
+        self.pending_batch = []
+        if batch:
+            run = asyncio.create_task(self._run_batch(batch))
+            self.batch_runs.add(run)
+            run.add_done_callback(self.batch_runs.discard)
+
+    async def _run_batch(self, batch: List[tuple]):
+        """Analyze a batch and hand each waiting task its own result
+
+        Leads the response does not account for are analyzed one by one. An
+        error from the request itself fails every task of the batch, so they
+        retry with backoff instead of multiplying calls to a failing API.
+        """
+        try:
+            await self._analyze_and_resolve(batch)
+        except asyncio.CancelledError:
+            # Waiting tasks see the cancellation and are queued again
+            for _, future in batch:
+                future.cancel()
+            raise
+
+    async def _analyze_and_resolve(self, batch: List[tuple]):
+        tasks = [task for task, _ in batch]
+        if len(tasks) == 1:
+            analyses, fallback = {}, tasks
+        else:
+            try:
+                analyses = await self._analyze_batch(tasks)
+            except Exception as e:
+                logger.error(f"Batch lead analysis failed: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+            fallback = [task for number, task in enumerate(tasks, 1) if number not in analyses]
+            self.batches_sent += 1
+            self.batched_tasks += len(tasks) - len(fallback)
+            if fallback:
+                self.batch_fallbacks += len(fallback)
+                logger.warning(f"Batch response left out {len(fallback)} of {len(tasks)} leads, analyzing them one by one")
+
+        results = {
+            task.id: self._analysis_result(task, analyses[number], len(tasks))
+            for number, task in enumerate(tasks, 1) if number in analyses
+        }
+        if fallback:
+            singles = await asyncio.gather(*(self._analyze_lead(task) for task in fallback), return_exceptions=True)
+            results.update(zip((task.id for task in fallback), singles))
+
+        for task, future in batch:
+            if future.done():
+                continue
+            if isinstance(results[task.id], BaseException):
+                future.set_exception(results[task.id])
+            else:
+                future.set_result(results[task.id])
+
+    async def _analyze_batch(self, tasks: List[AgentTask]) -> Dict[int, Dict[str, Any]]:
+        """Analyses of several leads from one request, by lead number from 1"""
+        system_prompt = """You are a CRM AI assistant specializing in lead qualification.
+        Analyze each lead and provide:
+        1. Lead quality score (1-10)
+        2. Conversion probability (percentage)
+        3. Key strengths and concerns
+        4. Recommended next action
+        5. Suggested follow-up timeline
+
+        Respond with only a JSON array holding one object per lead, with the
+        lead's number in a "lead" field."""
+
+        leads = "\n".join(
+            f"Lead {number}:{self._format_lead_for_analysis(task.payload.get('lead_data', {}))}"
+            for number, task in enumerate(tasks, 1)
+        )
+
+        response = await asyncio.wait_for(
+            self.client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": f"Analyze these {len(tasks)} leads:\n{leads}"}
+                ],
+                temperature=0.3,
+                max_tokens=min(600 * len(tasks), 8000)
+            ),
+            # Output grows with the batch
+            timeout=self.task_timeout * (1 + len(tasks) / 4)
+        )
+        return self._parse_batch_response(response.choices[0].message.content, len(tasks))
+
+    def _parse_batch_response(self, content: Optional[str], size: int) -> Dict[int, Dict[str, Any]]:
+        """Analyses by lead number; unparseable content gives none"""
+        text = (content or "").strip()
+        if text.startswith("```"):
+            # Drop the code fence and its language tag
+            text = text.strip("`")
+            text = text.split("\n", 1)[1] if "\n" in text else ""
+        try:
+            parsed = json.loads(text)
+        except json.JSONDecodeError:
+            return {}
+
+        if isinstance(parsed, dict):
+            # {"leads": [...]} and the like
+            arrays = [value for value in parsed.values() if isinstance(value, list)]
+            parsed = arrays[0] if len(arrays) == 1 else []
+        if not isinstance(parsed, list):
+            return {}
+
+        analyses = {}
+        for item in parsed:
+            if not isinstance(item, dict):
+                continue
+            analysis = dict(item)
+            try:
+                number = int(analysis.pop("lead"))
+            except (KeyError, TypeError, ValueError):
+                continue
+            if 1 <= number <= size:
+                analyses.setdefault(number, analysis)
+        return analyses
+
+    def get_metrics(self) -> Dict[str, Any]:
+        metrics = super().get_metrics()
+        if self.batch_size > 1:
+            metrics["batching"] = {
+                "batch_size": self.batch_size,
+                "window_seconds": self.batch_window,
+                "pending": len(self.pending_batch),
+                "batches_sent": self.batches_sent,
+                "batched_tasks": self.batched_tasks,
+                "fallbacks": self.batch_fallbacks
+            }
+        return metrics
+
     def _format_lead_for_analysis(self, lead_data: Dict) -> str:
         """Format lead data for AI analysis"""
         return f"""
@@ -211,15 +626,18 @@ class LeadAnalysisAgent(BaseAIAgent):
         Created: {lead_data.get('created_at', 'Unknown')}
         """
 
-    async def queue_analysis(self, lead_data: Dict, priority: int = 5) -> str:
+    async def queue_analysis(self, lead_data: Dict, priority: int = 5,
+                             scheduled_for: Optional[datetime] = None) -> str:
         """Queue a lead for analysis"""
         task = AgentTask(
             id=f"analysis-{uuid.uuid4().hex[:8]}",
             agent_type=self.agent_type,
             payload={"lead_data": lead_data},
-            priority=priority
+            priority=priority,
+            scheduled_for=scheduled_for
         )
 
+        task_results.register(task)
         await self.task_queue.put(task)
         logger.info(f"Queued lead analysis task {task.id}")
         return task.id
@@ -227,32 +645,8 @@ class LeadAnalysisAgent(BaseAIAgent):
 class FollowUpAgent(BaseAIAgent):
     """Specialized coroutine-based agent for follow-up message generation"""
 
-    def __init__(self, agent_id: str = None):
-        super().__init__(agent_id or f"follow-up-{uuid.uuid4().hex[:8]}", "follow_up")
-        self.task_queue = asyncio.Queue()
-
-    async def _agent_loop(self):
-        """Process follow-up generation tasks from queue"""
-        try:
-            task = await asyncio.wait_for(self.task_queue.get(), timeout=10.0)
-            await self._update_status(AgentStatus.PROCESSING, task)
-
-            result = await self.process_task(task)
-
-            self.task_queue.task_done()
-            self.processed_count += 1
-            await self._update_status(AgentStatus.IDLE)
-
-            return result
-
-        except asyncio.TimeoutError:
-            await self._update_status(AgentStatus.IDLE)
-            await asyncio.sleep(1)
-        except Exception as e:
-            logger.error(f"Follow-up agent error: {e}")
-            self.error_count += 1
-            await self._update_status(AgentStatus.ERROR)
-            await asyncio.sleep(5)
+    def __init__(self, agent_id: str = None, task_queue: Optional[AgentTaskQueue] = None):
+        super().__init__(agent_id or f"follow-up-{uuid.uuid4().hex[:8]}", "follow_up", task_queue)
 
     async def process_task(self, task: AgentTask) -> Dict[str, Any]:
         """Generate personalized follow-up messages"""
@@ -319,15 +713,18 @@ class FollowUpAgent(BaseAIAgent):
         Goal: Schedule consultation call
         """
 
-    async def queue_follow_up(self, lead_data: Dict, context: str = "", priority: int = 5) -> str:
+    async def queue_follow_up(self, lead_data: Dict, context: str = "", priority: int = 5,
+                              scheduled_for: Optional[datetime] = None) -> str:
         """Queue a follow-up message generation"""
         task = AgentTask(
             id=f"follow-up-{uuid.uuid4().hex[:8]}",
             agent_type=self.agent_type,
             payload={"lead_data": lead_data, "context": context},
-            priority=priority
+            priority=priority,
+            scheduled_for=scheduled_for
         )
 
+        task_results.register(task)
         await self.task_queue.put(task)
         logger.info(f"Queued follow-up generation task {task.id}")
         return task.id
@@ -345,6 +742,13 @@ class AIOrchestrator:
         self.lead_analysis_agents = []
         self.follow_up_agents = []
 
+        # One queue per agent type, shared by its agents; queued tasks
+        # survive a restart of the orchestrator
+        self.task_queues: Dict[str, AgentTaskQueue] = {
+            "lead_analysis": AgentTaskQueue(),
+            "follow_up": AgentTaskQueue()
+        }
+
         # Configuration
         self.max_lead_analysis_agents = int(os.getenv("MAX_LEAD_ANALYSIS_AGENTS", "3"))
         self.max_follow_up_agents = int(os.getenv("MAX_FOLLOW_UP_AGENTS", "2"))
@@ -359,7 +763,7 @@ class AIOrchestrator:
 
         # Start lead analysis agents
         for i in range(self.max_lead_analysis_agents):
-            agent = LeadAnalysisAgent(f"lead-analysis-{i}")
+            agent = LeadAnalysisAgent(f"lead-analysis-{i}", self.task_queues["lead_analysis"])
             self.lead_analysis_agents.append(agent)
             self.agents[agent.agent_id] = agent
 
@@ -369,7 +773,7 @@ class AIOrchestrator:
 
         # Start follow-up agents
         for i in range(self.max_follow_up_agents):
-            agent = FollowUpAgent(f"follow-up-{i}")
+            agent = FollowUpAgent(f"follow-up-{i}", self.task_queues["follow_up"])
             self.follow_up_agents.append(agent)
             self.agents[agent.agent_id] = agent
 
@@ -379,20 +783,19 @@ class AIOrchestrator:
 
         logger.info(f"Started {len(self.agents)} AI agents")
 
-    async def stop(self):
-        """Stop all AI agents"""
+    async def stop(self, drain_timeout: float = AGENT_DRAIN_TIMEOUT):
+        """Stop all AI agents
+
+        Running tasks get ``drain_timeout`` seconds to finish; queued tasks
+        stay in the shared queues for the next start.
+        """
         if not self.is_running:
             return
 
         logger.info("Stopping AI Orchestration Layer")
         self.is_running = False
 
-        # Cancel all agent tasks
-        for task in self.agent_tasks.values():
-            task.cancel()
-
-        # Wait for tasks to complete
-        await asyncio.gather(*self.agent_tasks.values(), return_exceptions=True)
+        await self._drain(list(self.agents.values()), drain_timeout)
 
         self.agents.clear()
         self.agent_tasks.clear()
@@ -401,23 +804,52 @@ class AIOrchestrator:
 
         logger.info("AI Orchestration Layer stopped")
 
-    async def analyze_lead(self, lead_data: Dict, priority: int = 5) -> str:
-        """Queue lead for analysis with load balancing"""
+    async def _drain(self, agents: List[BaseAIAgent], timeout: float):
+        """Stop agents as soon as the tasks they are running are done
+
+        Idle agents stop right away, and agents still busy after ``timeout``
+        seconds are cancelled, which puts their tasks back on the queue.
+        """
+        agent_tasks = []
+        for agent in agents:
+            agent.drain()
+            agent_task = self.agent_tasks.pop(agent.agent_id, None)
+            if agent_task is not None:
+                agent_tasks.append(agent_task)
+
+        if not agent_tasks:
+            return
+        _, busy = await asyncio.wait(agent_tasks, timeout=timeout)
+        if busy:
+            logger.warning(f"Cancelling {len(busy)} AI agents still busy after {timeout}s")
+            for agent_task in busy:
+                agent_task.cancel()
+        await asyncio.gather(*agent_tasks, return_exceptions=True)
+
+    async def analyze_lead(self, lead_data: Dict, priority: int = 5,
+                           scheduled_for: Optional[datetime] = None) -> str:
+        """Queue lead for analysis on the shared lead analysis queue"""
         if not self.lead_analysis_agents:
             raise RuntimeError("No lead analysis agents available")
 
-        # Simple round-robin load balancing
-        agent = min(self.lead_analysis_agents, key=lambda a: a.task_queue.qsize())
-        return await agent.queue_analysis(lead_data, priority)
+        # Any agent will do: they all queue to, and take from, the shared queue
+        return await self.lead_analysis_agents[0].queue_analysis(lead_data, priority, scheduled_for)
 
-    async def generate_follow_up(self, lead_data: Dict, context: str = "", priority: int = 5) -> str:
-        """Queue follow-up generation with load balancing"""
+    async def generate_follow_up(self, lead_data: Dict, context: str = "", priority: int = 5,
+                                 scheduled_for: Optional[datetime] = None) -> str:
+        """Queue follow-up generation on the shared follow-up queue"""
         if not self.follow_up_agents:
             raise RuntimeError("No follow-up agents available")
 
-        # Simple round-robin load balancing
-        agent = min(self.follow_up_agents, key=lambda a: a.task_queue.qsize())
-        return await agent.queue_follow_up(lead_data, context, priority)
+        return await self.follow_up_agents[0].queue_follow_up(lead_data, context, priority, scheduled_for)
+
+    async def wait_for_result(self, task_id: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Await the result of a queued task in process
+
+        Raises TaskFailed if the task failed, KeyError if it is unknown and
+        asyncio.TimeoutError after ``timeout`` seconds.
+        """
+        return await task_results.result(task_id, timeout)
 
     def get_system_metrics(self) -> Dict[str, Any]:
         """Get comprehensive system metrics"""
@@ -434,9 +866,17 @@ class AIOrchestrator:
             "error_rate": total_errors / max(total_processed, 1),
             "agent_metrics": agent_metrics,
             "queue_sizes": {
-                "lead_analysis": sum(agent.task_queue.qsize() for agent in self.lead_analysis_agents),
-                "follow_up": sum(agent.task_queue.qsize() for agent in self.follow_up_agents)
+                agent_type: queue.qsize() for agent_type, queue in self.task_queues.items()
+            },
+            "queues": {
+                agent_type: queue.stats() for agent_type, queue in self.task_queues.items()
             },
+            "in_flight": {
+                agent_type: sum(len(agent.in_flight) for agent in agents)
+                for agent_type, agents in (("lead_analysis", self.lead_analysis_agents),
+                                           ("follow_up", self.follow_up_agents))
+            },
+            "task_results": task_results.stats(),
             "timestamp": datetime.utcnow().isoformat()
         }
 
@@ -456,7 +896,7 @@ class AIOrchestrator:
         if target_count > current_count:
             # Scale up
             for i in range(current_count, target_count):
-                agent = agent_class(f"{agent_type}-{i}")
+                agent = agent_class(f"{agent_type}-{i}", self.task_queues[agent_type])
                 current_agents.append(agent)
                 self.agents[agent.agent_id] = agent
 
@@ -471,17 +911,15 @@ class AIOrchestrator:
             agents_to_remove = current_agents[target_count:]
 
             for agent in agents_to_remove:
-                # Cancel agent task
-                if agent.agent_id in self.agent_tasks:
-                    self.agent_tasks[agent.agent_id].cancel()
-                    del self.agent_tasks[agent.agent_id]
-
                 # Remove from tracking
                 if agent.agent_id in self.agents:
                     del self.agents[agent.agent_id]
 
                 current_agents.remove(agent)
 
+            # Removed agents finish their current task first
+            await self._drain(agents_to_remove, AGENT_DRAIN_TIMEOUT)
+
             logger.info(f"Scaled down {agent_type} agents from {current_count} to {target_count}")
 
 # Global orchestrator instance
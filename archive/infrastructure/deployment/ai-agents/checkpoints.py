@@ -0,0 +1,279 @@
+# Shared by the csv import and ai-agents services. The source of truth is
+# archive/infrastructure/deployment/shared/; each service keeps a vendored copy
+# refreshed by shared/sync.py, so edit the shared file, not a copy
+"""
+Import checkpoints
+Progress of chunked lead imports kept in the import_jobs table. Each chunk's
+checkpoint is written in the transaction that inserts its rows, so an import
+cut off by a crash, deploy or timeout resumes after its last committed chunk
+without inserting any row twice
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import socket
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Running imports whose row has not been touched for this long are taken to
+# be abandoned by a dead worker and may be claimed by another one
+IMPORT_STALE_SECONDS = float(os.getenv("IMPORT_STALE_SECONDS", "60"))
+# The owning process touches its imports several times per stale period
+HEARTBEAT_INTERVAL = IMPORT_STALE_SECONDS / 3
+# Identity of this worker's host, recorded on the imports it claims. Spooled
+# uploads are local files, so only their host (or one that can reach the file
+# through shared storage) resumes an import. Set it to something stable, such
+# as a StatefulSet pod name, where hostnames change between deploys
+IMPORT_HOST = os.getenv("IMPORT_HOST") or socket.gethostname()
+
+RUNNING = 'running'
+INTERRUPTED = 'interrupted'
+COMPLETED = 'completed'
+FAILED = 'failed'
+
+
+# The (import id, attempt) pairs in self.owned, passed as two arrays
+OWNED_ATTEMPTS = "unnest($1::text[], $2::int[]) AS o(id, attempt)"
+
+
+class CheckpointConflict(Exception):
+    """The import is held by another worker, or was taken over from this one"""
+
+
+def file_sha256(path: str) -> str:
+    """Hex SHA-256 of a file, read in 1 MB blocks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@dataclass
+class Checkpoint:
+    """One attempt at an import and its last committed position"""
+    import_id: str
+    attempt: int
+    status: str
+    file_name: Optional[str]
+    upload_path: Optional[str]
+    options: Dict[str, Any]
+    rows_committed: int = 0
+    counters: Dict[str, int] = field(default_factory=dict)
+
+    @classmethod
+    def from_row(cls, row) -> "Checkpoint":
+        return cls(
+            import_id=row['id'],
+            attempt=row['attempt'],
+            status=row['status'],
+            file_name=row['file_name'],
+            upload_path=row['upload_path'],
+            options=json.loads(row['options']),
+            rows_committed=row['rows_committed'],
+            counters=json.loads(row['counters'])
+        )
+
+    async def advance(self, conn, rows_committed: int, counters: Dict[str, int]):
+        """Move the checkpoint past ``rows_committed`` source rows
+
+        Must run inside the transaction that wrote those rows: if another
+        worker has claimed the import since, it raises and the rows roll back.
+        """
+        updated = await conn.fetchval(
+            "UPDATE import_jobs SET rows_committed = $3, counters = $4::jsonb, updated_at = now() "
+            "WHERE id = $1 AND attempt = $2 AND status = 'running' RETURNING id",
+            self.import_id, self.attempt, rows_committed, json.dumps(counters)
+        )
+        if updated is None:
+            raise CheckpointConflict(f"Import {self.import_id} was taken over by another worker")
+        self.rows_committed = rows_committed
+        self.counters = counters
+
+
+class CheckpointStore:
+    """import_jobs rows of one service, and the heartbeat that keeps this
+    process's claims on them fresh
+
+    Disabled (``enabled`` is False) until started with a pool on a database
+    that has the table.
+    """
+
+    def __init__(self, service: str, stale_seconds: float = IMPORT_STALE_SECONDS, host: str = IMPORT_HOST):
+        self.service = service
+        self.stale_seconds = stale_seconds
+        self.host = host
+        self.pool = None
+        # Import id -> attempt, for the imports this process is working on
+        self.owned: Dict[str, int] = {}
+        self.heartbeat_task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.pool is not None
+
+    async def start(self, pool):
+        """Enable checkpoints if import_jobs exists (supabase/migrations/20261018000003_import_jobs.sql)"""
+        async with pool.acquire() as conn:
+            if await conn.fetchval("SELECT to_regclass('import_jobs')") is None:
+                logger.warning("import_jobs table not found, imports will not be resumable")
+                return
+
+        self.pool = pool
+        if self.heartbeat_task is None:
+            self.heartbeat_task = asyncio.create_task(self._heartbeat())
+
+    async def stop(self):
+        """Stop the heartbeat and hand this process's imports back as interrupted"""
+        if self.heartbeat_task is not None:
+            self.heartbeat_task.cancel()
+            try:
+                await self.heartbeat_task
+            except asyncio.CancelledError:
+                pass
+            self.heartbeat_task = None
+
+        if self.pool is not None and self.owned:
+            try:
+                async with self.pool.acquire() as conn:
+                    await conn.execute(
+                        "UPDATE import_jobs AS j SET status = 'interrupted', updated_at = now() "
+                        f"FROM {OWNED_ATTEMPTS} WHERE j.id = o.id AND j.attempt = o.attempt "
+                        "AND j.status = 'running'",
+                        list(self.owned), list(self.owned.values())
+                    )
+                logger.info(f"Interrupted {len(self.owned)} imports for resumption")
+            except Exception as e:
+                logger.warning(f"Could not mark imports interrupted: {e}")
+        self.owned.clear()
+        self.pool = None
+
+    async def begin(self, import_id: str, upload_path: str, file_name: Optional[str],
+                    options: Dict[str, Any]) -> Checkpoint:
+        """Register a new import, or claim an earlier attempt at the same file
+
+        A claimed attempt keeps its checkpoint, counters and options. An import
+        that already completed is returned as is, without being claimed.
+        Raises CheckpointConflict while another worker holds the import, and
+        ValueError if the id belongs to a different file or service.
+        """
+        sha256 = await asyncio.to_thread(file_sha256, upload_path)
+        async with self.pool.acquire() as conn:
+            row = await conn.fetchrow(
+                "INSERT INTO import_jobs (id, service, host, file_name, file_sha256, upload_path, options) "
+                "VALUES ($1, $2, $3, $4, $5, $6, $7::jsonb) ON CONFLICT (id) DO NOTHING RETURNING *",
+                import_id, self.service, self.host, file_name, sha256, upload_path, json.dumps(options)
+            )
+            if row is None:
+                existing = await conn.fetchrow(
+                    "SELECT service, file_sha256 FROM import_jobs WHERE id = $1", import_id
+                )
+                if existing['service'] != self.service or existing['file_sha256'] != sha256:
+                    raise ValueError(f"Import {import_id} was started with a different file")
+
+                # Failed and interrupted attempts can be retried at once,
+                # running ones only once their owner stopped touching them
+                row = await conn.fetchrow(
+                    """
+                    UPDATE import_jobs SET status = 'running', attempt = attempt + 1, host = $4,
+                                           upload_path = $2, error = NULL, finished_at = NULL,
+                                           updated_at = now()
+                    WHERE id = $1 AND (
+                        status IN ('interrupted', 'failed')
+                        OR (status = 'running' AND updated_at < now() - make_interval(secs => $3))
+                    )
+                    RETURNING *
+                    """,
+                    import_id, upload_path, self.stale_seconds, self.host
+                )
+                if row is None:
+                    row = await conn.fetchrow("SELECT * FROM import_jobs WHERE id = $1", import_id)
+                    if row['status'] != COMPLETED:
+                        raise CheckpointConflict(f"Import {import_id} is already running")
+                    return Checkpoint.from_row(row)
+
+        checkpoint = Checkpoint.from_row(row)
+        self.owned[import_id] = checkpoint.attempt
+        return checkpoint
+
+    async def claim_abandoned(self) -> List[Checkpoint]:
+        """Claim this service's interrupted imports and those whose worker died
+
+        Only imports started on this host, or whose spooled upload this host
+        can reach, are claimed; the rest wait for a worker that can read them.
+        Failed imports are left alone; only a new request can retry them.
+        """
+        abandoned = (
+            "service = $1 AND upload_path IS NOT NULL AND ("
+            "status = 'interrupted' "
+            "OR (status = 'running' AND updated_at < now() - make_interval(secs => $2)))"
+        )
+        async with self.pool.acquire() as conn:
+            candidates = await conn.fetch(
+                f"SELECT id, host, upload_path FROM import_jobs WHERE {abandoned}",
+                self.service, self.stale_seconds
+            )
+            reachable = [
+                row['id'] for row in candidates
+                if row['host'] == self.host or await asyncio.to_thread(os.path.exists, row['upload_path'])
+            ]
+            if not reachable:
+                return []
+
+            rows = await conn.fetch(
+                f"""
+                UPDATE import_jobs SET status = 'running', attempt = attempt + 1, host = $4, updated_at = now()
+                WHERE id IN (
+                    SELECT id FROM import_jobs
+                    WHERE id = ANY($3::text[]) AND {abandoned}
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING *
+                """,
+                self.service, self.stale_seconds, reachable, self.host
+            )
+
+        checkpoints = [Checkpoint.from_row(row) for row in rows]
+        for checkpoint in checkpoints:
+            self.owned[checkpoint.import_id] = checkpoint.attempt
+        return checkpoints
+
+    async def finish(self, checkpoint: Checkpoint, status: str, error: Optional[str] = None):
+        """Record the outcome of this process's attempt at an import"""
+        self.owned.pop(checkpoint.import_id, None)
+        async with self.pool.acquire() as conn:
+            await conn.execute(
+                "UPDATE import_jobs SET status = $3, error = $4, upload_path = NULL, "
+                "finished_at = now(), updated_at = now() WHERE id = $1 AND attempt = $2",
+                checkpoint.import_id, checkpoint.attempt, status, error
+            )
+        checkpoint.status = status
+
+    async def touch(self):
+        """Mark the import attempts this process still holds as alive
+
+        Only those attempts: once another worker has claimed an import, this
+        one must not keep it looking alive.
+        """
+        if not self.owned:
+            return
+        async with self.pool.acquire() as conn:
+            await conn.execute(
+                f"UPDATE import_jobs AS j SET updated_at = now() FROM {OWNED_ATTEMPTS} "
+                "WHERE j.id = o.id AND j.attempt = o.attempt AND j.status = 'running'",
+                list(self.owned), list(self.owned.values())
+            )
+
+    async def _heartbeat(self):
+        """Touch the imports this process holds so no other worker claims them"""
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            try:
+                await self.touch()
+            except Exception as e:
+                logger.warning(f"Import heartbeat failed: {e}")
@@ -0,0 +1,171 @@
+"""
+Column-level lead cleaning
+Normalizes whole CSV columns at once (emails, E.164 phone numbers, names) and
+reports the rows that fail validation as a mask instead of cleaning cell by cell
+"""
+
+import os
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Country code for numbers written without one; national numbers are
+# assumed to be NANP-style (10 digits, optional leading country code)
+DEFAULT_PHONE_COUNTRY_CODE = os.getenv("DEFAULT_PHONE_COUNTRY_CODE", "1")
+NATIONAL_NUMBER_LENGTH = 10
+
+# Practical RFC 5322 subset: dot-atom local part, dotted domain with a TLD.
+# Non-ASCII characters are allowed (RFC 6531); the range is spelled out
+# because \w is ASCII-only in the regex engine of Arrow string columns.
+_EMAIL_LETTER = "a-z0-9\u0080-\U0010ffff"
+_EMAIL_ATOM = f"[{_EMAIL_LETTER}!#$%&'*+/=?^_`{{|}}~-]+"
+_EMAIL_LABEL = f"[{_EMAIL_LETTER}](?:[{_EMAIL_LETTER}-]{{0,61}}[{_EMAIL_LETTER}])?"
+EMAIL_PATTERN = f"^{_EMAIL_ATOM}(?:\\.{_EMAIL_ATOM})*@(?:{_EMAIL_LABEL}\\.)+[a-z\u0080-\U0010ffff]{{2,63}}$"
+# Trailing extensions such as "x123" or "ext. 123" are not part of E.164
+PHONE_EXTENSION_PATTERN = r"(?i)\s*(?:ext\.?|extension|x|#)\s*\d+\s*$"
+# E.164: "+", a country code not starting with 0, at most 15 digits in total
+E164_PATTERN = r"^\+[1-9]\d{7,14}$"
+
+# Fields that are left empty when their value fails validation; the rest of
+# the row is still imported, with the reason as a warning
+DROPPED_VALUE_REASONS = {
+    'email': "Invalid email address",
+    'phone_number': "Invalid phone number",
+}
+# A row needs at least one of these to identify the lead
+IDENTITY_FIELDS = ('first_name', 'last_name', 'email', 'phone_number')
+MISSING_IDENTITY = "Missing name, email and phone number"
+
+def clean_text(column: pd.Series) -> pd.Series:
+    """Strip a column to text, keeping only the non-empty cells"""
+    text = column.dropna()
+    # Arrow string columns (pyarrow engine) already hold text; keep them in Arrow
+    if not isinstance(text.dtype, pd.ArrowDtype):
+        text = text.astype(str)
+    text = text.str.strip()
+    return text[text != '']
+
+
+def normalize_email(text: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    """Lowercase emails; returns the values and a mask of invalid ones"""
+    email = text.str.lower()
+    return email, ~email.str.match(EMAIL_PATTERN)
+
+
+def normalize_phone(text: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    """Normalize phone numbers to E.164; returns the values and a mask of
+    numbers that cannot be normalized"""
+    number = text.str.replace(PHONE_EXTENSION_PATTERN, '', regex=True)
+    digits = number.str.replace(r'\D', '', regex=True)
+
+    # "+44 20 ..." and "0044 20 ..." already carry their country code
+    international = number.str.match(r'^\s*(?:\+|00)')
+    digits = digits.where(~number.str.match(r'^\s*00'), digits.str[2:])
+
+    national = digits.str.len() == NATIONAL_NUMBER_LENGTH
+    prefixed = (digits.str.len() == NATIONAL_NUMBER_LENGTH + len(DEFAULT_PHONE_COUNTRY_CODE)) \
+        & digits.str.startswith(DEFAULT_PHONE_COUNTRY_CODE)
+
+    e164 = pd.Series(
+        np.select(
+            [international.to_numpy(), national.to_numpy(), prefixed.to_numpy()],
+            ['+' + digits, '+' + DEFAULT_PHONE_COUNTRY_CODE + digits, '+' + digits],
+            default=''
+        ),
+        index=text.index,
+        dtype=object
+    )
+    return e164, ~e164.str.match(E164_PATTERN)
+
+
+def normalize_name(text: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    """Title-case names; names are never rejected"""
+    return text.str.title(), pd.Series(False, index=text.index)
+
+
+def _keep_text(text: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    return text, pd.Series(False, index=text.index)
+
+
+CLEANERS: Dict[str, Callable[[pd.Series], Tuple[pd.Series, pd.Series]]] = {
+    'email': normalize_email,
+    'phone_number': normalize_phone,
+    'first_name': normalize_name,
+    'last_name': normalize_name,
+}
+
+
+def _row_messages(flags: pd.DataFrame, rows: pd.Series) -> List[str]:
+    """"Row N:" messages naming the flagged columns of the given rows"""
+    # Only these rows are walked in Python, to word their messages
+    return [
+        f"Row {index + 2}: " + '; '.join(flags.columns[row_flags])
+        for index, row_flags in zip(flags.index[rows.to_numpy()], flags[rows].to_numpy())
+    ]
+
+
+def clean_frame(frame: pd.DataFrame,
+                field_mapping: Dict[str, str]) -> Tuple[Dict[str, pd.Series], pd.Series, List[str], List[str]]:
+    """Map and clean a parsed CSV frame column by column
+
+    Returns the cleaned, sparse CRM field columns, a mask of rejected rows,
+    "Row N:" messages for them, and "Row N:" warnings for imported rows that
+    lost an invalid value. An invalid email or phone number is dropped; a
+    row is only rejected when nothing valid is left to identify the lead.
+    """
+    # Combine the raw text first: a later CSV column wins wherever it has a value
+    texts: Dict[str, pd.Series] = {}
+    for csv_col, crm_field in field_mapping.items():
+        if csv_col not in frame.columns:
+            continue
+        text = clean_text(frame[csv_col])
+        texts[crm_field] = text.combine_first(texts[crm_field]) if crm_field in texts else text
+
+    fields: Dict[str, pd.Series] = {}
+    invalid_by_reason: Dict[str, pd.Series] = {}
+    dropped_by_reason: Dict[str, pd.Series] = {}
+
+    for crm_field, text in texts.items():
+        values, invalid = CLEANERS.get(crm_field, _keep_text)(text)
+        if invalid.any():
+            values = values[~invalid]
+            dropped_by_reason[DROPPED_VALUE_REASONS[crm_field]] = invalid.reindex(frame.index, fill_value=False)
+        fields[crm_field] = values
+
+    identified = pd.Series(False, index=frame.index)
+    for crm_field in IDENTITY_FIELDS:
+        if crm_field in fields:
+            identified |= frame.index.isin(fields[crm_field].index)
+    if not identified.all():
+        invalid_by_reason[MISSING_IDENTITY] = ~identified
+
+    invalid = pd.DataFrame(invalid_by_reason, index=frame.index, dtype=bool)
+    rejected = invalid.any(axis=1)
+    dropped = pd.DataFrame(dropped_by_reason, index=frame.index, dtype=bool)
+
+    # A rejected row's messages also name the values it lost
+    errors = _row_messages(pd.concat([dropped, invalid], axis=1), rejected)
+    warnings = _row_messages(dropped, dropped.any(axis=1) & ~rejected)
+    return fields, rejected, errors, warnings
+
+
+def build_lead_records(fields: Dict[str, pd.Series], rejected: pd.Series,
+                       base_fields: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Scatter cleaned field columns into one lead record per accepted row"""
+    # A datetime, not a string: COPY sends it in binary to timestamptz
+    created_at = datetime.now(timezone.utc)
+    records = {
+        index: {**base_fields, 'created_at': created_at}
+        for index in rejected.index[~rejected.to_numpy()]
+    }
+
+    for crm_field, values in fields.items():
+        # Through numpy: ArrowDtype's tolist() boxes cell by cell
+        for index, value in zip(values.index, values.to_numpy(dtype=object).tolist()):
+            record = records.get(index)
+            if record is not None:
+                record[crm_field] = value
+
+    return list(records.values())
@@ -0,0 +1,169 @@
+"""
+CSV processing for the AI agents service
+Parsing and row transforms are CPU-bound, so they run in a bounded process pool
+instead of on the event loop that drives the AI agents
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+from cleaning import build_lead_records, clean_frame
+
+logger = logging.getLogger(__name__)
+
+# Worker processes for CSV parsing; each import or preview occupies one
+CSV_PROCESS_WORKERS = int(os.getenv("CSV_PROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))
+PREVIEW_ROWS = 5
+# Rows parsed and cleaned at a time inside a worker
+CSV_CHUNK_ROWS = int(os.getenv("CSV_CHUNK_ROWS", "50000"))
+# CSV parser: "c" (pandas' default) or "pyarrow", which parses on several
+# threads into Arrow-backed string columns
+C_ENGINE = "c"
+PYARROW_ENGINE = "pyarrow"
+CSV_PARSER_ENGINE = os.getenv("CSV_PARSER_ENGINE", C_ENGINE)
+
+
+class CsvProcessPool:
+    """Bounded process pool for CSV work, started and stopped with the app"""
+
+    def __init__(self, max_workers: int = CSV_PROCESS_WORKERS):
+        self.max_workers = max_workers
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+    def start(self):
+        if self.executor is None:
+            # Spawn rather than fork: the parent runs an event loop, an asyncpg
+            # pool and the agent coroutines, none of which survive a fork
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+            logger.info(f"CSV process pool started with {self.max_workers} workers")
+
+    def stop(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+            logger.info("CSV process pool stopped")
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Run a picklable function in a worker process without blocking the loop"""
+        self.start()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+
+
+def save_upload(source) -> str:
+    """Copy an upload to a temporary file so workers read it by path instead
+    of receiving the whole file through a pipe"""
+    source.seek(0)
+    with tempfile.NamedTemporaryFile(prefix="ai-csv-", suffix=".csv", delete=False) as target:
+        shutil.copyfileobj(source, target, 1024 * 1024)
+    return target.name
+
+
+def preview_csv_file(path: str, rows: int = PREVIEW_ROWS) -> Dict[str, Any]:
+    """Headers, first rows and row count of a CSV file (runs in a worker)"""
+    if CSV_PARSER_ENGINE == PYARROW_ENGINE:
+        df = pd.read_csv(path, engine="pyarrow", dtype_backend="pyarrow")
+    else:
+        df = pd.read_csv(path)
+    headers = df.columns.tolist()
+
+    return {
+        "headers": headers,
+        # Object first: Arrow-typed numeric columns cannot be filled with ''
+        "preview": df.head(rows).astype(object).fillna('').to_dict('records'),
+        "total_rows": len(df),
+        "total_columns": len(headers)
+    }
+
+
+def missing_columns(path: str, field_mapping: Dict[str, str]) -> List[str]:
+    """Mapped CSV columns absent from the file's header, in mapping order"""
+    headers = set(pd.read_csv(path, nrows=0).columns)
+    return [column for column in field_mapping if column not in headers]
+
+
+def _iter_arrow_chunks(path: str, headers: List[str], usecols: List[str]) -> Iterator[pd.DataFrame]:
+    """Parse a CSV with pyarrow into Arrow string columns, CSV_CHUNK_ROWS rows at a time
+
+    pyarrow.csv is used directly: pandas' pyarrow engine infers types before
+    applying dtype=str, which would strip leading zeros from phone numbers.
+    Header names come from pandas so duplicate columns keep their .1 suffixes.
+    """
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+
+    table = pa_csv.read_csv(
+        path,
+        read_options=pa_csv.ReadOptions(column_names=headers, skip_rows=1),
+        parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=usecols,
+            column_types={column: pa.string() for column in usecols},
+            strings_can_be_null=True
+        )
+    )
+    for start in range(0, table.num_rows, CSV_CHUNK_ROWS):
+        chunk = table.slice(start, CSV_CHUNK_ROWS).to_pandas(types_mapper=pd.ArrowDtype)
+        chunk.index = pd.RangeIndex(start, start + len(chunk))
+        yield chunk
+
+
+def transform_csv_batches(path: str, field_mapping: Dict[str, str], base_fields: Dict[str, Any]
+                          ) -> Tuple[List[Tuple[int, List[Dict[str, Any]]]], List[str], List[str]]:
+    """Parse a CSV file and map its rows to leads, one batch per chunk (runs in a worker)
+
+    Chunks are cleaned column by column; returns (rows read through, lead
+    records) per chunk, "Row N:" messages for rejected rows and "Row N:"
+    warnings for rows imported without an invalid value.
+    """
+    headers = pd.read_csv(path, nrows=0).columns.tolist()
+    usecols = [column for column in headers if column in field_mapping]
+    if not usecols:
+        # Nothing to map; pyarrow would read every column for an empty selection
+        return [], [], []
+
+    if CSV_PARSER_ENGINE == PYARROW_ENGINE:
+        chunks = _iter_arrow_chunks(path, headers, usecols)
+    else:
+        # Mapped cells are cleaned as text, so skip type inference; the chunk
+        # index keeps counting across chunks, which keeps the row numbers right
+        chunks = pd.read_csv(path, usecols=usecols, dtype=str, chunksize=CSV_CHUNK_ROWS)
+
+    batches = []
+    errors = []
+    warnings = []
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        fields, rejected, chunk_errors, chunk_warnings = clean_frame(chunk, field_mapping)
+        batches.append((int(chunk.index[-1]) + 1, build_lead_records(fields, rejected, base_fields)))
+        errors.extend(chunk_errors)
+        warnings.extend(chunk_warnings)
+
+    return batches, errors, warnings
+
+
+def transform_csv_file(path: str, field_mapping: Dict[str, str],
+                       base_fields: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], List[str], List[str]]:
+    """Parse a CSV file and map its rows to leads (runs in a worker)
+
+    Returns the lead records, "Row N:" messages for rejected rows and
+    "Row N:" warnings for rows imported without an invalid value.
+    """
+    batches, errors, warnings = transform_csv_batches(path, field_mapping, base_fields)
+    return [lead for _, leads in batches for lead in leads], errors, warnings
+
+
+# Global CSV process pool instance
+csv_pool = CsvProcessPool()
@@ -3,15 +3,20 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import os
 import asyncio
-import asyncpg
+import contextlib
 import logging
 from datetime import datetime
 from typing import Optional, Dict, Any, List
 import json
-import pandas as pd
-from io import StringIO
 from ai_endpoints import ai_router
 from ai_service import orchestrator
+from checkpoints import COMPLETED, FAILED, CheckpointConflict, CheckpointStore
+from csv_processing import (
+    csv_pool, missing_columns, preview_csv_file, save_upload, transform_csv_batches, transform_csv_file
+)
+from database import DatabasePool
+from reference_data import fetch_table_from_pool, reference_cache
+from task_results import PERSIST_TASK_RESULTS, task_results
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -55,11 +60,17 @@ app.add_middleware(
 # Include AI orchestration router
 app.include_router(ai_router)
 
-# Database connection pool
-db_pool: Optional[asyncpg.Pool] = None
+# Database connection pool; this service defaults to 10 connections where the
+# shared pool module defaults to 5
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+db_pool: Optional[DatabasePool] = None
+
+async def get_db_pool() -> DatabasePool:
+    """Get database connection pool
 
-async def get_db_pool():
-    """Get database connection pool"""
+    Sized by DB_POOL_MIN_SIZE / DB_POOL_MAX_SIZE (defaults 1 / 10 here); see
+    database.py for the acquire timeout and connection lifetime settings.
+    """
     global db_pool
     if db_pool is None:
         database_url = os.getenv("DATABASE_URL")
@@ -67,7 +78,9 @@ async def get_db_pool():
             raise HTTPException(status_code=500, detail="Database URL not configured")
         
         try:
-            db_pool = await asyncpg.create_pool(database_url, min_size=1, max_size=5)
+            pool = DatabasePool("ai-agents", database_url, max_size=DB_POOL_MAX_SIZE)
+            await pool.open()
+            db_pool = pool
             logger.info("AI Agents database connection pool created")
         except Exception as e:
             logger.error(f"Failed to create database pool: {e}")
@@ -75,24 +88,40 @@ async def get_db_pool():
     
     return db_pool
 
+# Checkpoints of imports sent with an import_id (needs the import_jobs table,
+# supabase/migrations/20261018000003_import_jobs.sql)
+checkpoint_store = CheckpointStore("ai-agents")
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize database connection and AI orchestration on startup"""
-    await get_db_pool()
+    pool = await get_db_pool()
+    await reference_cache.start(
+        lambda table: fetch_table_from_pool(pool, table), listen_dsn=os.getenv("DATABASE_URL")
+    )
+    await checkpoint_store.start(pool)
+    task_results.start(pool if PERSIST_TASK_RESULTS else None)
+    csv_pool.start()
     await orchestrator.start()
     logger.info("AI Agents service with coroutine-based orchestration started successfully")
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    """Close database connections and stop AI orchestration on shutdown"""
+    """Stop AI orchestration and close database connections on shutdown"""
     global db_pool
+    # Agents drain first: tasks finishing meanwhile still persist their results
+    await orchestrator.stop()
+    logger.info("AI orchestration layer stopped")
+
+    csv_pool.stop()
+
+    await task_results.stop()
+    await checkpoint_store.stop()
+    await reference_cache.stop()
     if db_pool:
         await db_pool.close()
         logger.info("AI Agents database connections closed")
 
-    await orchestrator.stop()
-    logger.info("AI orchestration layer stopped")
-
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -142,32 +171,27 @@ async def health():
         "service": "ai-agents",
         "environment": os.getenv("ENVIRONMENT", "production"),
         "database": db_status,
+        "database_pool": db_pool.stats() if db_pool else {"status": "closed"},
+        "reference_data": reference_cache.stats(),
         "pgvector": vector_status,
         "timestamp": datetime.utcnow().isoformat()
     }
 
 @app.post("/ai/csv/preview")
 async def preview_csv(file: UploadFile = File(...)):
-    """Preview CSV file structure and return headers + sample rows"""
-    try:
-        # Read CSV content
-        content = await file.read()
-        csv_string = content.decode('utf-8')
+    """Preview CSV file structure and return headers + sample rows
 
-        # Use pandas for robust CSV parsing
-        df = pd.read_csv(StringIO(csv_string))
-
-        # Get headers
-        headers = df.columns.tolist()
-
-        # Get first 5 rows as preview
-        preview_data = df.head(5).fillna('').to_dict('records')
+    Parsing runs in the CSV process pool so the agents keep running.
+    """
+    try:
+        upload_path = await asyncio.to_thread(save_upload, file.file)
+        try:
+            preview = await csv_pool.run(preview_csv_file, upload_path)
+        finally:
+            os.unlink(upload_path)
 
         return {
-            "headers": headers,
-            "preview": preview_data,
-            "total_rows": len(df),
-            "total_columns": len(headers),
+            **preview,
             "file_name": file.filename,
             "timestamp": datetime.utcnow().isoformat()
         }
@@ -182,139 +206,196 @@ async def import_leads(
     pipeline_id: str = Form(...),
     lead_source: str = Form(...),
     import_file_name: str = Form(...),
-    column_mappings: str = Form(...)
+    column_mappings: str = Form(...),
+    import_id: Optional[str] = Form(None)
 ):
-    """Import leads from CSV file with AI-powered data processing"""
+    """Import leads from CSV file with AI-powered data processing
+
+    Parsing and row transforms run in the CSV process pool; the event loop
+    only waits for the result and streams it into the database.
+
+    Without ``import_id`` all leads are inserted in one transaction. With it,
+    each chunk commits together with a checkpoint, and posting the same file
+    with the same ``import_id`` after a failure resumes after the last
+    committed chunk.
+    """
     try:
         # Parse column mappings
         mappings = json.loads(column_mappings)
-        
-        # Read CSV with pandas
-        content = await file.read()
-        csv_string = content.decode('utf-8')
-        df = pd.read_csv(StringIO(csv_string))
 
-        # Process data with AI enhancements
         pool = await get_db_pool()
-        async with pool.acquire() as conn:
-            # Get pipeline defaults
-            default_status = await conn.fetchval("""
-                SELECT id FROM pipeline_statuses 
-                WHERE pipeline_id = $1 
-                ORDER BY display_order 
-                LIMIT 1
-            """, pipeline_id)
-            
-            if not default_status:
-                raise HTTPException(status_code=400, detail="No pipeline statuses found")
 
-            # Create field mapping dictionary
-            field_mapping = {}
-            for mapping in mappings:
-                if mapping['crmField'] and mapping['crmField'] != 'skip':
-                    field_mapping[mapping['csvColumn']] = mapping['crmField']
+        # Get pipeline defaults, looking them up directly for pipelines the
+        # reference data cache does not know yet
+        default_status = await reference_cache.pipeline_default_status(pipeline_id)
+        if default_status is None:
+            async with pool.acquire() as conn:
+                default_status = await conn.fetchval_statement('pipeline_default_status', pipeline_id)
+            if default_status:
+                reference_cache.invalidate('pipeline_statuses')
+
+        if not default_status:
+            raise HTTPException(status_code=400, detail="No pipeline statuses found")
+
+        # Create field mapping dictionary
+        field_mapping = {}
+        for mapping in mappings:
+            if mapping['crmField'] and mapping['crmField'] != 'skip':
+                field_mapping[mapping['csvColumn']] = mapping['crmField']
+
+        base_fields = {
+            'pipeline_id': pipeline_id,
+            'status_id': default_status,
+            'source': lead_source.strip(),
+            'import_file_name': import_file_name.strip()
+        }
 
-            # Process data efficiently
-            leads_data = []
-            errors = []
+        # Process data with AI enhancements in a worker process
+        upload_path = await asyncio.to_thread(save_upload, file.file)
+        try:
+            # Absent optional columns are skipped; with none present no row can map
+            missing = await asyncio.to_thread(missing_columns, upload_path, field_mapping)
+            if missing and len(missing) == len(field_mapping):
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"None of the mapped columns are in the CSV header: {', '.join(missing)}"
+                )
+
+            if import_id:
+                return await import_leads_resumable(
+                    pool, import_id, upload_path, import_file_name.strip() or file.filename,
+                    field_mapping, base_fields
+                )
+
+            leads_data, errors, warnings = await csv_pool.run(
+                transform_csv_file, upload_path, field_mapping, base_fields
+            )
+        finally:
+            os.unlink(upload_path)
+
+        if not leads_data:
+            return {"success": False, "error": "No valid leads found", "errors": errors,
+                    "warnings": warnings or None}
+
+        # Batch insert to database
+        async with pool.acquire() as conn:
+            result = await batch_insert_leads(leads_data, conn)
 
-            for index, row in df.iterrows():
-                try:
-                    lead_data = await process_row_with_ai(
-                        row, field_mapping, pipeline_id,
-                        default_status, lead_source, import_file_name
-                    )
+        return {
+            "success": True,
+            "imported_count": result["count"],
+            "errors": errors if errors else None,
+            "warnings": warnings or None,
+            "processing_time": result.get("processing_time"),
+            "ai_enhancements": result.get("ai_enhancements", 0)
+        }
 
-                    if lead_data:
-                        leads_data.append(lead_data)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"CSV import failed: {e}")
+        raise HTTPException(status_code=500, detail=f"Import failed: {str(e)}")
 
-                except Exception as e:
-                    errors.append(f"Row {index + 2}: {str(e)}")
+async def import_leads_resumable(pool, import_id: str, upload_path: str, file_name: str,
+                                 field_mapping: Dict[str, str], base_fields: Dict[str, Any]) -> Dict:
+    """Insert an upload chunk by chunk, each chunk committing with its checkpoint
 
-            if not leads_data:
-                return {"success": False, "error": "No valid leads found", "errors": errors}
+    A resumed import keeps the mapping and defaults it was started with, and
+    skips the chunks an earlier attempt committed. Rows are cleaned again, so
+    errors and warnings cover the whole file.
+    """
+    if not checkpoint_store.enabled:
+        raise HTTPException(status_code=400, detail="Resumable imports need the import_jobs table")
 
-            # Batch insert to database
-            result = await batch_insert_leads(leads_data, conn)
+    try:
+        checkpoint = await checkpoint_store.begin(
+            import_id, upload_path, file_name,
+            {'field_mapping': field_mapping, 'base_fields': base_fields}
+        )
+    except (CheckpointConflict, ValueError) as e:
+        raise HTTPException(status_code=409, detail=str(e))
 
-            return {
-                "success": True,
-                "imported_count": result["count"],
-                "errors": errors if errors else None,
-                "processing_time": result.get("processing_time"),
-                "ai_enhancements": result.get("ai_enhancements", 0)
-            }
+    if checkpoint.status == COMPLETED:
+        return {"success": True, "import_id": import_id, "imported_count": checkpoint.counters.get('imported', 0),
+                "errors": None, "warnings": None, "already_completed": True}
 
-    except Exception as e:
-        logger.error(f"CSV import failed: {e}")
-        raise HTTPException(status_code=500, detail=f"Import failed: {str(e)}")
+    try:
+        batches, errors, warnings = await csv_pool.run(
+            transform_csv_batches, upload_path,
+            checkpoint.options['field_mapping'], checkpoint.options['base_fields']
+        )
+        if not any(leads for _, leads in batches):
+            await checkpoint_store.finish(checkpoint, FAILED, "No valid leads found")
+            return {"success": False, "error": "No valid leads found", "errors": errors,
+                    "warnings": warnings or None}
+
+        resumed_rows = checkpoint.rows_committed
+        imported = checkpoint.counters.get('imported', 0)
+        processing_time = 0.0
+        for rows_through, leads_data in batches:
+            if rows_through <= resumed_rows or not leads_data:
+                continue
+
+            async def on_commit(conn, inserted, rows_committed=rows_through):
+                await checkpoint.advance(conn, rows_committed, {'imported': imported + inserted})
+
+            async with pool.acquire() as conn:
+                result = await batch_insert_leads(leads_data, conn, on_commit)
+            imported += result["count"]
+            processing_time += result["processing_time"]
+
+        await checkpoint_store.finish(checkpoint, COMPLETED)
+    except CheckpointConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except BaseException as e:
+        # Keeps the checkpoint; posting the file again resumes from it
+        with contextlib.suppress(Exception):
+            await checkpoint_store.finish(checkpoint, FAILED, str(e) or type(e).__name__)
+        raise
 
-async def process_row_with_ai(row: pd.Series, field_mapping: Dict, pipeline_id: str,
-                             status_id: str, source: str, import_file_name: str) -> Dict[str, Any]:
-    """Process a single row with AI enhancements"""
-    
-    lead_data = {
-        'pipeline_id': pipeline_id,
-        'status_id': status_id,
-        'source': source.strip(),
-        'import_file_name': import_file_name.strip(),
-        'created_at': datetime.utcnow().isoformat()
+    return {
+        "success": True,
+        "import_id": import_id,
+        "imported_count": imported,
+        "resumed_rows": resumed_rows,
+        "errors": errors if errors else None,
+        "warnings": warnings or None,
+        "processing_time": round(processing_time, 2),
+        "ai_enhancements": imported
     }
 
-    # Map CSV columns to CRM fields
-    for csv_col, crm_field in field_mapping.items():
-        if csv_col in row and pd.notna(row[csv_col]):
-            value = str(row[csv_col]).strip()
-            if value:
-                # AI enhancement: Clean and standardize data
-                if crm_field in ['email']:
-                    value = value.lower()
-                elif crm_field in ['phone']:
-                    # Basic phone number cleaning
-                    value = ''.join(filter(str.isdigit, value))
-                elif crm_field in ['first_name', 'last_name']:
-                    value = value.title()
-                
-                lead_data[crm_field] = value
-
-    return lead_data
-
-async def batch_insert_leads(leads_data: List[Dict], conn) -> Dict:
-    """Batch insert leads with performance optimization"""
+async def batch_insert_leads(leads_data: List[Dict], conn, on_commit=None) -> Dict:
+    """Bulk insert leads with COPY inside a single transaction
+
+    Rows map different fields, so they are grouped by column set and each
+    group is streamed with one COPY instead of one round-trip per row.
+    ``on_commit(conn, inserted)`` is awaited inside the transaction, after
+    the COPYs.
+    """
     import time
     start_time = time.time()
 
-    # Insert in batches of 50 for optimal performance
-    batch_size = 50
-    total_inserted = 0
-    ai_enhancements = 0
+    groups: Dict[tuple, List[tuple]] = {}
+    for lead in leads_data:
+        groups.setdefault(tuple(lead.keys()), []).append(tuple(lead.values()))
 
-    for i in range(0, len(leads_data), batch_size):
-        batch = leads_data[i:i + batch_size]
-        
-        # Prepare batch insert query
-        columns = list(batch[0].keys())
-        placeholders = ', '.join([f'${j+1}' for j in range(len(columns))])
-        query = f"""
-            INSERT INTO leads_contact_info ({', '.join(columns)})
-            VALUES ({placeholders})
-            RETURNING id
-        """
-        
-        # Execute batch insert
-        for lead in batch:
-            values = [lead.get(col) for col in columns]
-            result = await conn.fetchval(query, *values)
-            if result:
-                total_inserted += 1
-                ai_enhancements += 1  # Count AI processing
+    total_inserted = 0
+    async with conn.transaction():
+        for columns, records in groups.items():
+            # asyncpg returns the command tag, e.g. "COPY 5000"
+            status = await conn.copy_records_to_table(
+                'leads_contact_info', records=records, columns=list(columns)
+            )
+            total_inserted += int(status.split()[-1])
+        if on_commit is not None:
+            await on_commit(conn, total_inserted)
 
     processing_time = time.time() - start_time
 
     return {
         "count": total_inserted,
         "processing_time": round(processing_time, 2),
-        "ai_enhancements": ai_enhancements
+        "ai_enhancements": total_inserted
     }
 
 @app.get("/ai/memory/test")
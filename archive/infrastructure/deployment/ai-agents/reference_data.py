@@ -0,0 +1,204 @@
+# Shared by the csv import and ai-agents services. The source of truth is
+# archive/infrastructure/deployment/shared/; each service keeps a vendored copy
+# refreshed by shared/sync.py, so edit the shared file, not a copy
+"""
+Reference data cache
+Small, rarely changing lookup tables (pipelines, pipeline and lead statuses,
+insurance types) held in memory with a TTL, warmed at startup and invalidated
+through Postgres LISTEN/NOTIFY
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on staleness when a change notification is missed
+REFERENCE_CACHE_TTL = float(os.getenv("REFERENCE_CACHE_TTL", "300"))
+
+# Channel the triggers of supabase/migrations/20261018000002_reference_data_notify.sql
+# notify on, with the changed table's name as payload
+REFERENCE_NOTIFY_CHANNEL = 'reference_data_changed'
+
+REFERENCE_TABLES = ('pipelines', 'pipeline_statuses', 'lead_statuses', 'insurance_types')
+
+REFERENCE_QUERIES = {
+    'pipelines': "SELECT * FROM pipelines ORDER BY id",
+    'pipeline_statuses': "SELECT * FROM pipeline_statuses ORDER BY pipeline_id, display_order",
+    'lead_statuses': "SELECT * FROM lead_statuses ORDER BY display_order",
+    'insurance_types': "SELECT * FROM insurance_types ORDER BY id",
+}
+
+# Seconds between reconnect attempts of the notification listener, doubling up to the max
+LISTEN_RETRY_DELAY = 1.0
+LISTEN_MAX_RETRY_DELAY = 60.0
+
+FetchTable = Callable[[str], Awaitable[List[Dict[str, Any]]]]
+
+
+async def fetch_table_from_pool(pool, table: str) -> List[Dict[str, Any]]:
+    """Load a whole reference table over a connection pool"""
+    async with pool.acquire() as conn:
+        return [dict(row) for row in await conn.fetch(REFERENCE_QUERIES[table])]
+
+
+class CachedTable:
+    """Rows of one reference table and when they were loaded"""
+
+    def __init__(self):
+        self.rows: Optional[List[Dict[str, Any]]] = None
+        self.loaded_at = 0.0
+        self.stale = True
+        self.lock = asyncio.Lock()
+
+
+class ReferenceCache:
+    """In-memory copy of the reference tables
+
+    Tables are reloaded on first use after the TTL expires or a change
+    notification arrives. If a reload fails, the previous rows keep being
+    served until one succeeds.
+    """
+
+    def __init__(self, ttl: float = REFERENCE_CACHE_TTL):
+        self.ttl = ttl
+        self.tables = {table: CachedTable() for table in REFERENCE_TABLES}
+        self.fetch_table: Optional[FetchTable] = None
+        self.listen_dsn: Optional[str] = None
+        self.listener_task: Optional[asyncio.Task] = None
+        self.listening = False
+        self.hits = 0
+        self.loads = 0
+
+    async def start(self, fetch_table: FetchTable, listen_dsn: Optional[str] = None):
+        """Warm every table and, given a DSN, start listening for changes"""
+        self.fetch_table = fetch_table
+        self.listen_dsn = listen_dsn
+        await asyncio.gather(*(self.rows(table) for table in REFERENCE_TABLES))
+        if listen_dsn and self.listener_task is None:
+            self.listener_task = asyncio.create_task(self._listen())
+        logger.info("Reference data cache warmed")
+
+    async def stop(self):
+        if self.listener_task is not None:
+            self.listener_task.cancel()
+            try:
+                await self.listener_task
+            except asyncio.CancelledError:
+                pass
+            self.listener_task = None
+
+    def invalidate(self, table: Optional[str] = None):
+        """Mark one table (or all) for reload on next use"""
+        for name in ([table] if table else REFERENCE_TABLES):
+            if name in self.tables:
+                self.tables[name].stale = True
+
+    def _is_fresh(self, cached: CachedTable) -> bool:
+        return cached.rows is not None and not cached.stale \
+            and time.monotonic() - cached.loaded_at < self.ttl
+
+    async def rows(self, table: str) -> List[Dict[str, Any]]:
+        """Rows of a reference table, reloading it if stale"""
+        cached = self.tables[table]
+        if self._is_fresh(cached):
+            self.hits += 1
+            return cached.rows
+
+        async with cached.lock:
+            # Another caller may have reloaded it while this one waited
+            if self._is_fresh(cached):
+                self.hits += 1
+                return cached.rows
+
+            # Cleared before loading so a notification during the load is not lost
+            cached.stale = False
+            try:
+                rows = await self.fetch_table(table)
+            except Exception as e:
+                cached.stale = True
+                if cached.rows is None:
+                    logger.warning(f"Could not load reference table {table}: {e}")
+                    return []
+                logger.warning(f"Could not reload reference table {table}, serving cached rows: {e}")
+                return cached.rows
+
+            cached.rows = rows
+            cached.loaded_at = time.monotonic()
+            self.loads += 1
+            return rows
+
+    async def pipeline_default_status(self, pipeline_id: Any) -> Optional[Any]:
+        """First status of a pipeline by display order, or None if not cached"""
+        for row in await self.rows('pipeline_statuses'):
+            if str(row.get('pipeline_id')) == str(pipeline_id):
+                return row['id']
+        return None
+
+    async def insurance_type_id(self, name: str) -> Optional[Any]:
+        for row in await self.rows('insurance_types'):
+            if row.get('name') == name:
+                return row['id']
+        return None
+
+    def _on_notification(self, connection, pid: int, channel: str, payload: str):
+        self.invalidate(payload if payload in self.tables else None)
+
+    async def _listen(self):
+        """Hold a dedicated LISTEN connection, reconnecting with backoff
+
+        LISTEN is per session, so it cannot use a pooled connection (pools
+        reset sessions with UNLISTEN on release).
+        """
+        delay = LISTEN_RETRY_DELAY
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(self.listen_dsn)
+                lost = asyncio.Event()
+                conn.add_termination_listener(lambda _: lost.set())
+                await conn.add_listener(REFERENCE_NOTIFY_CHANNEL, self._on_notification)
+                self.listening = True
+                # Changes made while nobody was listening were missed
+                self.invalidate()
+                delay = LISTEN_RETRY_DELAY
+                await lost.wait()
+                logger.warning("Reference data listener connection lost")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Reference data listener failed: {e}")
+            finally:
+                self.listening = False
+                if conn is not None and not conn.is_closed():
+                    await conn.close()
+
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, LISTEN_MAX_RETRY_DELAY)
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache state for /health"""
+        now = time.monotonic()
+        return {
+            "listening": self.listening,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "loads": self.loads,
+            "tables": {
+                name: {
+                    "rows": len(cached.rows) if cached.rows is not None else None,
+                    "age_seconds": round(now - cached.loaded_at, 1) if cached.rows is not None else None,
+                    "stale": not self._is_fresh(cached)
+                }
+                for name, cached in self.tables.items()
+            }
+        }
+
+
+# Global reference data cache instance
+reference_cache = ReferenceCache()
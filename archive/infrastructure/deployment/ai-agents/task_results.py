@@ -0,0 +1,330 @@
+"""
+Task results
+Outcomes of orchestrator tasks kept in memory (LRU with a TTL) and optionally
+persisted to ai_interactions, with futures for in-process callers and change
+notifications for long-polling and streaming clients
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from enum import Enum
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Finished results are kept this many seconds after they finish
+TASK_RESULT_TTL = float(os.getenv("TASK_RESULT_TTL", "3600"))
+# Finished results kept at most; the least recently read are evicted first
+TASK_RESULT_MAX_ENTRIES = int(os.getenv("TASK_RESULT_MAX_ENTRIES", "10000"))
+# Also write every finished task to ai_interactions, where results outlive
+# the TTL and restarts
+PERSIST_TASK_RESULTS = os.getenv("PERSIST_TASK_RESULTS", "false").lower() == "true"
+
+# Seconds between sweeps for expired results while under max_entries
+EXPIRY_SWEEP_INTERVAL = 60.0
+
+# ai_interactions.type of each agent type's results
+INTERACTION_TYPES = {
+    'lead_analysis': 'Analysis',
+    'follow_up': 'Follow-Up',
+}
+
+
+class TaskStatus(Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class TaskFailed(Exception):
+    """Raised to in-process callers awaiting a task that failed"""
+
+
+class TaskRecord:
+    """Lifecycle and outcome of one orchestrator task"""
+
+    def __init__(self, task_id: str, agent_type: str, created_at: Optional[datetime] = None,
+                 scheduled_for: Optional[datetime] = None, priority: Optional[int] = None):
+        self.task_id = task_id
+        self.agent_type = agent_type
+        self.priority = priority
+        self.retries = 0
+        self.status = TaskStatus.QUEUED
+        self.agent_id: Optional[str] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = created_at or datetime.utcnow()
+        self.scheduled_for = scheduled_for
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.expires_at: Optional[float] = None
+        # Set and replaced on every status change, waking long polls and streams
+        self.changed = asyncio.Event()
+        self._future: Optional[asyncio.Future] = None
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in (TaskStatus.COMPLETED, TaskStatus.FAILED)
+
+    def future(self) -> asyncio.Future:
+        """Future resolved with this record once the task finishes"""
+        if self._future is None:
+            self._future = asyncio.get_running_loop().create_future()
+            if self.is_finished:
+                self._future.set_result(self)
+        return self._future
+
+    def _transition(self, status: TaskStatus):
+        self.status = status
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+        if self.is_finished and self._future is not None and not self._future.done():
+            self._future.set_result(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        duration = None
+        if self.started_at and self.finished_at:
+            duration = round((self.finished_at - self.started_at).total_seconds(), 3)
+        return {
+            "task_id": self.task_id,
+            "agent_type": self.agent_type,
+            "status": self.status.value,
+            "priority": self.priority,
+            "retries": self.retries,
+            "agent_id": self.agent_id,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "scheduled_for": self.scheduled_for.isoformat() if self.scheduled_for else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "duration_seconds": duration
+        }
+
+
+class TaskResultStore:
+    """Records of queued, running and recently finished tasks
+
+    Unfinished tasks are always kept. Finished ones expire after ``ttl``
+    seconds, and beyond ``max_entries`` the least recently read are evicted.
+    With a pool, finished tasks are also written to ai_interactions and
+    looked up there once evicted.
+    """
+
+    def __init__(self, ttl: float = TASK_RESULT_TTL, max_entries: int = TASK_RESULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.records: "OrderedDict[str, TaskRecord]" = OrderedDict()
+        self.next_sweep = 0.0
+        self.pool = None
+        self.persist_tasks = set()
+        self.persisted = 0
+        self.persist_errors = 0
+
+    def start(self, pool=None):
+        """Persist finished tasks over ``pool`` from now on"""
+        self.pool = pool
+
+    async def stop(self):
+        """Wait for pending writes to ai_interactions"""
+        if self.persist_tasks:
+            await asyncio.gather(*self.persist_tasks, return_exceptions=True)
+        self.pool = None
+
+    def register(self, task) -> TaskRecord:
+        """Track a task as soon as it is queued"""
+        record = TaskRecord(task.id, task.agent_type, task.created_at, task.scheduled_for, task.priority)
+        self.records[task.id] = record
+        self._evict()
+        return record
+
+    def _record_for(self, task) -> TaskRecord:
+        # Tasks queued straight onto an agent's queue were never registered
+        return self.records.get(task.id) or self.register(task)
+
+    def start_task(self, task, agent_id: str):
+        record = self._record_for(task)
+        record.agent_id = agent_id
+        record.started_at = datetime.utcnow()
+        record._transition(TaskStatus.RUNNING)
+
+    def requeue(self, task, error: str):
+        """Mark a task queued again after an attempt failed or was interrupted"""
+        record = self._record_for(task)
+        record.error = error
+        record.retries = task.retry_count
+        record.scheduled_for = task.scheduled_for
+        record._transition(TaskStatus.QUEUED)
+
+    def complete(self, task, result: Dict[str, Any]):
+        record = self._record_for(task)
+        record.result = result
+        record.error = None
+        self._finish(record, TaskStatus.COMPLETED)
+
+    def fail(self, task, error: str):
+        record = self._record_for(task)
+        record.error = error
+        self._finish(record, TaskStatus.FAILED)
+
+    def _finish(self, record: TaskRecord, status: TaskStatus):
+        record.finished_at = datetime.utcnow()
+        record.expires_at = time.monotonic() + self.ttl
+        record._transition(status)
+        self.records.move_to_end(record.task_id)
+        self._evict()
+
+        if self.pool is not None:
+            task = asyncio.create_task(self._persist(record))
+            self.persist_tasks.add(task)
+            task.add_done_callback(self.persist_tasks.discard)
+
+    def get(self, task_id: str) -> Optional[TaskRecord]:
+        """Record of a task still in memory"""
+        record = self.records.get(task_id)
+        if record is None:
+            return None
+        if record.expires_at is not None and record.expires_at < time.monotonic():
+            del self.records[task_id]
+            return None
+        self.records.move_to_end(task_id)
+        return record
+
+    async def lookup(self, task_id: str) -> Optional[TaskRecord]:
+        """Record of a task, from ai_interactions once evicted from memory"""
+        record = self.get(task_id)
+        if record is None and self.pool is not None:
+            record = await self._load(task_id)
+        return record
+
+    async def wait(self, task_id: str, timeout: float) -> Optional[TaskRecord]:
+        """Record of a task once it finishes, or as it is after ``timeout`` seconds"""
+        record = await self.lookup(task_id)
+        if record is not None and not record.is_finished:
+            try:
+                await asyncio.wait_for(asyncio.shield(record.future()), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return record
+
+    async def result(self, task_id: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Await a task's result in process; raises TaskFailed if it failed"""
+        record = await self.lookup(task_id)
+        if record is None:
+            raise KeyError(task_id)
+        await asyncio.wait_for(asyncio.shield(record.future()), timeout)
+        if record.status == TaskStatus.FAILED:
+            raise TaskFailed(record.error)
+        return record.result
+
+    def _evict(self):
+        now = time.monotonic()
+        if len(self.records) <= self.max_entries and now < self.next_sweep:
+            return
+
+        self.next_sweep = now + EXPIRY_SWEEP_INTERVAL
+        for task_id in list(self.records):
+            record = self.records[task_id]
+            if record.expires_at is not None and record.expires_at < now:
+                del self.records[task_id]
+
+        # Oldest reads first; tasks still queued or running are never evicted
+        for task_id in list(self.records):
+            if len(self.records) <= self.max_entries:
+                break
+            if self.records[task_id].is_finished:
+                del self.records[task_id]
+
+    async def _persist(self, record: TaskRecord):
+        result = record.result or {}
+        response_time_ms = None
+        if record.started_at and record.finished_at:
+            response_time_ms = int((record.finished_at - record.started_at).total_seconds() * 1000)
+        metadata = {
+            "task_id": record.task_id,
+            "agent_type": record.agent_type,
+            "agent_id": record.agent_id,
+            "priority": record.priority,
+            # Not the lead_id column: orchestrator callers may pass ids of other tables
+            "lead_id": result.get("lead_id")
+        }
+        try:
+            async with self.pool.acquire() as conn:
+                await conn.execute(
+                    """
+                    INSERT INTO ai_interactions (
+                        type, source, model_used, model_provider, response_time_ms,
+                        results, error_message, metadata, created_at, completed_at
+                    ) VALUES ($1, 'Backend Middleware', $2, 'DeepInfra', $3, $4::jsonb, $5, $6::jsonb, $7, $8)
+                    """,
+                    INTERACTION_TYPES.get(record.agent_type), result.get("model_used"), response_time_ms,
+                    json.dumps(result), record.error, json.dumps(metadata),
+                    _as_utc(record.created_at), _as_utc(record.finished_at)
+                )
+            self.persisted += 1
+        except Exception as e:
+            self.persist_errors += 1
+            logger.warning(f"Could not persist result of task {record.task_id}: {e}")
+
+    async def _load(self, task_id: str) -> Optional[TaskRecord]:
+        try:
+            async with self.pool.acquire() as conn:
+                row = await conn.fetchrow(
+                    """
+                    SELECT results, error_message, metadata, created_at, completed_at
+                    FROM ai_interactions
+                    WHERE metadata->>'task_id' = $1
+                    ORDER BY created_at DESC
+                    LIMIT 1
+                    """,
+                    task_id
+                )
+        except Exception as e:
+            logger.warning(f"Could not look up task {task_id}: {e}")
+            return None
+        if row is None:
+            return None
+
+        metadata = json.loads(row['metadata'])
+        record = TaskRecord(task_id, metadata.get('agent_type'), _naive_utc(row['created_at']),
+                            priority=metadata.get('priority'))
+        record.agent_id = metadata.get('agent_id')
+        record.error = row['error_message']
+        record.result = json.loads(row['results']) if row['results'] and not record.error else None
+        record.finished_at = _naive_utc(row['completed_at'])
+        record.status = TaskStatus.FAILED if record.error else TaskStatus.COMPLETED
+        return record
+
+    def stats(self) -> Dict[str, Any]:
+        """Store size and persistence counts for metrics"""
+        counts = {status.value: 0 for status in TaskStatus}
+        for record in self.records.values():
+            counts[record.status.value] += 1
+        return {
+            "entries": len(self.records),
+            "by_status": counts,
+            "ttl_seconds": self.ttl,
+            "max_entries": self.max_entries,
+            "persisting": self.pool is not None,
+            "persisted": self.persisted,
+            "persist_errors": self.persist_errors
+        }
+
+
+def _as_utc(moment: Optional[datetime]) -> Optional[datetime]:
+    # Records hold naive UTC datetimes like datetime.utcnow(); timestamptz needs aware ones
+    return moment.replace(tzinfo=timezone.utc) if moment and moment.tzinfo is None else moment
+
+
+def _naive_utc(moment: Optional[datetime]) -> Optional[datetime]:
+    return moment.astimezone(timezone.utc).replace(tzinfo=None) if moment else None
+
+
+# Global task result store instance
+task_results = TaskResultStore()
@@ -0,0 +1,42 @@
+"""
+Shared fixtures for the AI agents service tests
+Database tests run against TEST_DATABASE_URL in a scratch schema that is
+dropped afterwards, and are skipped when it is not set
+"""
+
+import asyncio
+import os
+import sys
+import uuid
+
+import pytest
+
+# Service modules are flat and import each other by name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# The agents build their API clients on import of ai_service
+os.environ.setdefault("DEEPINFRA_API_KEY", "test")
+
+
+async def _execute(url: str, sql: str):
+    import asyncpg
+
+    conn = await asyncpg.connect(url)
+    try:
+        await conn.execute(sql)
+    finally:
+        await conn.close()
+
+
+@pytest.fixture
+def database_url():
+    """DSN of a fresh, empty schema on TEST_DATABASE_URL"""
+    url = os.getenv("TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("TEST_DATABASE_URL not set")
+
+    schema = f"ai_test_{uuid.uuid4().hex[:8]}"
+    asyncio.run(_execute(url, f"CREATE SCHEMA {schema}"))
+    # asyncpg passes unknown DSN parameters through as server settings
+    separator = '&' if '?' in url else '?'
+    yield f"{url}{separator}search_path={schema}"
+    asyncio.run(_execute(url, f"DROP SCHEMA {schema} CASCADE"))
@@ -0,0 +1,160 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from ai_service import AgentTask, AgentTaskQueue, LeadAnalysisAgent
+from task_results import TaskStatus, task_results
+
+
+@pytest.fixture
+def batching(monkeypatch):
+    # A window long enough that only an explicit flush sends the batch
+    monkeypatch.setenv("LEAD_ANALYSIS_BATCH_SIZE", "4")
+    monkeypatch.setenv("LEAD_ANALYSIS_BATCH_WINDOW", "30")
+
+
+def lead_tasks(count):
+    return [AgentTask(id=f"lead-{n}", agent_type="lead_analysis", payload={"lead_data": {"id": n}})
+            for n in range(count)]
+
+
+def test_drain_sends_the_pending_batch_at_once(batching):
+    async def scenario():
+        queue = AgentTaskQueue()
+        agent = LeadAnalysisAgent("lead-analysis-test", queue)
+        batches = []
+
+        async def analyze_batch(tasks):
+            batches.append([task.id for task in tasks])
+            return {number: {"quality_score": 50} for number in range(1, len(tasks) + 1)}
+
+        agent._analyze_batch = analyze_batch
+        tasks = lead_tasks(2)
+        for task in tasks:
+            task_results.register(task)
+            queue.put_nowait(task)
+
+        running = asyncio.create_task(agent.start())
+        await asyncio.sleep(0.01)
+        assert len(agent.pending_batch) == 2
+
+        agent.drain()
+        await asyncio.wait_for(running, 1)
+
+        assert batches == [["lead-0", "lead-1"]]
+        assert [task_results.get(task.id).status for task in tasks] == [TaskStatus.COMPLETED] * 2
+        assert not agent.batch_runs
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_agent_cancels_batch_runs_and_requeues(batching):
+    async def scenario():
+        queue = AgentTaskQueue()
+        agent = LeadAnalysisAgent("lead-analysis-test", queue)
+        cancelled = []
+
+        async def analyze_batch(tasks):
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                cancelled.append([task.id for task in tasks])
+                raise
+
+        agent._analyze_batch = analyze_batch
+        tasks = lead_tasks(2)
+        for task in tasks:
+            task_results.register(task)
+            queue.put_nowait(task)
+
+        running = asyncio.create_task(agent.start())
+        await asyncio.sleep(0.01)
+        # Drained with the request still out, then cut off
+        agent.drain()
+        await asyncio.sleep(0.01)
+        assert len(agent.batch_runs) == 1
+
+        running.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await running
+
+        assert cancelled == [["lead-0", "lead-1"]]
+        assert not agent.batch_runs
+        assert queue.qsize() == 2
+        for task in tasks:
+            record = task_results.get(task.id)
+            assert record.status == TaskStatus.QUEUED
+            assert record.error == "Interrupted by agent shutdown"
+
+    asyncio.run(scenario())
+
+
+def queued_task(task_id, priority=5, delay=None):
+    scheduled_for = datetime.utcnow() + timedelta(seconds=delay) if delay is not None else None
+    return AgentTask(id=task_id, agent_type="lead_analysis", payload={}, priority=priority,
+                     scheduled_for=scheduled_for)
+
+
+def test_queue_runs_highest_priority_first_then_oldest():
+    async def scenario():
+        queue = AgentTaskQueue()
+        for task in (queued_task("low", 1), queued_task("normal-1"), queued_task("urgent", 10),
+                     queued_task("normal-2")):
+            queue.put_nowait(task)
+
+        assert queue.stats()["highest_priority"] == 10
+        return [(await queue.get()).id for _ in range(4)]
+
+    assert asyncio.run(scenario()) == ["urgent", "normal-1", "normal-2", "low"]
+
+
+def test_queue_holds_scheduled_tasks_until_due():
+    async def scenario():
+        queue = AgentTaskQueue()
+        queue.put_nowait(queued_task("later", priority=10, delay=0.2))
+        queue.put_nowait(queued_task("now", priority=1))
+        assert queue.stats()["scheduled"] == 1
+
+        first = await queue.get()
+        started = time.monotonic()
+        # Blocks on the queue's timer rather than polling
+        second = await asyncio.wait_for(queue.get(), 1)
+        return first.id, second.id, time.monotonic() - started
+
+    first, second, waited = asyncio.run(scenario())
+    assert (first, second) == ("now", "later")
+    assert 0.1 < waited < 0.5
+
+
+def test_queue_wakes_one_waiting_agent_per_task():
+    async def scenario():
+        queue = AgentTaskQueue()
+        getters = [asyncio.create_task(queue.get()) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert queue.stats()["idle_agents"] == 3
+
+        queue.put_nowait(queued_task("a"))
+        queue.put_nowait(queued_task("b"))
+        done, pending = await asyncio.wait(getters, timeout=0.1)
+        for getter in pending:
+            getter.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        return sorted(getter.result().id for getter in done), len(pending), queue.stats()["idle_agents"]
+
+    assert asyncio.run(scenario()) == (["a", "b"], 1, 0)
+
+
+def test_queue_join_waits_for_task_done():
+    async def scenario():
+        queue = AgentTaskQueue()
+        queue.put_nowait(queued_task("a"))
+        joined = asyncio.create_task(queue.join())
+        await queue.get()
+        await asyncio.sleep(0)
+        assert not joined.done()
+        queue.task_done()
+        await asyncio.wait_for(joined, 1)
+
+    asyncio.run(scenario())
@@ -0,0 +1,88 @@
+import pytest
+
+import csv_processing
+from csv_processing import missing_columns, transform_csv_batches
+
+MAPPING = {'First': 'first_name', 'Last': 'last_name', 'Email': 'email'}
+
+# The mapping LeadImportModal sends for a typical vendor file
+FRONTEND_MAPPING = {'First Name': 'first_name', 'Last Name': 'last_name', 'Email': 'email',
+                    'Phone': 'phone_number'}
+
+
+@pytest.fixture(params=[csv_processing.C_ENGINE, csv_processing.PYARROW_ENGINE])
+def engine(request, monkeypatch):
+    monkeypatch.setattr(csv_processing, 'CSV_PARSER_ENGINE', request.param)
+    return request.param
+
+
+def write_csv(tmp_path, text):
+    path = tmp_path / 'leads.csv'
+    path.write_text(text)
+    return str(path)
+
+
+def test_missing_columns_names_mapped_columns_absent_from_header(tmp_path):
+    # Optional columns may be absent; the import only needs one mapped column
+    path = write_csv(tmp_path, 'First,Phone\nAnn,612\n')
+    assert missing_columns(path, MAPPING) == ['Last', 'Email']
+
+    path = write_csv(tmp_path, 'Phone,Notes\n612,hi\n')
+    assert missing_columns(path, MAPPING) == list(MAPPING)
+
+
+def test_absent_optional_columns_are_skipped(tmp_path, engine):
+    path = write_csv(tmp_path, 'First,Phone\nAnn,612\n')
+
+    batches, errors, warnings = transform_csv_batches(path, MAPPING, {})
+
+    assert [lead['first_name'] for _, leads in batches for lead in leads] == ['Ann']
+    assert (errors, warnings) == ([], [])
+
+
+def test_header_without_mapped_columns_gives_no_batches(tmp_path, engine):
+    path = write_csv(tmp_path, 'Phone,Notes\n612,hi\n')
+    assert transform_csv_batches(path, MAPPING, {}) == ([], [], [])
+
+
+def test_header_only_file_gives_no_batches(tmp_path, engine):
+    path = write_csv(tmp_path, 'First,Last,Email\n')
+    assert transform_csv_batches(path, MAPPING, {}) == ([], [], [])
+
+
+def test_batches_count_rows_read_through_each_chunk(tmp_path, engine, monkeypatch):
+    monkeypatch.setattr(csv_processing, 'CSV_CHUNK_ROWS', 2)
+    path = write_csv(tmp_path, 'First,Last,Email\nAnn,Lee,a@x.com\n,,\nBo,,b@x.com\n')
+
+    batches, errors, warnings = transform_csv_batches(path, MAPPING, {'pipeline_id': 'p1'})
+
+    assert [rows_through for rows_through, _ in batches] == [2, 3]
+    assert [len(leads) for _, leads in batches] == [1, 1]
+    assert errors == ['Row 3: Missing name, email and phone number']
+    assert warnings == []
+
+
+def test_invalid_values_are_dropped_with_a_warning(tmp_path, engine):
+    path = write_csv(tmp_path, 'First,Email,Phone\nAnn,a@x.com,12\n,,99\nBo,not-an-email,(612) 555-0100\n')
+    mapping = {'First': 'first_name', 'Email': 'email', 'Phone': 'phone_number'}
+
+    batches, errors, warnings = transform_csv_batches(path, mapping, {})
+
+    leads = [lead for _, chunk in batches for lead in chunk]
+    assert [(lead.get('first_name'), lead.get('email'), lead.get('phone_number')) for lead in leads] == [
+        ('Ann', 'a@x.com', None), ('Bo', None, '+16125550100')
+    ]
+    assert errors == ['Row 3: Invalid phone number; Missing name, email and phone number']
+    assert warnings == ['Row 2: Invalid phone number', 'Row 4: Invalid email address']
+
+
+def test_frontend_mapping_imports_a_phone_only_row(tmp_path, engine):
+    path = write_csv(tmp_path, 'First Name,Last Name,Email,Phone\n,,,(612) 555-0100\nann,LEE,Ann@X.com,\n')
+
+    batches, errors, warnings = transform_csv_batches(path, FRONTEND_MAPPING, {})
+
+    leads = [lead for _, chunk in batches for lead in chunk]
+    assert [(lead.get('first_name'), lead.get('email'), lead.get('phone_number')) for lead in leads] == [
+        (None, None, '+16125550100'), ('Ann', 'ann@x.com', None)
+    ]
+    assert (errors, warnings) == ([], [])
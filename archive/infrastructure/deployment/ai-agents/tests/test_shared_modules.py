@@ -0,0 +1,15 @@
+from pathlib import Path
+
+import pytest
+
+SERVICE_DIR = Path(__file__).resolve().parents[1]
+SHARED_DIR = SERVICE_DIR.parent / 'shared'
+SHARED_MODULES = sorted(path.name for path in SHARED_DIR.glob('*.py') if path.name != 'sync.py')
+
+
+@pytest.mark.skipif(not SHARED_DIR.is_dir(), reason="shared module source not checked out")
+@pytest.mark.parametrize('module', SHARED_MODULES)
+def test_vendored_copy_is_current(module):
+    assert (SERVICE_DIR / module).read_bytes() == (SHARED_DIR / module).read_bytes(), (
+        f"{module} differs from the shared source; run archive/infrastructure/deployment/shared/sync.py"
+    )
@@ -0,0 +1,73 @@
+import types
+
+import pytest
+
+import task_results as task_results_module
+from ai_service import AgentTask
+from task_results import TaskResultStore, TaskStatus
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(task_results_module, 'time', types.SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def task(task_id):
+    return AgentTask(id=task_id, agent_type="lead_analysis", payload={})
+
+
+def finished(store, task_id):
+    queued = task(task_id)
+    store.register(queued)
+    store.start_task(queued, "agent-1")
+    store.complete(queued, {"task_id": task_id})
+    return queued
+
+
+def test_finished_records_expire_after_ttl(clock):
+    store = TaskResultStore(ttl=60, max_entries=100)
+    finished(store, "done")
+    store.register(task("queued"))
+
+    clock[0] += 59
+    assert store.get("done").status == TaskStatus.COMPLETED
+
+    clock[0] += 2
+    assert store.get("done") is None
+    # Unfinished tasks never expire
+    assert store.get("queued").status == TaskStatus.QUEUED
+
+
+def test_expired_records_are_swept_on_write(clock):
+    store = TaskResultStore(ttl=60, max_entries=100)
+    finished(store, "old")
+
+    clock[0] += task_results_module.EXPIRY_SWEEP_INTERVAL + 61
+    finished(store, "new")
+
+    assert list(store.records) == ["new"]
+
+
+def test_least_recently_read_finished_records_are_evicted_first(clock):
+    store = TaskResultStore(ttl=3600, max_entries=3)
+    for task_id in ("a", "b", "c"):
+        finished(store, task_id)
+    # Reading "a" makes "b" the least recently used
+    assert store.get("a") is not None
+
+    finished(store, "d")
+
+    assert list(store.records) == ["c", "a", "d"]
+
+
+def test_unfinished_records_are_never_evicted(clock):
+    store = TaskResultStore(ttl=3600, max_entries=2)
+    for task_id in ("q1", "q2", "q3"):
+        store.register(task(task_id))
+    finished(store, "done")
+
+    # Over the limit, but only the finished record can go
+    assert list(store.records) == ["q1", "q2", "q3"]
+    assert store.get("done") is None
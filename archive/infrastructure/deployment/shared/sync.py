@@ -0,0 +1,55 @@
+"""
+Shared module sync
+Copies the modules shared by the Python services into each service directory.
+The services are built and deployed as separate images whose Docker build
+context is their own directory, so each keeps a vendored copy; --check reports
+copies that have drifted from the source here instead of overwriting them
+"""
+
+import argparse
+import filecmp
+import shutil
+import sys
+from pathlib import Path
+
+SHARED_DIR = Path(__file__).resolve().parent
+REPO_ROOT = SHARED_DIR.parents[3]
+
+SHARED_MODULES = ('checkpoints.py', 'database.py', 'reference_data.py')
+
+SERVICE_DIRS = (
+    REPO_ROOT / '_archive' / 'python-csv-service',
+    REPO_ROOT / 'archive' / 'infrastructure' / 'deployment' / 'ai-agents',
+)
+
+
+def stale_copies():
+    """Vendored copies that differ from, or are missing next to, the shared source"""
+    return [
+        service / module
+        for service in SERVICE_DIRS
+        for module in SHARED_MODULES
+        if not (service / module).exists()
+        or not filecmp.cmp(SHARED_DIR / module, service / module, shallow=False)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--check', action='store_true',
+                        help='exit non-zero when a vendored copy is out of date')
+    args = parser.parse_args()
+
+    stale = stale_copies()
+    if args.check:
+        for path in stale:
+            print(f"out of date: {path.relative_to(REPO_ROOT)}")
+        sys.exit(1 if stale else 0)
+
+    for path in stale:
+        shutil.copyfile(SHARED_DIR / path.name, path)
+        print(f"updated {path.relative_to(REPO_ROOT)}")
+
+
+if __name__ == '__main__':
+    main()
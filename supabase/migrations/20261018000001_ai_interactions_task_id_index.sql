@@ -0,0 +1,9 @@
+-- Index ai_interactions by orchestrator task id
+-- The ai-agents service writes finished tasks here when PERSIST_TASK_RESULTS
+-- is on, and GET /ai/tasks/{task_id} looks them up by metadata->>'task_id'
+-- once they have left its in-memory store. Not a partial index: the lookup
+-- filters on metadata->>'task_id' alone, from which the planner cannot infer
+-- a "metadata ? 'task_id'" predicate
+
+create index if not exists idx_ai_interactions_task_id
+  on public.ai_interactions ((metadata->>'task_id'));
@@ -0,0 +1,34 @@
+-- Notify services when reference data changes
+-- The CSV import service and the ai-agents service cache the pipelines,
+-- pipeline_statuses, lead_statuses and insurance_types tables in memory
+-- (reference_data.py). These statement-level triggers send the changed
+-- table's name on the reference_data_changed channel so the caches reload it
+-- on next use instead of waiting for REFERENCE_CACHE_TTL
+
+CREATE OR REPLACE FUNCTION notify_reference_data_changed()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM pg_notify('reference_data_changed', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$;
+
+DO $$
+DECLARE
+    reference_table TEXT;
+BEGIN
+    FOREACH reference_table IN ARRAY ARRAY['pipelines', 'pipeline_statuses', 'lead_statuses', 'insurance_types']
+    LOOP
+        IF to_regclass(reference_table) IS NOT NULL THEN
+            EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', reference_table || '_notify_changed', reference_table);
+            EXECUTE format(
+                'CREATE TRIGGER %I AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON %I '
+                'FOR EACH STATEMENT EXECUTE FUNCTION notify_reference_data_changed()',
+                reference_table || '_notify_changed', reference_table
+            );
+        END IF;
+    END LOOP;
+END;
+$$;
@@ -0,0 +1,43 @@
+-- Checkpoints for resumable lead imports
+-- One row per lead import of the CSV import service and the ai-agents service
+-- (checkpoints.py). rows_committed is advanced in the same transaction that
+-- inserts each chunk, so an import cut off by a crash, deploy or timeout
+-- resumes after its last committed chunk. attempt is bumped whenever a worker
+-- claims the import, and a worker only advances the checkpoint of the attempt
+-- it claimed. updated_at is touched by the owning worker's heartbeat; running
+-- imports left untouched for IMPORT_STALE_SECONDS are taken to be abandoned,
+-- and are resumed by a worker on their host
+
+CREATE TABLE IF NOT EXISTS import_jobs (
+    id TEXT PRIMARY KEY,
+    service TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'running'
+        CHECK (status IN ('running', 'interrupted', 'completed', 'failed')),
+    attempt INTEGER NOT NULL DEFAULT 1,
+    -- Host of the worker that last claimed the import (IMPORT_HOST); its
+    -- spooled upload is only readable there unless the spool is shared
+    host TEXT,
+    file_name TEXT,
+    file_sha256 TEXT NOT NULL,
+    -- Spooled upload the import reads from, cleared once it finishes
+    upload_path TEXT,
+    -- Field mapping and import options, so a resumed import maps rows the same way
+    options JSONB NOT NULL DEFAULT '{}'::jsonb,
+    -- Source rows, across every file of the upload, whose leads are committed
+    rows_committed BIGINT NOT NULL DEFAULT 0,
+    -- Import counters as of the checkpoint
+    counters JSONB NOT NULL DEFAULT '{}'::jsonb,
+    error TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    finished_at TIMESTAMPTZ
+);
+
+-- Tables created before host was recorded
+ALTER TABLE import_jobs ADD COLUMN IF NOT EXISTS host TEXT;
+
+COMMENT ON TABLE import_jobs IS 'Lead import checkpoints; see checkpoints.py in the CSV import and ai-agents services';
+
+CREATE INDEX IF NOT EXISTS import_jobs_unfinished_idx
+ON import_jobs (service, updated_at)
+WHERE status IN ('running', 'interrupted');